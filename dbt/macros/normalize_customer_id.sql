@@ -0,0 +1,8 @@
+{# Same rule as customer_dim.normalize_customer_ids: CUST001 / cust-1 / CUST_001 -> CUST_001 #}
+{% macro normalize_customer_id(col) %}
+    case when regexp_matches({{ col }}, '^\s*([A-Za-z]+)[\s_-]*0*(\d+)\s*$')
+         then printf('%s_%03d',
+                     upper(regexp_extract({{ col }}, '^\s*([A-Za-z]+)[\s_-]*0*(\d+)\s*$', 1)),
+                     cast(regexp_extract({{ col }}, '^\s*([A-Za-z]+)[\s_-]*0*(\d+)\s*$', 2) as bigint))
+         else trim({{ col }}) end
+{% endmacro %}
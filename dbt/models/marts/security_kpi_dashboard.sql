@@ -9,7 +9,9 @@ with current_metrics as (
         count(case when incident_timestamp >= current_date - interval '24 hours' then 1 end) as incidents_24h,
         count(case when incident_timestamp >= current_date - interval '7 days' then 1 end) as incidents_7d,
         count(case when incident_timestamp >= current_date - interval '30 days' then 1 end) as incidents_30d,
-        avg(anomaly_score) as avg_anomaly_score
+        avg(anomaly_score) as avg_anomaly_score,
+        -- Mean Time to Detection (simulated)
+        avg(case when alert_triggered then 15 else 45 end) as mttr_minutes
     from {{ ref('stg_security_incidents') }}
 ),
 
@@ -25,9 +27,6 @@ previous_period as (
 
 sla_metrics as (
     select
-        -- Mean Time to Detection (simulated)
-        avg(case when alert_triggered then 15 else 45 end) as mttr_minutes,
-        
         -- Prevention rate
         round((prevented_incidents::float / total_incidents::float) * 100, 2) as prevention_rate,
         
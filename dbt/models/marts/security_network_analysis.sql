@@ -82,6 +82,7 @@ select
     
     round((critical_count::float / total_incidents::float) * 100, 2) as critical_pct,
     round((high_count::float / total_incidents::float) * 100, 2) as high_pct,
+    round((medium_count::float / total_incidents::float) * 100, 2) as medium_pct,
     
     round((total_prevented::float / total_incidents::float) * 100, 2) as prevention_rate_pct,
     round((total_alerts::float / total_incidents::float) * 100, 2) as alert_rate_pct,
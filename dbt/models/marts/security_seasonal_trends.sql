@@ -114,32 +114,37 @@ peak_analysis as (
         (select month_name from monthly_patterns order by total_incidents desc limit 1) as peak_time,
         (select total_incidents from monthly_patterns order by total_incidents desc limit 1) as peak_incidents,
         'Peak attack month' as description
-)
+),
 
 -- Final output combining all patterns
-select
-    'Summary' as analysis_type,
-    json_object(
-        'peak_hour', (select peak_time from peak_analysis where time_dimension = 'Hourly'),
-        'peak_day', (select peak_time from peak_analysis where time_dimension = 'Daily'),
-        'peak_month', (select peak_time from peak_analysis where time_dimension = 'Monthly'),
-        'total_incidents', (select sum(total_incidents) from hourly_patterns),
-        'avg_severity', (select round(avg(avg_hourly_severity), 2) from hourly_patterns)
-    ) as trend_summary,
-    current_timestamp as analysis_timestamp
+trend_rows as (
+    select
+        'Summary' as analysis_type,
+        json_object(
+            'peak_hour', (select peak_time from peak_analysis where time_dimension = 'Hourly'),
+            'peak_day', (select peak_time from peak_analysis where time_dimension = 'Daily'),
+            'peak_month', (select peak_time from peak_analysis where time_dimension = 'Monthly'),
+            'total_incidents', (select sum(total_incidents) from hourly_patterns),
+            'avg_severity', (select round(avg(avg_hourly_severity), 2) from hourly_patterns)
+        ) as trend_summary,
+        current_timestamp as analysis_timestamp
 
-union all
+    union all
+
+    select
+        'Hourly Distribution' as analysis_type,
+        json_object(
+            'hour', hour_of_day,
+            'incidents', total_incidents,
+            'severity', round(avg_hourly_severity, 2),
+            'customers', customers_affected
+        ) as trend_summary,
+        current_timestamp as analysis_timestamp
+    from hourly_patterns
+)
 
-select
-    'Hourly Distribution' as analysis_type,
-    json_object(
-        'hour', hour_of_day,
-        'incidents', total_incidents,
-        'severity', round(avg_hourly_severity, 2),
-        'customers', customers_affected
-    ) as trend_summary,
-    current_timestamp as analysis_timestamp
-from hourly_patterns
+select *
+from trend_rows
 order by 
     case when analysis_type = 'Summary' then 0 else 1 end,
     trend_summary
\ No newline at end of file
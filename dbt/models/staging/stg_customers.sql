@@ -1,5 +1,6 @@
 select
-    customer_id,
+    dim.customer_key,
+    {{ normalize_customer_id('c.customer_id') }} as customer_id,
     customer_name,
     industry,
     company_size,
@@ -7,4 +8,6 @@ select
     contract_end_date::date as contract_end_date,
     monthly_recurring_revenue::decimal(10,2) as mrr,
     account_manager
-from read_csv_auto('../data/raw/customers.csv')
\ No newline at end of file
+from read_csv_auto('../data/raw/customers.csv') c
+left join read_csv_auto('../data/dimensions/customer_dim.csv') dim
+    on dim.customer_id = {{ normalize_customer_id('c.customer_id') }}
\ No newline at end of file
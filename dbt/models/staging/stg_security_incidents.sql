@@ -1,5 +1,6 @@
 select
-    "customer_id",
+    dim.customer_key,
+    {{ normalize_customer_id('src."customer_id"') }} as customer_id,
     "Timestamp"::timestamp as incident_timestamp,
     "Source IP Address" as source_ip,
     "Destination IP Address" as dest_ip,
@@ -71,4 +72,6 @@ select
         else 'Basic'
     end as attack_sophistication
     
-from read_csv_auto('../data/raw/security_incidents.csv')
\ No newline at end of file
+from read_csv_auto('../data/raw/security_incidents.csv') src
+left join read_csv_auto('../data/dimensions/customer_dim.csv') dim
+    on dim.customer_id = {{ normalize_customer_id('src."customer_id"') }}
\ No newline at end of file
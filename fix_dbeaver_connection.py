@@ -3,6 +3,10 @@
 
 import duckdb
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+from db_snapshots import current_snapshot
 
 def fix_dbeaver_connection():
     """Fix DBeaver connection by ensuring proper database structure."""
@@ -42,6 +46,9 @@ def fix_dbeaver_connection():
     print(f"   - Raw DB: {os.path.abspath(raw_db)}")
     print(f"   - dbt DB: {os.path.abspath(dbt_db)}")
     print("4. Use 'main' as the default schema")
+    print("5. To browse while the pipeline is running, connect read-only to the published snapshots:")
+    for db in (raw_db, dbt_db):
+        print(f"   - {current_snapshot(db) or f'{db} (not published yet)'}")
 
 if __name__ == "__main__":
     fix_dbeaver_connection()
\ No newline at end of file
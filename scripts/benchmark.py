@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""Scale-tiered benchmarks of every pipeline stage against JSON baselines.
+
+Each tier gets a deterministic synthetic workload under data/benchmarks/<tier>/
+laid out like the repo (data/raw, data/dimensions, the dbt DuckDB file, models/),
+so stages run with their normal relative paths from that workload's src/ dir.
+Tiers run in their own subprocess so process-wide caches never leak between them.
+A stage that errors fails the run (baselined or not), and baselines are only
+recorded from runs in which every stage completed.
+
+    python scripts/benchmark.py                       # 1k tier, compare to baselines
+    python scripts/benchmark.py --tiers 1k 100k --update-baseline
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import contextlib
+import subprocess
+from datetime import datetime
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+TIERS = {'1k': 1000, '100k': 100000, '1m': 1000000}
+
+# Rows per customer for the proportional tables
+TICKETS_PER_CUSTOMER = 6
+INCIDENTS_PER_CUSTOMER = 5
+USAGE_DAYS_PER_CUSTOMER = 10
+FEEDBACK_PER_CUSTOMER = 2
+
+GENERATOR_VERSION = 1
+WORKLOAD_MAX_AGE_DAYS = 30
+
+BENCH_ROOT = os.path.join(ROOT, 'data', 'benchmarks')
+BASELINE_PATH = os.path.join(ROOT, 'benchmarks', 'baselines.json')
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_MIN_DELTA = 0.02
+
+
+def generate_workload(tier, seed=42):
+    """Write the tier's raw CSVs, customer dimension and dbt-shaped DuckDB file."""
+    import numpy as np
+    import pandas as pd
+    import duckdb
+    from pyarrow import Table, csv
+    from customer_dim import CustomerDimension
+
+    n = TIERS[tier]
+    root = os.path.join(BENCH_ROOT, tier)
+    shutil.rmtree(root, ignore_errors=True)
+    for sub in ('src', 'data/raw', 'data/processed', 'data/dimensions', 'models'):
+        os.makedirs(os.path.join(root, sub), exist_ok=True)
+
+    rng = np.random.default_rng(seed)
+    today = pd.Timestamp.today().normalize()
+    ids = np.array([f"CUST_{i:03d}" for i in range(1, n + 1)], dtype=object)
+    industries = np.array(['Retail', 'IT Services', 'Healthcare', 'Manufacturing', 'Finance'])
+
+    start = today - pd.to_timedelta(rng.integers(100, 900, n), unit='D')
+    customers = pd.DataFrame({
+        'customer_id': ids,
+        'company_name': [f"Company_{i:03d}" for i in range(1, n + 1)],
+        'industry': industries[rng.integers(0, len(industries), n)],
+        'company_size': rng.choice(['Small', 'Medium', 'Enterprise'], n),
+        'monthly_recurring_revenue': rng.integers(1000, 15000, n),
+        'contract_value': rng.integers(5000, 150000, n),
+        'risk_score': rng.choice(['low', 'medium', 'high'], n, p=[0.6, 0.3, 0.1]),
+        'contract_start_date': start.date,
+        'contract_end_date': (start + pd.to_timedelta(rng.integers(300, 1100, n), unit='D')).date,
+        'account_manager': rng.choice(['AM_1', 'AM_2', 'AM_3', 'AM_4'], n),
+    })
+    customers['customer_name'] = customers['company_name']
+
+    m = n * TICKETS_PER_CUSTOMER
+    tickets = pd.DataFrame({
+        'ticket_id': [f"TKT_{i}" for i in range(m)],
+        'customer_id': ids[rng.integers(0, n, m)],
+        'ticket_type': rng.choice(['Customer Generated', 'System Generated'], m),
+        'priority': rng.choice(['Low', 'Medium', 'High'], m),
+        'status': rng.choice(['Open', 'In Progress', 'Resolved', 'Closed'], m),
+        'created_date': (today - pd.to_timedelta(rng.integers(0, 400, m), unit='D')).date,
+        'resolution_time_hours': rng.uniform(1, 72, m).round(1),
+        'satisfaction_score': rng.integers(1, 6, m).astype(float),
+        'escalated': rng.random(m) < 0.2,
+    })
+
+    # One frame satisfies both the transform columns and the dbt staging model's source columns
+    k = n * INCIDENTS_PER_CUSTOMER
+    timestamps = today - pd.to_timedelta(rng.integers(0, 400 * 24, k), unit='h')
+    levels = np.array(['Low', 'Medium', 'High', 'Critical'])
+    severity = rng.choice(4, k, p=[0.4, 0.35, 0.2, 0.05])
+    source_ip = [f"{a}.{b}.{c}.{d}" for a, b, c, d in rng.integers(1, 255, (k, 4))]
+    incidents = pd.DataFrame({
+        'incident_id': [f"INC_{i}" for i in range(k)],
+        'customer_id': ids[rng.integers(0, n, k)],
+        'incident_date': timestamps.date,
+        'incident_timestamp': timestamps,
+        'severity_level': levels[severity],
+        'severity_score': severity + 1,
+        'attack_type': rng.choice(['Malware', 'DDoS', 'Intrusion'], k),
+        'source_ip': source_ip,
+        'anomaly_score': rng.uniform(0, 100, k).round(2),
+        'mean_time_to_detect_minutes': rng.uniform(1, 240, k).round(1),
+        'mean_time_to_respond_minutes': rng.uniform(5, 600, k).round(1),
+        'false_positive': rng.random(k) < 0.1,
+        'Timestamp': timestamps,
+        'Source IP Address': source_ip,
+        'Destination IP Address': [f"10.0.{b}.{c}" for b, c in rng.integers(0, 255, (k, 2))],
+        'Source Port': rng.integers(1024, 65535, k),
+        'Destination Port': rng.choice([22, 80, 443, 3389, 8080, 53], k),
+        'Protocol': rng.choice(['TCP', 'UDP', 'ICMP'], k),
+        'Attack Type': rng.choice(['Malware', 'DDoS', 'Intrusion'], k),
+        'Attack Signature': rng.choice(['Known Pattern A', 'Known Pattern B'], k),
+        'Severity Level': levels[severity],
+        'Action Taken': rng.choice(['Blocked', 'Logged', 'Ignored'], k),
+        'Malware Indicators': rng.choice(['IoC Detected', ''], k),
+        'Anomaly Scores': rng.uniform(0, 100, k).round(2),
+        'Alerts/Warnings': rng.choice(['Alert Triggered', ''], k),
+        'Log Source': rng.choice(['Firewall', 'Server'], k),
+        'Network Segment': rng.choice(['Segment A', 'Segment B', 'Segment C'], k),
+        'Geo-location Data': rng.choice(['Austin, US', 'Berlin, Germany', 'Beijing, China', 'London, UK'], k),
+    })
+
+    usage_snapshot = pd.DataFrame({
+        'customer_id': ids,
+        'feature_adoption_score': rng.uniform(0, 1, n).round(3),
+        'license_utilization_pct': rng.uniform(10, 100, n).round(1),
+    })
+    u = n * USAGE_DAYS_PER_CUSTOMER
+    usage_daily = pd.DataFrame({
+        'customer_id': ids[rng.integers(0, n, u)],
+        'date': (today - pd.to_timedelta(rng.integers(0, 120, u), unit='D')).date,
+        'daily_active_users': rng.integers(1, 500, u),
+        'feature_adoption_rate': rng.uniform(0, 1, u),
+        'license_utilization': rng.uniform(0, 1, u),
+    })
+
+    f = n * FEEDBACK_PER_CUSTOMER
+    feedback = pd.DataFrame({
+        'customer_id': ids[rng.integers(0, n, f)],
+        'nps_score': rng.integers(0, 11, f),
+        'satisfaction_rating': rng.uniform(1, 5, f).round(1),
+        'likelihood_to_renew': rng.uniform(0, 10, f).round(1),
+        'feedback_date': (today - pd.to_timedelta(rng.integers(0, 400, f), unit='D')).date,
+    })
+
+    raw = {'customers': customers, 'support_tickets': tickets, 'security_incidents': incidents,
+           'product_usage': usage_snapshot, 'customer_feedback': feedback}
+    for name, df in raw.items():
+        csv.write_csv(Table.from_pandas(df, preserve_index=False), os.path.join(root, 'data', 'raw', f"{name}.csv"))
+
+    dim = CustomerDimension(os.path.join(root, 'data', 'dimensions', 'customer_dim.csv'))
+    dim.register(customers['customer_id'])
+
+    conn = duckdb.connect(os.path.join(root, 'data', 'cybersec_health_dbt.duckdb'))
+    tables = dict(raw, product_usage=usage_daily)
+    for name, df in tables.items():
+        conn.register('frame', df)
+        conn.execute(f"CREATE OR REPLACE TABLE {name} AS SELECT * FROM frame")
+        conn.unregister('frame')
+    conn.close()
+
+    with open(os.path.join(root, 'workload.json'), 'w') as f:
+        json.dump({'tier': tier, 'customers': n, 'seed': seed, 'generator_version': GENERATOR_VERSION,
+                   'generated_at': datetime.now().isoformat(),
+                   'rows': {name: len(df) for name, df in tables.items()}}, f, indent=2)
+    return root
+
+
+def workload(tier, regenerate=False):
+    """The tier's workload directory, generated if missing, stale or from an older generator."""
+    root = os.path.join(BENCH_ROOT, tier)
+    try:
+        with open(os.path.join(root, 'workload.json')) as f:
+            manifest = json.load(f)
+        age = datetime.now() - datetime.fromisoformat(manifest['generated_at'])
+        fresh = manifest['generator_version'] == GENERATOR_VERSION and age.days < WORKLOAD_MAX_AGE_DAYS
+    except (FileNotFoundError, KeyError, ValueError):
+        fresh = False
+    if regenerate or not fresh:
+        print(f"Generating {tier} workload ({TIERS[tier]:,} customers)...")
+        generate_workload(tier)
+    return root
+
+
+def render_dbt_model(path):
+    """dbt model SQL with refs and the repo's one macro expanded (no dbt/Jinja needed)."""
+    from customer_dim import normalize_sql
+
+    with open(path) as f:
+        sql = f.read()
+    sql = re.sub(r"\{#.*?#\}", '', sql, flags=re.S)
+    sql = re.sub(r"\{\{\s*ref\('(\w+)'\)\s*\}\}", r'\1', sql)
+    sql = re.sub(r"\{\{\s*normalize_customer_id\('(.*?)'\)\s*\}\}", lambda m: normalize_sql(m.group(1)), sql)
+    return sql
+
+
+def dbt_models():
+    models_dir = os.path.join(ROOT, 'dbt', 'models')
+    staging = sorted(os.listdir(os.path.join(models_dir, 'staging')))
+    marts = sorted(os.listdir(os.path.join(models_dir, 'marts')))
+    return ([os.path.join(models_dir, 'staging', m) for m in staging if m.endswith('.sql')] +
+            [os.path.join(models_dir, 'marts', m) for m in marts if m.endswith('.sql')])
+
+
+def stage_functions():
+    """(stage name, callable returning rows processed); callables run from the workload's src dir."""
+    import duckdb
+    from transform import calculate_customer_health_score, load_health_inputs
+    from comprehensive_health_score import calculate_comprehensive_health_score
+    from load import load_to_processed
+    from churn_predictor import ChurnPredictor
+    from alert_system import AlertSystem
+    from dashboard_insights import generate_executive_dashboard
+
+    state = {}
+
+    def health_inputs():
+        state['inputs'] = load_health_inputs()
+        return sum(len(df) for df in state['inputs'].values())
+
+    def churn_train():
+        state['predictor'] = ChurnPredictor()
+        state['predictor'].train_model()
+        return len(state['predictor'].extract_features())
+
+    def churn_predict():
+        predictor = state.get('predictor') or ChurnPredictor()
+        return len(predictor.predict_churn())
+
+    def alerts():
+        return len(AlertSystem(predictor=state.get('predictor')).generate_alerts())
+
+    stages = [
+        ('extract.health_inputs', health_inputs),
+        ('transform.health_score', lambda: len(calculate_customer_health_score(state['inputs']))),
+        ('transform.comprehensive_score', lambda: len(calculate_comprehensive_health_score(state['inputs']))),
+        ('load.processed', lambda: len(load_to_processed())),
+        ('churn.train_model', churn_train),
+        ('churn.predict_churn', churn_predict),
+        ('alerts.generate_alerts', alerts),
+        ('dashboard.insights', lambda: len(generate_executive_dashboard())),
+    ]
+
+    def dbt_model(path):
+        name = os.path.splitext(os.path.basename(path))[0]
+
+        def run():
+            conn = duckdb.connect('../data/dbt_bench.duckdb')
+            try:
+                conn.execute(f"CREATE OR REPLACE TABLE {name} AS {render_dbt_model(path)}")
+                return conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+            finally:
+                conn.close()
+        return f"dbt.{name}", run
+
+    stages += [dbt_model(path) for path in dbt_models()]
+    return stages
+
+
+def calibrate(repeats=5):
+    """Seconds for a fixed mixed numpy/Python workload, to normalize for machine speed and load."""
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    values = rng.random(1000000)
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        np.sort(values)
+        sum(i * i for i in range(300000))
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def run_tier(tier, repeats):
+    """Time every stage of one tier in this process; returns {stage: result}."""
+    root = workload(tier)
+    os.chdir(os.path.join(root, 'src'))
+    results = {'_calibration': {'status': 'ok', 'seconds': calibrate()}}
+    for name, fn in stage_functions():
+        timings = []
+        result = {'status': 'ok'}
+        for _ in range(repeats):
+            started = time.perf_counter()
+            try:
+                # Stages print progress; keep it out of the benchmark output
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    result['rows'] = int(fn())
+            except Exception as e:
+                result = {'status': 'error', 'error': f"{type(e).__name__}: {str(e).splitlines()[0][:200]}"}
+                break
+            timings.append(time.perf_counter() - started)
+        if timings:
+            result.update(seconds=min(timings), median_seconds=sorted(timings)[len(timings) // 2],
+                          repeats=len(timings))
+        results[name] = result
+        shown = f"{result['seconds'] * 1000:10.1f} ms" if 'seconds' in result else f"  ERROR {result['error']}"
+        print(f"  [{tier}] {name:<42} {shown}", file=sys.stderr, flush=True)
+    return results
+
+
+def machine_info():
+    return {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count()}
+
+
+def load_baselines(path=BASELINE_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'threshold': DEFAULT_THRESHOLD, 'min_delta_seconds': DEFAULT_MIN_DELTA,
+                'machine': None, 'tiers': {}}
+
+
+def compare(baselines, tier, results, threshold):
+    """(regressions, report lines) for one tier against its baseline."""
+    baseline = baselines.get('tiers', {}).get(tier, {})
+    min_delta = baselines.get('min_delta_seconds', DEFAULT_MIN_DELTA)
+    # Scale baselines by how much slower this machine/run is on the fixed reference workload
+    scale = 1.0
+    if '_calibration' in baseline and '_calibration' in results:
+        scale = results['_calibration']['seconds'] / baseline['_calibration']['seconds']
+    regressions, lines = [], [f"{'(calibration)':<42} x{scale:.2f} vs baseline machine"]
+    for stage, result in results.items():
+        if stage == '_calibration':
+            continue
+        base = baseline.get(stage)
+        if result['status'] != 'ok':
+            # A stage that errors measures nothing, so it fails even if it failed in the baseline too
+            regressions.append(stage)
+            also = ' (also in baseline)' if base and base.get('status') != 'ok' else ''
+            lines.append(f"{stage:<42} ERROR{also}: {result['error']}")
+            continue
+        if not base or base.get('status') != 'ok':
+            lines.append(f"{stage:<42} {result['seconds'] * 1000:10.1f} ms  (no baseline)")
+            continue
+        change = result['seconds'] / (base['seconds'] * scale) - 1 if base['seconds'] else 0.0
+        # Fast stages jitter by more than the threshold, so also require an absolute slowdown
+        regressed = change > threshold and result['seconds'] - base['seconds'] * scale > min_delta
+        if regressed:
+            regressions.append(stage)
+        lines.append(f"{stage:<42} {result['seconds'] * 1000:10.1f} ms  baseline {base['seconds'] * scale * 1000:10.1f} ms  "
+                     f"{change:+7.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions, lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tiers', nargs='+', choices=list(TIERS), default=['1k'])
+    parser.add_argument('--repeats', type=int, default=None, help='runs per stage (default 5 for 1k, else 1)')
+    parser.add_argument('--threshold', type=float, default=None,
+                        help='allowed slowdown as a fraction (default from the baselines file)')
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--regenerate', action='store_true', help='rebuild the synthetic workloads')
+    parser.add_argument('--run-tier', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_tier:
+        results = run_tier(args.run_tier, args.repeats or 1)
+        with open(args.output, 'w') as f:
+            json.dump(results, f)
+        return
+
+    baselines = load_baselines()
+    threshold = args.threshold if args.threshold is not None else baselines.get('threshold', DEFAULT_THRESHOLD)
+    if baselines.get('machine') and baselines['machine'] != machine_info() and not args.update_baseline:
+        print(f"Note: baselines were recorded on {baselines['machine']}, comparisons may not be meaningful")
+
+    run = {'started_at': datetime.now().isoformat(), 'machine': machine_info(), 'tiers': {}}
+    failed = []
+    for tier in args.tiers:
+        workload(tier, regenerate=args.regenerate)
+        repeats = args.repeats or (5 if tier == '1k' else 1)
+        print(f"\n=== {tier} tier ({TIERS[tier]:,} customers, {repeats} run(s) per stage) ===")
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'results.json')
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--run-tier', tier,
+                                   '--repeats', str(repeats), '--output', output])
+            if proc.returncode != 0:
+                print(f"{tier} tier crashed (exit {proc.returncode})")
+                failed.append(f"{tier}:crashed")
+                continue
+            with open(output) as f:
+                results = json.load(f)
+        run['tiers'][tier] = results
+        regressions, lines = compare(baselines, tier, results, threshold)
+        print('\n'.join(lines))
+        failed += [f"{tier}:{stage}" for stage in regressions]
+
+    results_dir = os.path.join(BENCH_ROOT, 'results')
+    os.makedirs(results_dir, exist_ok=True)
+    with open(os.path.join(results_dir, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"), 'w') as f:
+        json.dump(run, f, indent=2)
+
+    if args.update_baseline:
+        errors = [f"{tier}:{stage}" for tier, results in run['tiers'].items()
+                  for stage, result in results.items() if result['status'] != 'ok']
+        errors += [name for name in failed if name.endswith(':crashed')]
+        if errors:
+            print(f"\nBaselines not updated, {len(errors)} stage(s) failed: {', '.join(errors)}")
+            sys.exit(1)
+        baselines['machine'] = run['machine']
+        baselines.setdefault('tiers', {}).update(run['tiers'])
+        baselines['updated_at'] = run['started_at']
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH + '.tmp', 'w') as f:
+            json.dump(baselines, f, indent=2)
+        os.replace(BASELINE_PATH + '.tmp', BASELINE_PATH)
+        print(f"\nBaselines updated: {BASELINE_PATH}")
+        return
+
+    if failed:
+        print(f"\n{len(failed)} regression(s) beyond {threshold:.0%}: {', '.join(failed)}")
+        sys.exit(1)
+    print(f"\nNo regressions beyond {threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
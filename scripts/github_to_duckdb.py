@@ -1,28 +1,48 @@
+import os
+import sys
+import time
 import duckdb
 
-# GitHub raw file URLs
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from raw_cdc import ChangeCapture
+from source_fetcher import Mirror, SourceFetcher, print_results
+
+# GitHub raw file URLs (pass another base URL, e.g. a LocalSourceServer, as the first argument)
 base_url = "https://raw.githubusercontent.com/jpearce-datahub/cybersec-customer-health-pipeline/main/data/raw/"
+if len(sys.argv) > 1:
+    base_url = sys.argv[1].rstrip('/') + '/'
 files = [
     "customers.csv",
-    "security_incidents.csv", 
+    "security_incidents.csv",
     "support_tickets.csv",
     "product_usage.csv",
     "customer_feedback.csv"
 ]
 
+started = time.perf_counter()
+# Download concurrently into the local mirror; unchanged files cost one 304 each
+fetcher = SourceFetcher(Mirror('data/mirror'))
+results, summary = fetcher.fetch_all([base_url + file for file in files])
+print_results(results, summary)
+
 conn = duckdb.connect('data/processed/cybersec_health.duckdb')
+# Only rows that changed since the last download are written to the tables
+cdc = ChangeCapture(conn, root='data/cdc/processed', quarantine_dir='data/quarantine')
 
 for file in files:
+    table_name = file.replace('.csv', '')
+    result = results.get(base_url + file)
+    if result is None:
+        print(f"Failed to fetch {table_name}, keeping the current table")
+        continue
     try:
-        url = base_url + file
-        table_name = file.replace('.csv', '')
-        
-        # Create table directly from GitHub URL
-        conn.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM read_csv_auto('{url}')")
-        print(f"Created table: {table_name}")
-        
+        # Mirror paths are content-addressed, so a file already loaded is skipped without being read
+        s = cdc.capture(table_name, result.path)
+        print(f"Updated table: {table_name} (+{s['inserts']} ~{s['updates']} -{s['deletes']})")
+
     except Exception as e:
-        print(f"Failed to create {table_name}: {e}")
+        print(f"Failed to load {table_name}: {e}")
 
-print("\nPipeline complete! Refresh DBeaver to see tables.")
-conn.close()
\ No newline at end of file
+print(f"\nRefresh took {time.perf_counter() - started:.2f}s ({summary['bytes_transferred']:,} bytes downloaded)")
+print("Pipeline complete! Refresh DBeaver to see tables.")
+conn.close()
@@ -1,9 +1,25 @@
 import subprocess
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from db_snapshots import SnapshotPublisher
+from olap_cube import CUBES, OlapCube
+from instrumentation import span, record_dbt_results
 
 os.chdir('dbt')
-result = subprocess.run(['python', '-c', 'import dbt.cli.main; dbt.cli.main.cli()', 'run', '--profiles-dir', '.'], 
-                       capture_output=True, text=True)
+with span('dbt.run'):
+    result = subprocess.run(['python', '-c', 'import dbt.cli.main; dbt.cli.main.cli()', 'run', '--profiles-dir', '.'], 
+                           capture_output=True, text=True)
+    # Per-model timings from dbt's own run results, nested under the run
+    record_dbt_results('target/run_results.json')
 print(result.stdout)
 if result.stderr:
-    print("STDERR:", result.stderr)
\ No newline at end of file
+    print("STDERR:", result.stderr)
+
+if result.returncode == 0:
+    print(f"Published snapshot: {SnapshotPublisher('../data/cybersec_health_dbt.duckdb').publish()}")
+    # Dashboard cubes only rebuild the month partitions this run changed
+    for name in CUBES:
+        refreshed = OlapCube(name).refresh()
+        print(f"Cube {name}: rebuilt {len(refreshed['rebuilt'])} month(s)")
@@ -1,5 +1,9 @@
 import duckdb
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from db_snapshots import SnapshotPublisher
 
 # Connect to DuckDB
 conn = duckdb.connect('data/processed/cybersec_health.duckdb')
@@ -75,4 +79,5 @@ print(f"\nCustomer Health Scores ({len(result)} records):")
 for row in result:
     print(row)
 
-conn.close()
\ No newline at end of file
+conn.close()
+print(f"Published snapshot: {SnapshotPublisher('data/processed/cybersec_health.duckdb').publish()}")
@@ -1,24 +1,264 @@
-import duckdb
-
-conn = duckdb.connect('data/processed/cybersec_health.duckdb')
-
-print("DuckDB SQL Interface - Type 'exit' to quit")
-print("Available tables: customer_health_scores, stg_customers, stg_security_incidents")
-print("-" * 60)
-
-while True:
-    query = input("SQL> ")
-    if query.lower() in ['exit', 'quit']:
-        break
-    
-    try:
-        result = conn.execute(query).fetchall()
-        if result:
-            for row in result:
-                print(row)
+#!/usr/bin/env python3
+"""Interactive SQL console over the latest published (read-only) DuckDB snapshot.
+
+Results stream in record batches, one page per batch, and stop at a row
+limit, so a careless SELECT * never materializes the whole table. Each
+query reports its elapsed time; queries over --slow-ms are appended to a
+slow query log. Tab completion comes from DuckDB's catalog functions, which
+read metadata only.
+
+Meta commands: \\tables, \\d <table>, \\analyze <sql>, \\limit <n>, \\page <n>,
+\\slow, \\refresh, \\q
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+DEFAULT_DB = 'data/processed/cybersec_health.duckdb'
+STATE_DIR = 'data/sql_console'
+MAX_COLUMN_WIDTH = 40
+
+SQL_KEYWORDS = [
+    'SELECT', 'FROM', 'WHERE', 'GROUP BY', 'ORDER BY', 'HAVING', 'LIMIT', 'OFFSET', 'JOIN', 'LEFT JOIN',
+    'INNER JOIN', 'ON', 'USING', 'AS', 'AND', 'OR', 'NOT', 'IN', 'IS NULL', 'IS NOT NULL', 'LIKE', 'ILIKE',
+    'BETWEEN', 'CASE', 'WHEN', 'THEN', 'ELSE', 'END', 'DISTINCT', 'COUNT', 'SUM', 'AVG', 'MIN', 'MAX',
+    'WITH', 'UNION ALL', 'DESCRIBE', 'SUMMARIZE', 'EXPLAIN', 'EXPLAIN ANALYZE', 'SHOW TABLES',
+]
+
+
+def open_database(db_path):
+    """Read-only connection to the latest published snapshot of ``db_path`` (or the file itself)."""
+    import duckdb
+    # Imported here rather than on the first fetch, so it isn't billed to the first query
+    import pyarrow
+    from db_snapshots import current_snapshot
+
+    path = current_snapshot(db_path) or db_path
+    if not os.path.exists(path):
+        raise SystemExit(f"No database at {db_path} and no published snapshot of it")
+    return path, duckdb.connect(path, read_only=True)
+
+
+def stream_batches(result, batch_size):
+    """Arrow record batches of ``result`` without fetching the rest of it."""
+    to_reader = getattr(result, 'to_arrow_reader', None)
+    reader = to_reader(batch_size) if to_reader is not None else result.fetch_record_batch(batch_size)
+    while True:
+        try:
+            yield reader.read_next_batch()
+        except StopIteration:
+            return
+
+
+def format_rows(columns, rows):
+    """Aligned text table; long values are cut to MAX_COLUMN_WIDTH."""
+    cells = [[_cell(v) for v in row] for row in rows]
+    widths = [max([len(c)] + [len(r[i]) for r in cells]) for i, c in enumerate(columns)]
+    lines = [' | '.join(c.ljust(w) for c, w in zip(columns, widths)),
+             '-+-'.join('-' * w for w in widths)]
+    lines.extend(' | '.join(v.ljust(w) for v, w in zip(row, widths)) for row in cells)
+    return '\n'.join(lines)
+
+
+def _cell(value):
+    text = 'NULL' if value is None else str(value)
+    return text if len(text) <= MAX_COLUMN_WIDTH else text[:MAX_COLUMN_WIDTH - 1] + '…'
+
+
+class SqlConsole:
+    def __init__(self, conn, page_size=50, max_rows=1000, slow_ms=1000, state_dir=STATE_DIR, interactive=True):
+        self.conn = conn
+        self.page_size = page_size
+        self.max_rows = max_rows
+        self.slow_ms = slow_ms
+        self.state_dir = state_dir
+        self.interactive = interactive
+        self.completions = []
+
+    def load_catalog(self):
+        """Table, view and column names for completion, from catalog metadata only."""
+        names = set()
+        for schema, table in self.conn.execute(
+                "SELECT schema_name, table_name FROM duckdb_tables() "
+                "UNION SELECT schema_name, view_name FROM duckdb_views() WHERE NOT internal").fetchall():
+            names.update([table, f"{schema}.{table}"])
+        names.update(row[0] for row in self.conn.execute(
+            "SELECT DISTINCT column_name FROM duckdb_columns() WHERE NOT internal").fetchall())
+        self.completions = sorted(names) + SQL_KEYWORDS
+
+    def complete(self, text, state):
+        matches = [c for c in self.completions if c.lower().startswith(text.lower())]
+        return matches[state] if state < len(matches) else None
+
+    def run(self, sql):
+        """Stream one query's results page by page, then report rows and elapsed time."""
+        started = time.perf_counter()
+        result = self.conn.execute(sql)
+        if result.description is None:
+            print(f"OK ({(time.perf_counter() - started) * 1000:.1f} ms)")
+            return
+        columns = [d[0] for d in result.description]
+        shown = 0
+        waited = 0.0
+        first_ms = None
+        stopped = False
+        for batch in stream_batches(result, self.page_size):
+            if first_ms is None:
+                first_ms = (time.perf_counter() - started) * 1000
+            page = batch.slice(0, self.max_rows - shown)
+            print(format_rows(columns, list(zip(*[col.to_pylist() for col in page.columns]))))
+            shown += page.num_rows
+            if shown >= self.max_rows:
+                print(f"(stopped at the {self.max_rows:,}-row limit; \\limit <n> to change)")
+                stopped = True
+                break
+            if self.interactive and batch.num_rows == self.page_size:
+                prompt_started = time.perf_counter()
+                answer = input(f"-- {shown:,} rows, Enter for more, q to stop -- ")
+                waited += time.perf_counter() - prompt_started
+                if answer.strip().lower() == 'q':
+                    stopped = True
+                    break
+        # Time spent at the paging prompt is the reader's, not the query's
+        elapsed_ms = (time.perf_counter() - started - waited) * 1000
+        if shown == 0:
+            print(format_rows(columns, []))
+        print(f"({shown:,} row{'s' if shown != 1 else ''}{'+' if stopped else ''}, "
+              f"{elapsed_ms:.1f} ms, first page {first_ms or elapsed_ms:.1f} ms)")
+        if elapsed_ms >= self.slow_ms:
+            self.log_slow(sql, elapsed_ms, first_ms, shown)
+
+    def explain_analyze(self, sql):
+        started = time.perf_counter()
+        for _, plan in self.conn.execute(f"EXPLAIN ANALYZE {sql}").fetchall():
+            print(plan)
+        print(f"({(time.perf_counter() - started) * 1000:.1f} ms including profiling)")
+
+    def log_slow(self, sql, elapsed_ms, first_ms, rows):
+        os.makedirs(self.state_dir, exist_ok=True)
+        with open(os.path.join(self.state_dir, 'slow_queries.jsonl'), 'a') as f:
+            f.write(json.dumps({'at': datetime.now().isoformat(timespec='seconds'), 'elapsed_ms': round(elapsed_ms, 1),
+                                'first_page_ms': round(first_ms, 1) if first_ms else None,
+                                'rows': rows, 'sql': sql}) + '\n')
+
+    def show_slow(self, n=20):
+        path = os.path.join(self.state_dir, 'slow_queries.jsonl')
+        if not os.path.exists(path):
+            print("No slow queries logged")
+            return
+        with open(path) as f:
+            entries = [json.loads(line) for line in f if line.strip()][-n:]
+        for e in entries:
+            print(f"{e['at']}  {e['elapsed_ms']:>10.1f} ms  {' '.join(e['sql'].split())[:100]}")
+
+    def meta(self, line):
+        """Handle a backslash command; returns False to quit."""
+        command, _, rest = line[1:].partition(' ')
+        rest = rest.strip().rstrip(';')
+        if command in ('q', 'quit'):
+            return False
+        if command == 'tables':
+            self.run("SELECT schema_name, table_name, estimated_size AS est_rows, column_count "
+                     "FROM duckdb_tables() UNION ALL SELECT schema_name, view_name, NULL, column_count "
+                     "FROM duckdb_views() WHERE NOT internal ORDER BY 1, 2")
+        elif command == 'd':
+            self.run(f"DESCRIBE {rest}")
+        elif command == 'analyze':
+            self.explain_analyze(rest)
+        elif command in ('limit', 'page') and rest.isdigit():
+            setattr(self, 'max_rows' if command == 'limit' else 'page_size', int(rest))
+            print(f"max rows {self.max_rows:,}, page size {self.page_size}")
+        elif command == 'slow':
+            self.show_slow()
+        elif command == 'refresh':
+            self.load_catalog()
+            print(f"{len(self.completions) - len(SQL_KEYWORDS)} catalog names loaded")
         else:
-            print("Query executed successfully (no results)")
-    except Exception as e:
-        print(f"Error: {e}")
+            print(__doc__.split('Meta commands: ', 1)[1].strip())
+        return True
+
+    def execute(self, line):
+        try:
+            if line.startswith('\\'):
+                return self.meta(line)
+            self.run(line.rstrip().rstrip(';'))
+        except KeyboardInterrupt:
+            print("\nCancelled")
+        except Exception as e:
+            print(f"Error: {e}")
+        return True
+
+    def loop(self):
+        """Read statements (ending in ';' or a single meta command line) until \\q or EOF."""
+        try:
+            import readline
+        except ImportError:
+            readline = None
+        history = os.path.join(self.state_dir, 'history')
+        if readline is not None:
+            self.load_catalog()
+            readline.set_completer(self.complete)
+            readline.set_completer_delims(' \t\n,()=;')
+            readline.parse_and_bind('tab: complete')
+            if os.path.exists(history):
+                readline.read_history_file(history)
+
+        buffer = []
+        try:
+            while True:
+                try:
+                    line = input('SQL> ' if not buffer else '...> ')
+                except KeyboardInterrupt:
+                    buffer = []
+                    print()
+                    continue
+                if not buffer and line.strip().lower() in ('exit', 'quit'):
+                    break
+                if not buffer and line.strip().startswith('\\'):
+                    if not self.execute(line.strip()):
+                        break
+                    continue
+                buffer.append(line)
+                if line.rstrip().endswith(';'):
+                    statement = '\n'.join(buffer).strip()
+                    buffer = []
+                    if statement.rstrip(';').strip():
+                        self.execute(statement)
+        except EOFError:
+            print()
+        finally:
+            if readline is not None:
+                os.makedirs(self.state_dir, exist_ok=True)
+                readline.write_history_file(history)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('db', nargs='?', default=DEFAULT_DB, help=f"database (default {DEFAULT_DB})")
+    parser.add_argument('-c', '--command', help='run one statement (or meta command) and exit')
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--max-rows', type=int, default=1000)
+    parser.add_argument('--slow-ms', type=float, default=1000)
+    args = parser.parse_args()
+
+    path, conn = open_database(args.db)
+    console = SqlConsole(conn, args.page_size, args.max_rows, args.slow_ms,
+                         interactive=args.command is None and sys.stdin.isatty())
+    if args.command is not None:
+        console.execute(args.command)
+    else:
+        print(f"DuckDB SQL console on {path} (read-only)")
+        print("End statements with ';'. Tab completes names; \\tables, \\d <table>, \\analyze <sql>, \\slow, \\q")
+        print("-" * 60)
+        console.loop()
+    conn.close()
+
 
-conn.close()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
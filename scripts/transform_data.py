@@ -1,5 +1,10 @@
 import duckdb
 import pandas as pd
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from db_snapshots import SnapshotPublisher
 
 # Create DuckDB connection
 conn = duckdb.connect('data/processed/cybersec_health.duckdb')
@@ -82,4 +87,5 @@ print("\nSample customer health scores:")
 result = conn.execute("SELECT * FROM customer_health_scores LIMIT 5").fetchdf()
 print(result)
 
-conn.close()
\ No newline at end of file
+conn.close()
+print(f"Published snapshot: {SnapshotPublisher('data/processed/cybersec_health.duckdb').publish()}")
@@ -1,6 +1,12 @@
-import duckdb
+import os
+import sys
 
-conn = duckdb.connect('data/processed/cybersec_health.duckdb')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from db_snapshots import connect_reader
+from db_connections import get_manager
+
+# Reads the latest published snapshot, so this works while the pipeline is writing
+conn = connect_reader('data/processed/cybersec_health.duckdb')
 
 # Show tables
 print("=== TABLES ===")
@@ -14,12 +20,13 @@ for row in result:
     print(row)
 
 print("\n=== RISK SUMMARY ===")
-risk_summary = conn.execute("""
+# Reused from the query cache until a new snapshot is published
+risk_summary = get_manager().fetch_arrow('data/processed/cybersec_health.duckdb', """
     SELECT risk_level, COUNT(*) as count, AVG(mrr) as avg_mrr
     FROM customer_health_scores 
     GROUP BY risk_level
-""").fetchall()
+""", label='risk_summary', cache=True).to_pylist()
 for row in risk_summary:
-    print(f"{row[0]}: {row[1]} customers, Avg MRR: ${row[2]:.2f}")
+    print(f"{row['risk_level']}: {row['count']} customers, Avg MRR: ${row['avg_mrr']:.2f}")
 
 conn.close()
\ No newline at end of file
@@ -1,5 +1,11 @@
 import duckdb
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+from raw_cdc import ChangeCapture
+from db_snapshots import SnapshotPublisher
+from customer_dim import CustomerDimension, normalize_sql
 
 # Create DuckDB database for raw data
 db_path = 'data/cybersec_health_raw.duckdb'
@@ -15,14 +21,37 @@ data_files = [
     'contract_events.csv'
 ]
 
+# Each file is diffed against its previous drop; only changed rows are written, and the
+# change sets are published under data/cdc/raw (repeated natural keys are quarantined)
+cdc = ChangeCapture(conn, root='data/cdc/raw', quarantine_dir='data/quarantine')
+captured = set()
+
 for file in data_files:
     file_path = f'data/raw/{file}'
     if os.path.exists(file_path):
         table_name = file.replace('.csv', '')
-        conn.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM read_csv_auto('{file_path}')")
-        print(f"Created table: {table_name}")
+        s = cdc.capture(table_name, file_path)
+        captured.add(table_name)
+        print(f"Loaded table: {table_name} (v{s['version']}: {s['inserts']} inserted, {s['updates']} updated, "
+              f"{s['deletes']} deleted, {s['duplicates']} duplicates quarantined"
+              f"{', full reload' if s['rebuilt'] else ''})")
+
+# Normalize customer id variants (CUST001 vs CUST_001) and key them through the shared dimension
+dim = CustomerDimension('data/dimensions/customer_dim.csv')
+tables = conn.execute(
+    "SELECT DISTINCT table_name FROM duckdb_columns() WHERE column_name = 'customer_id'").fetchall()
+for (table_name,) in tables:
+    # Change capture already normalized the tables it loads
+    if table_name not in captured:
+        conn.execute(f"UPDATE {table_name} SET customer_id = {normalize_sql('customer_id')}")
+    dim.register(conn.execute(f"SELECT DISTINCT customer_id FROM {table_name}").df()['customer_id'])
+conn.execute("CREATE OR REPLACE TABLE dim_customer AS SELECT * FROM read_csv_auto('data/dimensions/customer_dim.csv')")
+print(f"Customer dimension: {len(dim)} customers")
 
 print("Raw data database setup complete.")
 print("Raw database: data/cybersec_health_raw.duckdb")
 print("Run 'dbt run' to build models in: data/cybersec_health_dbt.duckdb")
-conn.close()
\ No newline at end of file
+conn.close()
+
+# Readers (dashboards, DBeaver) use the published copy, never the file being built
+print(f"Published snapshot: {SnapshotPublisher(db_path).publish()}")
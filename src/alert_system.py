@@ -1,19 +1,68 @@
 #!/usr/bin/env python3
 """Automated alerting system for at-risk customers."""
 
+import os
 import pandas as pd
 import smtplib
 import json
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta
-import duckdb
+from db_connections import get_manager
 from churn_predictor import ChurnPredictor
+from instrumentation import traced, count
+
+# Windows end yesterday, same as window_features.WindowStore; each source is aggregated
+# on its own so tickets, incidents and usage rows don't multiply each other
+RISK_QUERY = """
+WITH tickets AS (
+    SELECT customer_id, COUNT(*) AS recent_tickets, AVG(satisfaction_score) AS recent_satisfaction
+    FROM support_tickets
+    WHERE created_date BETWEEN CURRENT_DATE - 30 AND CURRENT_DATE - 1
+    GROUP BY customer_id
+),
+incidents AS (
+    SELECT customer_id, COUNT(*) AS recent_incidents
+    FROM security_incidents
+    WHERE incident_date BETWEEN CURRENT_DATE - 30 AND CURRENT_DATE - 1
+    GROUP BY customer_id
+),
+usage AS (
+    SELECT customer_id,
+        AVG(CASE WHEN date >= CURRENT_DATE - 30 THEN daily_active_users END) AS recent_usage,
+        AVG(CASE WHEN date < CURRENT_DATE - 30 THEN daily_active_users END) AS previous_usage
+    FROM product_usage
+    WHERE date BETWEEN CURRENT_DATE - 90 AND CURRENT_DATE - 1
+    GROUP BY customer_id
+)
+SELECT 
+    c.customer_id,
+    c.customer_name,
+    c.contract_value,
+    c.contract_end_date,
+    COALESCE(t.recent_tickets, 0) AS recent_tickets,
+    t.recent_satisfaction,
+    COALESCE(i.recent_incidents, 0) AS recent_incidents,
+    u.recent_usage,
+    u.previous_usage
+FROM customers c
+LEFT JOIN tickets t ON c.customer_id = t.customer_id
+LEFT JOIN incidents i ON c.customer_id = i.customer_id
+LEFT JOIN usage u ON c.customer_id = u.customer_id
+WHERE c.contract_end_date > CURRENT_DATE
+"""
+
+CUSTOMER_QUERY = """
+SELECT customer_id, customer_name, contract_value, contract_end_date
+FROM customers
+WHERE contract_end_date > CURRENT_DATE
+"""
 
 class AlertSystem:
-    def __init__(self, config_path='../config/alert_config.json'):
+    def __init__(self, config_path='../config/alert_config.json', predictor=None):
         self.config = self.load_config(config_path)
-        self.predictor = ChurnPredictor()
+        # The model itself is loaded lazily and cached process-wide by the registry
+        self.predictor = predictor or ChurnPredictor()
         
     def load_config(self, config_path):
         """Load alert configuration."""
@@ -35,60 +84,72 @@ class AlertSystem:
                     "medium_churn_probability": 0.3,
                     "high_value_customer": 50000,
                     "critical_incidents": 5,
-                    "low_satisfaction": 3.0
+                    "low_satisfaction": 3.0,
+                    "incident_spike_z": 3.5
                 },
                 "alert_frequency": "daily"
             }
     
-    def get_at_risk_customers(self):
-        """Identify at-risk customers based on multiple criteria."""
-        # Get churn predictions
-        predictions = self.predictor.predict_churn()
+    def get_at_risk_customers(self, predictions=None, risk_df=None):
+        """Identify at-risk customers based on multiple criteria.
         
-        # Get additional risk factors
-        conn = duckdb.connect(self.predictor.db_path)
-        
-        risk_query = """
-        SELECT 
-            c.customer_id,
-            c.customer_name,
-            c.contract_value,
-            c.contract_end_date,
-            
-            -- Recent support issues
-            COUNT(CASE WHEN st.created_date >= CURRENT_DATE - INTERVAL '30 days' THEN 1 END) as recent_tickets,
-            AVG(CASE WHEN st.created_date >= CURRENT_DATE - INTERVAL '30 days' THEN st.satisfaction_score END) as recent_satisfaction,
-            
-            -- Recent security incidents
-            COUNT(CASE WHEN si.incident_date >= CURRENT_DATE - INTERVAL '30 days' THEN 1 END) as recent_incidents,
-            
-            -- Usage trends
-            AVG(CASE WHEN pu.date >= CURRENT_DATE - INTERVAL '30 days' THEN pu.daily_active_users END) as recent_usage,
-            AVG(CASE WHEN pu.date >= CURRENT_DATE - INTERVAL '90 days' AND pu.date < CURRENT_DATE - INTERVAL '30 days' 
-                     THEN pu.daily_active_users END) as previous_usage
-            
-        FROM customers c
-        LEFT JOIN support_tickets st ON c.customer_id = st.customer_id
-        LEFT JOIN security_incidents si ON c.customer_id = si.customer_id
-        LEFT JOIN product_usage pu ON c.customer_id = pu.customer_id
-        WHERE c.contract_end_date > CURRENT_DATE
-        GROUP BY c.customer_id, c.customer_name, c.contract_value, c.contract_end_date
+        Sharded runs pass their own shard's predictions and risk factors.
         """
+        # Get churn predictions
+        if predictions is None:
+            predictions = self.predictor.predict_churn()
+
+        # Get additional risk factors
+        if risk_df is None:
+            risk_df = self.risk_factors()
         
-        risk_df = conn.execute(risk_query).df()
-        conn.close()
+        # Merge with predictions (which already carry contract_value)
+        at_risk = predictions.merge(risk_df.drop(columns='contract_value'), on='customer_id', how='left')
         
-        # Merge with predictions
-        at_risk = predictions.merge(risk_df, on='customer_id', how='left')
+        # Value at stake: annualized MRR from the revenue ledger where it has the customer
+        ledger_value = self.ledger_annual_value(at_risk['customer_id'])
+        at_risk['current_value'] = at_risk['contract_value'] if ledger_value is None else \
+            ledger_value.fillna(at_risk['contract_value'])
         
         # Calculate usage trend
         at_risk['usage_trend'] = (at_risk['recent_usage'] - at_risk['previous_usage']) / at_risk['previous_usage'].fillna(1)
         
         return at_risk
     
-    def generate_alerts(self):
+    def risk_factors(self):
+        """RISK_QUERY's columns, with the windowed metrics read from the incremental window store.
+        
+        The store only reads days it hasn't seen, so a daily run scans one day
+        of tickets, incidents and usage instead of the full history.
+        """
+        from window_features import WindowStore
+        
+        customers = get_manager().fetch_df(self.predictor.db_path, CUSTOMER_QUERY, label='alert_customers', cache=True)
+        store = WindowStore(self.predictor.db_path, state_dir=self.config.get('window_dir', '../data/windows'),
+                            dim_path=self.config.get('customer_dim_path', '../data/dimensions/customer_dim.csv'))
+        windows = store.refresh().features(customers['customer_id'])
+        return pd.concat([customers, windows[['recent_tickets', 'recent_satisfaction', 'recent_incidents',
+                                              'recent_usage', 'previous_usage']]], axis=1)
+    
+    def ledger_annual_value(self, customer_ids):
+        """Annualized current MRR per customer from the revenue ledger, or None if it is not built."""
+        path = self.config.get('revenue_ledger_path', '../data/revenue_ledger.duckdb')
+        if not os.path.exists(path):
+            return None
+        from revenue_ledger import RevenueLedger, MONTHS_PER_YEAR
+        
+        ledger = RevenueLedger(path, read_only=True)
+        try:
+            mrr = ledger.mrr(customer_ids)
+        finally:
+            ledger.close()
+        return pd.Series(mrr.to_numpy() * MONTHS_PER_YEAR, index=customer_ids.index)
+    
+    @traced('alerts.generate')
+    def generate_alerts(self, at_risk=None):
         """Generate alerts for different risk categories."""
-        at_risk = self.get_at_risk_customers()
+        if at_risk is None:
+            at_risk = self.get_at_risk_customers()
         alerts = []
         
         # High churn probability alerts
@@ -106,7 +167,7 @@ class AlertSystem:
         
         # High-value customer at risk
         high_value_risk = at_risk[
-            (at_risk['contract_value'] >= self.config['thresholds']['high_value_customer']) &
+            (at_risk['current_value'] >= self.config['thresholds']['high_value_customer']) &
             (at_risk['churn_probability'] >= self.config['thresholds']['medium_churn_probability'])
         ]
         for _, customer in high_value_risk.iterrows():
@@ -115,22 +176,16 @@ class AlertSystem:
                 'priority': 'CRITICAL',
                 'customer_id': customer['customer_id'],
                 'customer_name': customer['customer_name'],
-                'contract_value': customer['contract_value'],
+                'contract_value': customer['current_value'],
                 'churn_probability': customer['churn_probability'],
-                'message': f"High-value customer {customer['customer_name']} (${customer['contract_value']:,.0f}) at risk"
+                'message': f"High-value customer {customer['customer_name']} (${customer['current_value']:,.0f}) at risk"
             })
         
         # Critical incidents alert
-        critical_incidents = at_risk[at_risk['recent_incidents'] >= self.config['thresholds']['critical_incidents']]
-        for _, customer in critical_incidents.iterrows():
-            alerts.append({
-                'type': 'CRITICAL_INCIDENTS',
-                'priority': 'HIGH',
-                'customer_id': customer['customer_id'],
-                'customer_name': customer['customer_name'],
-                'recent_incidents': customer['recent_incidents'],
-                'message': f"Customer {customer['customer_name']} has {customer['recent_incidents']} incidents in 30 days"
-            })
+        alerts.extend(self.critical_incident_alerts(at_risk))
+        
+        # Incident spikes against each customer's own seasonal baseline
+        alerts.extend(self.incident_spike_alerts(at_risk))
         
         # Low satisfaction alert
         low_satisfaction = at_risk[
@@ -159,6 +214,53 @@ class AlertSystem:
                 'message': f"Customer {customer['customer_name']} usage declined {customer['usage_trend']:.1%}"
             })
         
+        count(customers=len(at_risk), alerts=len(alerts))
+        return alerts
+    
+    def critical_incident_alerts(self, customers):
+        """Alerts for customers at or above the 30-day incident threshold.
+        
+        Only needs customer_id, customer_name and recent_incidents, so the
+        streaming path can re-evaluate just the customers a micro-batch touched.
+        """
+        alerts = []
+        critical_incidents = customers[customers['recent_incidents'] >= self.config['thresholds']['critical_incidents']]
+        for _, customer in critical_incidents.iterrows():
+            alerts.append({
+                'type': 'CRITICAL_INCIDENTS',
+                'priority': 'HIGH',
+                'customer_id': customer['customer_id'],
+                'customer_name': customer['customer_name'],
+                'recent_incidents': customer['recent_incidents'],
+                'message': f"Customer {customer['customer_name']} has {customer['recent_incidents']} incidents in 30 days"
+            })
+        return alerts
+    
+    def incident_spike_alerts(self, customers):
+        """Alerts for the spikes found by the last incident_anomaly refresh, limited to ``customers``.
+        
+        Catches a jump that is unusual for this customer (weekday and hour of
+        day taken into account) well before it adds up to the 30-day threshold.
+        """
+        from incident_anomaly import latest_spikes
+        
+        threshold = self.config['thresholds'].get('incident_spike_z', 3.5)
+        spikes = latest_spikes(self.config.get('anomaly_dir', '../data/anomaly'))
+        spikes = spikes[spikes['z'] >= threshold].merge(customers[['customer_id', 'customer_name']], on='customer_id')
+        # A burst usually shows up as both a day and an hour spike; alert once, on the stronger one
+        spikes = spikes.sort_values('z', ascending=False).drop_duplicates('customer_id')
+        alerts = []
+        for _, spike in spikes.iterrows():
+            period = spike['period_start'].strftime('%Y-%m-%d' if spike['granularity'] == 'day' else '%Y-%m-%d %H:00')
+            alerts.append({
+                'type': 'INCIDENT_SPIKE',
+                'priority': 'HIGH' if spike['z'] >= 2 * threshold else 'MEDIUM',
+                'customer_id': spike['customer_id'],
+                'customer_name': spike['customer_name'],
+                'recent_incidents': spike['incidents'],
+                'message': f"Customer {spike['customer_name']} had {spike['incidents']} incidents on {period} "
+                           f"(expected {spike['expected']:.1f}, z={spike['z']:.1f})"
+            })
         return alerts
     
     def send_email_alert(self, alerts):
@@ -240,9 +342,10 @@ class AlertSystem:
         if alerts:
             df = pd.DataFrame(alerts)
             df['timestamp'] = datetime.now()
-            df.to_csv('../data/processed/alerts.csv', mode='a', header=False, index=False)
+            df.to_csv(self.config.get('alerts_path', '../data/processed/alerts.csv'), mode='a', header=False, index=False)
             print(f"Saved {len(alerts)} alerts to file")
     
+    @traced('alerts.check')
     def run_alert_check(self):
         """Run complete alert check process."""
         print("Running customer risk alert check...")
@@ -1,131 +1,86 @@
 #!/usr/bin/env python3
 """Predictive churn modeling for customer health analytics."""
 
-import pandas as pd
-import numpy as np
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler
-import duckdb
-import joblib
-from datetime import datetime, timedelta
+from db_connections import get_manager
+from instrumentation import traced
+from training_snapshots import serving_query
 import warnings
 warnings.filterwarnings('ignore')
 
+FEATURE_COLS = [
+    'contract_value', 'ticket_count', 'avg_resolution_time', 'avg_satisfaction',
+    'incident_count', 'avg_severity', 'avg_daily_users', 'avg_adoption_rate',
+    'avg_license_util', 'avg_nps', 'avg_rating', 'renewal_soon'
+]
+
+# The same per-source aggregates the training snapshots use, as of today
+FEATURE_QUERY = serving_query()
+
 class ChurnPredictor:
-    def __init__(self, db_path='../data/cybersec_health_dbt.duckdb'):
+    def __init__(self, db_path='../data/cybersec_health_dbt.duckdb', model_dir='../models',
+                 cache_root='../data/features'):
         self.db_path = db_path
+        self.model_dir = model_dir
+        self.cache_root = cache_root
         self.model = None
         self.scaler = StandardScaler()
         
-    def extract_features(self):
-        """Extract features for churn prediction."""
-        conn = duckdb.connect(self.db_path)
-        
-        query = """
-        SELECT 
-            c.customer_id,
-            c.contract_value,
-            c.contract_start_date,
-            c.contract_end_date,
-            
-            -- Support metrics
-            COUNT(st.ticket_id) as ticket_count,
-            AVG(st.resolution_time_hours) as avg_resolution_time,
-            AVG(st.satisfaction_score) as avg_satisfaction,
-            
-            -- Security metrics  
-            COUNT(si.incident_id) as incident_count,
-            AVG(si.severity_score) as avg_severity,
-            
-            -- Usage metrics
-            AVG(pu.daily_active_users) as avg_daily_users,
-            AVG(pu.feature_adoption_rate) as avg_adoption_rate,
-            AVG(pu.license_utilization) as avg_license_util,
-            
-            -- Feedback metrics
-            AVG(cf.nps_score) as avg_nps,
-            AVG(cf.satisfaction_rating) as avg_rating,
-            
-            -- Contract metrics
-            CASE WHEN c.contract_end_date <= CURRENT_DATE + INTERVAL '90 days' THEN 1 ELSE 0 END as renewal_soon,
-            CASE WHEN c.contract_end_date <= CURRENT_DATE THEN 1 ELSE 0 END as churned
-            
-        FROM customers c
-        LEFT JOIN support_tickets st ON c.customer_id = st.customer_id
-        LEFT JOIN security_incidents si ON c.customer_id = si.customer_id  
-        LEFT JOIN product_usage pu ON c.customer_id = pu.customer_id
-        LEFT JOIN customer_feedback cf ON c.customer_id = cf.customer_id
-        GROUP BY c.customer_id, c.contract_value, c.contract_start_date, c.contract_end_date
-        """
+    def extract_features(self, customer_ids=None):
+        """Extract features for churn prediction, optionally for a batch of customers."""
+        manager = get_manager()
         
-        df = conn.execute(query).df()
-        conn.close()
+        if customer_ids is None:
+            df = manager.fetch_df(self.db_path, FEATURE_QUERY, label='churn_features')
+        else:
+            df = manager.fetch_df(self.db_path, f"""
+                SELECT * FROM ({FEATURE_QUERY}) f
+                WHERE list_contains(?::VARCHAR[], f.customer_id)
+            """, [[str(c) for c in customer_ids]], label='churn_features_batch')
         
         # Fill missing values
         df = df.fillna(0)
         
         return df
     
-    def train_model(self):
+    @traced('churn.train')
+    def train_model(self, incremental=False):
         """Train churn prediction model."""
-        df = self.extract_features()
-        
-        # Features for training
-        feature_cols = [
-            'contract_value', 'ticket_count', 'avg_resolution_time', 'avg_satisfaction',
-            'incident_count', 'avg_severity', 'avg_daily_users', 'avg_adoption_rate',
-            'avg_license_util', 'avg_nps', 'avg_rating', 'renewal_soon'
-        ]
+        from churn_training import ChurnTrainer
         
-        X = df[feature_cols]
-        y = df['churned']
+        trainer = ChurnTrainer(self, cache_root=self.cache_root, model_dir=self.model_dir)
+        self.model, self.scaler, metadata = trainer.train(incremental=incremental)
         
-        # Scale features
-        X_scaled = self.scaler.fit_transform(X)
-        
-        # Train model
-        self.model = RandomForestClassifier(n_estimators=100, random_state=42)
-        self.model.fit(X_scaled, y)
+        print(f"Model trained on {metadata['training_rows']} customers")
+        return self.model
+    
+    def load_model(self):
+        """Load the current model from the registry (shared within the process)."""
+        from model_registry import ModelRegistry, get_model
         
-        # Save model
-        joblib.dump(self.model, '../models/churn_model.pkl')
-        joblib.dump(self.scaler, '../models/churn_scaler.pkl')
+        if ModelRegistry(self.model_dir).current_version() is None:
+            print("No registered churn model found, training a new one...")
+            self.train_model()
+            return self.model
         
-        print(f"Model trained on {len(df)} customers")
+        loaded = get_model(self.model_dir, feature_cols=FEATURE_COLS)
+        self.model, self.scaler = loaded.model, loaded.scaler
         return self.model
     
+    @traced('churn.predict')
     def predict_churn(self):
         """Predict churn for all active customers."""
-        # Load model if not trained
+        # Load the current registered model, training one only if none exists
         if self.model is None:
-            try:
-                self.model = joblib.load('../models/churn_model.pkl')
-                self.scaler = joblib.load('../models/churn_scaler.pkl')
-            except:
-                self.train_model()
+            self.load_model()
         
         df = self.extract_features()
         active_customers = df[df['churned'] == 0]
         
-        feature_cols = [
-            'contract_value', 'ticket_count', 'avg_resolution_time', 'avg_satisfaction',
-            'incident_count', 'avg_severity', 'avg_daily_users', 'avg_adoption_rate',
-            'avg_license_util', 'avg_nps', 'avg_rating', 'renewal_soon'
-        ]
-        
-        X = active_customers[feature_cols]
-        X_scaled = self.scaler.transform(X)
-        
-        # Predict churn probability
-        churn_probs = self.model.predict_proba(X_scaled)[:, 1]
+        # The whole population is a large batch, which sklearn scores fastest
+        from batch_scoring import BatchScorer
         
-        # Create results dataframe
-        results = active_customers[['customer_id', 'contract_value']].copy()
-        results['churn_probability'] = churn_probs
-        results['risk_level'] = pd.cut(churn_probs, 
-                                     bins=[0, 0.3, 0.7, 1.0], 
-                                     labels=['Low', 'Medium', 'High'])
+        results = BatchScorer(self, model_dir=self.model_dir).score_frame(active_customers, engine='sklearn')
         
         return results.sort_values('churn_probability', ascending=False)
 
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""Parallel and incremental training for the churn prediction model."""
+
+import os
+import json
+import time
+import hashlib
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+import joblib
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import roc_auc_score, precision_score, recall_score
+from sklearn.preprocessing import StandardScaler
+from db_snapshots import current_snapshot
+from instrumentation import traced
+
+
+def _file_fingerprint(path):
+    """Cheap fingerprint of a source file (size and modification time)."""
+    try:
+        stat = os.stat(path)
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+    except FileNotFoundError:
+        return "missing"
+
+
+def _fit_fold(cache_dir, train_end, valid_end, params):
+    """Fit one time-based validation fold from the memory-mapped feature matrix."""
+    X = np.load(os.path.join(cache_dir, 'X.npy'), mmap_mode='r')
+    y = np.load(os.path.join(cache_dir, 'y.npy'), mmap_mode='r')
+    order = np.load(os.path.join(cache_dir, 'order.npy'), mmap_mode='r')
+
+    train_idx = np.sort(order[:train_end])
+    valid_idx = np.sort(order[train_end:valid_end])
+    y_train = y[train_idx]
+    y_valid = y[valid_idx]
+
+    model = RandomForestClassifier(**{**params, 'n_jobs': 1})
+    model.fit(X[train_idx], y_train)
+
+    if len(model.classes_) < 2:
+        probs = np.full(len(valid_idx), float(model.classes_[0]))
+    else:
+        probs = model.predict_proba(X[valid_idx])[:, 1]
+    preds = (probs >= 0.5).astype(int)
+
+    metrics = {
+        'train_rows': int(len(train_idx)),
+        'valid_rows': int(len(valid_idx)),
+        'valid_churn_rate': float(y_valid.mean()) if len(y_valid) else 0.0,
+        'precision': float(precision_score(y_valid, preds, zero_division=0)),
+        'recall': float(recall_score(y_valid, preds, zero_division=0)),
+    }
+    metrics['auc'] = float(roc_auc_score(y_valid, probs)) if len(np.unique(y_valid)) == 2 else None
+    return metrics
+
+
+class ChurnTrainer:
+    def __init__(self, predictor, cache_root='../data/features', model_dir='../models',
+                 n_estimators=100, n_folds=3, max_workers=None, growth_step=20,
+                 max_estimators=400, snapshot_cutoffs=None, snapshot_builder=None):
+        self.predictor = predictor
+        self.cache_root = cache_root
+        self.model_dir = model_dir
+        self.n_estimators = n_estimators
+        self.n_folds = n_folds
+        self.max_workers = max_workers
+        self.growth_step = growth_step
+        self.max_estimators = max_estimators
+        # Train from precomputed point-in-time snapshots instead of the live query
+        self.snapshot_cutoffs = snapshot_cutoffs
+        self.snapshot_builder = snapshot_builder
+        if snapshot_cutoffs is not None and snapshot_builder is None:
+            from training_snapshots import SnapshotBuilder
+            self.snapshot_builder = SnapshotBuilder(predictor.db_path)
+
+    def model_params(self):
+        """Random forest parameters shared by the final model and validation folds."""
+        return {'n_estimators': self.n_estimators, 'random_state': 42, 'n_jobs': -1}
+
+    def feature_store_version(self, scaler=None):
+        """Version key for the cached feature matrix."""
+        from churn_predictor import FEATURE_COLS, FEATURE_QUERY
+
+        digest = hashlib.sha256()
+        digest.update(FEATURE_QUERY.encode())
+        digest.update(','.join(FEATURE_COLS).encode())
+        if self.snapshot_cutoffs is not None:
+            digest.update(self.snapshot_builder.fingerprint(self.snapshot_cutoffs).encode())
+        else:
+            db_path = current_snapshot(self.predictor.db_path) or self.predictor.db_path
+            digest.update(_file_fingerprint(db_path).encode())
+            # Labels depend on CURRENT_DATE, so a cached matrix is only valid for one day
+            digest.update(datetime.now().strftime('%Y-%m-%d').encode())
+        if scaler is not None:
+            digest.update(hashlib.sha256(pickle.dumps(scaler)).digest())
+        return digest.hexdigest()[:16]
+
+    @traced('churn.feature_matrix')
+    def build_feature_matrix(self, scaler=None):
+        """Extract, scale and cache the feature matrix as memory-mapped .npy files.
+
+        When ``scaler`` is given it is reused as-is (incremental training must keep
+        the scaling the existing trees were grown on); otherwise a new scaler is fit.
+        """
+        from churn_predictor import FEATURE_COLS
+
+        if self.snapshot_cutoffs is not None:
+            self.snapshot_builder.build(self.snapshot_cutoffs)
+
+        if scaler is not None:
+            # The matrix from the last full training was scaled with this same scaler
+            fitted_dir = os.path.join(self.cache_root, self.feature_store_version())
+            if os.path.exists(os.path.join(fitted_dir, 'manifest.json')):
+                cached = joblib.load(os.path.join(fitted_dir, 'scaler.pkl'))
+                if pickle.dumps(cached) == pickle.dumps(scaler):
+                    return fitted_dir
+
+        version = self.feature_store_version(scaler)
+        cache_dir = os.path.join(self.cache_root, version)
+        if os.path.exists(os.path.join(cache_dir, 'manifest.json')):
+            return cache_dir
+
+        df = self.load_training_frame()
+        if scaler is None:
+            scaler = StandardScaler()
+            X = scaler.fit_transform(df[FEATURE_COLS])
+        else:
+            X = scaler.transform(df[FEATURE_COLS])
+
+        # Time ordering for validation folds: snapshot cutoff, else oldest contracts first
+        time_col = 'cutoff' if 'cutoff' in df.columns else 'contract_start_date'
+        times = df[time_col].astype('datetime64[ns]').values.astype('int64')
+        order = np.argsort(times, kind='stable')
+
+        tmp_dir = cache_dir + '.tmp'
+        os.makedirs(tmp_dir, exist_ok=True)
+        np.save(os.path.join(tmp_dir, 'X.npy'), np.ascontiguousarray(X, dtype=np.float32))
+        np.save(os.path.join(tmp_dir, 'y.npy'), df['churned'].to_numpy(dtype=np.int8))
+        np.save(os.path.join(tmp_dir, 'order.npy'), order)
+        np.save(os.path.join(tmp_dir, 'customer_ids.npy'), df['customer_id'].to_numpy(dtype=str))
+        joblib.dump(scaler, os.path.join(tmp_dir, 'scaler.pkl'))
+        with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+            json.dump({'version': version, 'rows': len(df), 'feature_cols': FEATURE_COLS,
+                       'created_at': datetime.now().isoformat()}, f, indent=2)
+        os.replace(tmp_dir, cache_dir)
+        return cache_dir
+
+    def load_training_frame(self):
+        """Training rows from snapshots when configured, otherwise the live feature query."""
+        if self.snapshot_cutoffs is None:
+            return self.predictor.extract_features()
+        return self.snapshot_builder.load(self.snapshot_cutoffs)
+
+    def load_feature_matrix(self, cache_dir):
+        """Load a cached feature matrix without copying it into memory."""
+        X = np.load(os.path.join(cache_dir, 'X.npy'), mmap_mode='r')
+        y = np.load(os.path.join(cache_dir, 'y.npy'), mmap_mode='r')
+        scaler = joblib.load(os.path.join(cache_dir, 'scaler.pkl'))
+        return X, y, scaler
+
+    @traced('churn.validate')
+    def validate(self, cache_dir, n_rows):
+        """Run expanding-window time-based validation folds in a process pool."""
+        if self.n_folds < 1 or n_rows < (self.n_folds + 1) * 10:
+            return []
+
+        fold_size = n_rows // (self.n_folds + 1)
+        bounds = [(fold_size * (k + 1), fold_size * (k + 2) if k < self.n_folds - 1 else n_rows)
+                  for k in range(self.n_folds)]
+        params = self.model_params()
+        with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [pool.submit(_fit_fold, cache_dir, train_end, valid_end, params)
+                       for train_end, valid_end in bounds]
+            return [future.result() for future in futures]
+
+    def train(self, incremental=False):
+        """Train the churn model, fully or by growing the existing forest."""
+        started = time.perf_counter()
+        existing = self.load_existing() if incremental else None
+        if existing is not None and existing[0].n_estimators + self.growth_step > self.max_estimators:
+            existing = None
+
+        cache_dir = self.build_feature_matrix(existing[1] if existing is not None else None)
+        X, y, scaler = self.load_feature_matrix(cache_dir)
+
+        if existing is not None:
+            model = existing[0]
+            # The scaler (and the matrix it was fit on) carries over from the last full training
+            scaler_version = existing[2].get('scaler_feature_version', existing[2].get('feature_store_version'))
+            model.set_params(warm_start=True, n_jobs=-1,
+                             n_estimators=model.n_estimators + self.growth_step)
+            model.fit(X, y)
+            mode = 'incremental'
+            folds = []
+        else:
+            folds = self.validate(cache_dir, len(y))
+            model = RandomForestClassifier(**self.model_params())
+            model.fit(X, y)
+            mode = 'full'
+            scaler_version = os.path.basename(cache_dir)
+
+        metadata = {
+            'mode': mode,
+            'feature_store_version': os.path.basename(cache_dir),
+            'scaler_feature_version': scaler_version,
+            'trained_at': datetime.now().isoformat(),
+            'training_rows': int(len(y)),
+            'churn_rate': float(np.mean(y)) if len(y) else 0.0,
+            'n_estimators': int(model.n_estimators),
+            'training_seconds': round(time.perf_counter() - started, 3),
+            'validation_folds': folds,
+        }
+        self.save(model, scaler, metadata)
+        self.prune_feature_store({metadata['feature_store_version'], scaler_version})
+        return model, scaler, metadata
+
+    def prune_feature_store(self, keep):
+        """Delete cached feature matrices other than the versions in ``keep``.
+
+        Versions change daily, so without this every retrain leaves a
+        full-size X/y behind. In-progress builds (``.tmp``) are left alone.
+        """
+        import shutil
+
+        if not os.path.isdir(self.cache_root):
+            return []
+        removed = []
+        for name in os.listdir(self.cache_root):
+            path = os.path.join(self.cache_root, name)
+            if name in keep or name.endswith('.tmp') or not os.path.isdir(path):
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(name)
+        return removed
+
+    def load_existing(self):
+        """Load a private, writable copy of the current model, scaler and metadata, if any."""
+        from churn_predictor import FEATURE_COLS
+        from model_registry import ModelRegistry
+
+        registry = ModelRegistry(self.model_dir)
+        if registry.current_version() is None:
+            return None
+        loaded = registry.load(feature_cols=FEATURE_COLS, mmap_mode=None)
+        return loaded.model, loaded.scaler, loaded.manifest.get('metadata', {})
+
+    def save(self, model, scaler, metadata):
+        """Register model, scaler and metadata as a new version."""
+        from batch_scoring import FlatForest
+        from churn_predictor import FEATURE_COLS
+        from model_registry import ModelRegistry, clear_cache
+
+        model.set_params(warm_start=False)
+        metadata['registry_version'] = ModelRegistry(self.model_dir).register(
+            model, scaler, FEATURE_COLS, metadata,
+            extra_artifacts=FlatForest.from_sklearn(model).artifact_writers())
+        clear_cache()
+
+
+def main():
+    import sys
+    from churn_predictor import ChurnPredictor
+
+    trainer = ChurnTrainer(ChurnPredictor())
+    _, _, metadata = trainer.train(incremental='--incremental' in sys.argv)
+    print(f"Model {metadata['registry_version']} trained ({metadata['mode']}) on {metadata['training_rows']} customers "
+          f"in {metadata['training_seconds']:.1f}s")
+    for i, fold in enumerate(metadata['validation_folds'], 1):
+        auc = f"{fold['auc']:.3f}" if fold['auc'] is not None else "n/a"
+        print(f"  Fold {i}: AUC {auc}, precision {fold['precision']:.3f}, recall {fold['recall']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
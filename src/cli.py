@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""Single entry point for the pipeline: ``python src/cli.py <command> [args]``.
+
+Only the standard library is imported at startup; each command imports the
+pipeline modules it needs when it runs, so quick lookups never pay for
+pandas, sklearn or duckdb. Paths come from config/pipeline_config.json
+(or PIPELINE_CONFIG), resolved against the repo root, so the CLI behaves the
+same from any working directory. --timings reports where the time went.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import importlib
+from contextlib import contextmanager
+
+_STARTED = time.perf_counter()
+_timings = {'import_ms': 0.0}
+
+CLI_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CONFIG = os.path.join(CLI_DIR, '..', 'config', 'pipeline_config.json')
+
+# Same rule as customer_dim.ID_PATTERN, repeated so lookups stay stdlib-only
+ID_PATTERN = re.compile(r'^\s*([A-Za-z]+)[\s_-]*0*(\d+)\s*$')
+
+
+def load_config(path=None):
+    """Absolute paths keyed as in the config's "paths" section (plus "root")."""
+    path = os.path.abspath(path or os.environ.get('PIPELINE_CONFIG') or DEFAULT_CONFIG)
+    with open(path) as f:
+        config = json.load(f)
+    root = os.path.normpath(os.path.join(os.path.dirname(path), config.get('root', '..')))
+    paths = {name: os.path.normpath(os.path.join(root, value)) for name, value in config['paths'].items()}
+    paths['root'] = root
+    return paths
+
+
+def _load(name):
+    """Import a pipeline module, adding the time taken to the import total."""
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    _timings['import_ms'] += (time.perf_counter() - started) * 1000
+    return module
+
+
+@contextmanager
+def _working_dir(path):
+    """Run modules that still build '../data' paths from their own directory."""
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def normalize_customer_id(value):
+    match = ID_PATTERN.match(value)
+    if match is None:
+        return value.strip()
+    return f"{match.group(1).upper()}_{int(match.group(2)):03d}"
+
+
+def cmd_paths(paths, args):
+    for name, value in sorted(paths.items()):
+        print(f"{name:<16} {value}")
+
+
+def cmd_customer(paths, args):
+    """Latest health scores for one customer, falling back to the raw customer record."""
+    import csv
+
+    wanted = normalize_customer_id(args.customer_id)
+    sources = [os.path.join(paths['processed_dir'], 'customer_health_scores_latest.csv'),
+               os.path.join(paths['raw_dir'], 'customers.csv')]
+    for source in sources:
+        if not os.path.exists(source):
+            continue
+        with open(source, newline='') as f:
+            for row in csv.DictReader(f):
+                if normalize_customer_id(row.get('customer_id', '')) == wanted:
+                    print(f"{wanted} ({os.path.basename(source)})")
+                    for key, value in row.items():
+                        print(f"  {key:<32} {value}")
+                    return 0
+    print(f"Customer {wanted} not found")
+    return 1
+
+
+def cmd_dashboard(paths, args):
+    _load('simple_dashboard').calculate_simple_metrics(paths['raw_dir'])
+
+
+def cmd_insights(paths, args):
+    insights = _load('dashboard_insights')
+    insights.print_dashboard(insights.generate_executive_dashboard(
+        paths['raw_dir'], paths['processed_dir'], paths['revenue_ledger']))
+
+
+def cmd_load(paths, args):
+    _load('load').load_to_processed(paths['raw_dir'], paths['processed_dir'],
+                                    paths['revenue_ledger'], paths['customer_dim'])
+
+
+def _predictor(paths):
+    return _load('churn_predictor').ChurnPredictor(paths['dbt_db'], paths['models_dir'], paths['feature_cache'])
+
+
+def cmd_churn(paths, args):
+    predictor = _predictor(paths)
+    if args.action == 'train':
+        predictor.train_model(incremental=args.incremental)
+        return
+    if args.action == 'segments':
+        _load('segmented_churn').train_and_register(predictor, args.segment_col)
+        return
+    predictions = predictor.predict_churn()
+    output = os.path.join(paths['processed_dir'], 'churn_predictions.csv')
+    predictions.to_csv(output, index=False)
+    print(f"Predictions saved for {len(predictions)} customers to {output}")
+
+
+def cmd_alerts(paths, args):
+    alerts = _load('alert_system').AlertSystem(paths['alert_config'], predictor=_predictor(paths))
+    alerts.config.setdefault('revenue_ledger_path', paths['revenue_ledger'])
+    alerts.config.setdefault('alerts_path', paths['alerts_csv'])
+    alerts.config.setdefault('window_dir', paths['window_dir'])
+    alerts.config.setdefault('anomaly_dir', paths['anomaly_dir'])
+    alerts.config.setdefault('customer_dim_path', paths['customer_dim'])
+    alerts.run_alert_check()
+
+
+def cmd_ml(paths, args):
+    with _working_dir(paths['src_dir']):
+        pipeline = _load('run_ml_pipeline')
+        if args.schedule:
+            pipeline.run_scheduler()
+        else:
+            pipeline.run_daily_ml_pipeline()
+
+
+def cmd_run(paths, args):
+    """Run any src module as if it were invoked as a script from src/."""
+    import runpy
+
+    with _working_dir(paths['src_dir']):
+        sys.argv = [os.path.join(paths['src_dir'], f"{args.module}.py")] + args.args
+        runpy.run_module(args.module, run_name='__main__')
+
+
+def cmd_script(paths, args):
+    """Run one of scripts/*.py from the repo root, where those scripts expect to be."""
+    import runpy
+
+    script = os.path.join(paths['scripts_dir'], f"{args.name}.py")
+    if not os.path.exists(script):
+        print(f"No such script: {script}")
+        return 1
+    with _working_dir(paths['root']):
+        sys.argv = [script] + args.args
+        runpy.run_path(script, run_name='__main__')
+
+
+def build_parser():
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='cli.py', description='Customer health pipeline commands.')
+    parser.add_argument('--config', help='pipeline config (default: config/pipeline_config.json)')
+    parser.add_argument('--timings', action='store_true', help='report startup, import and run time on stderr')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('paths', help='show the resolved paths').set_defaults(handler=cmd_paths)
+
+    customer = commands.add_parser('customer', help='look up one customer')
+    customer.add_argument('customer_id')
+    customer.set_defaults(handler=cmd_customer)
+
+    commands.add_parser('dashboard', help='console dashboard from the raw CSVs').set_defaults(handler=cmd_dashboard)
+    commands.add_parser('insights', help='executive dashboard insights').set_defaults(handler=cmd_insights)
+    commands.add_parser('load', help='score customers and write processed CSVs').set_defaults(handler=cmd_load)
+
+    churn = commands.add_parser('churn', help='train the churn model (or per-segment models) or score customers')
+    churn.add_argument('action', choices=['train', 'predict', 'segments'])
+    churn.add_argument('--incremental', action='store_true')
+    churn.add_argument('--segment-col', default='industry', help='customers column to segment by (segments)')
+    churn.set_defaults(handler=cmd_churn)
+
+    commands.add_parser('alerts', help='run the alert check').set_defaults(handler=cmd_alerts)
+
+    ml = commands.add_parser('ml', help='run the daily ML pipeline')
+    ml.add_argument('--schedule', action='store_true', help='run daily at 08:00 instead of once')
+    ml.set_defaults(handler=cmd_ml)
+
+    run = commands.add_parser('run', help='run a src module (e.g. health_backfill, olap_cube)')
+    run.add_argument('module')
+    run.add_argument('args', nargs=argparse.REMAINDER)
+    run.set_defaults(handler=cmd_run)
+
+    script = commands.add_parser('script', help='run a scripts/ entry point (e.g. run_dbt, benchmark)')
+    script.add_argument('name')
+    script.add_argument('args', nargs=argparse.REMAINDER)
+    script.set_defaults(handler=cmd_script)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    paths = load_config(args.config)
+    ready = time.perf_counter()
+    modules_before = len(sys.modules)
+    try:
+        status = args.handler(paths, args)
+    finally:
+        if args.timings:
+            finished = time.perf_counter()
+            print(f"startup {(ready - _STARTED) * 1000:.1f} ms, "
+                  f"imports {_timings['import_ms']:.1f} ms ({len(sys.modules) - modules_before} modules), "
+                  f"run {(finished - ready) * 1000 - _timings['import_ms']:.1f} ms", file=sys.stderr)
+    return status or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,37 +1,48 @@
-import pandas as pd
 import numpy as np
+from customer_dim import CustomerDimension
+from instrumentation import traced, count
 
-def calculate_comprehensive_health_score():
-    """Calculate comprehensive customer health score using 7 key metrics"""
+@traced('transform.comprehensive_health_score')
+def calculate_comprehensive_health_score(inputs=None, dim=None):
+    """Calculate comprehensive customer health score using 7 key metrics
+    
+    ``inputs`` are frames keyed as in transform.HEALTH_INPUTS (the current
+    raw CSVs by default).
+    """
     
     # Load data
-    tickets = pd.read_csv('../data/raw/support_tickets.csv')
-    incidents = pd.read_csv('../data/raw/security_incidents.csv')
-    feedback = pd.read_csv('../data/raw/customer_feedback.csv')
-    customers = pd.read_csv('../data/raw/customers.csv')
+    if inputs is None:
+        from transform import load_health_inputs
+        inputs = load_health_inputs()
+    tickets = inputs['tickets']
+    incidents = inputs['incidents']
+    feedback = inputs['feedback']
+    customers = inputs['customers'].copy()
     
-    # Aggregate by customer
-    metrics = customers[['customer_id', 'company_name']].copy()
+    # Aggregate by customer on integer surrogate keys
+    dim = dim if dim is not None else CustomerDimension()
+    customers['customer_key'] = dim.register(customers['customer_id'])
+    metrics = customers[['customer_key', 'customer_id', 'company_name']].copy()
     
     # Support metrics
-    support = tickets.groupby('customer_id').agg({
-        'resolution_time_hours': 'mean',
-        'ticket_id': 'count',
-        'escalated': 'sum'
+    support = dim.aggregate_frame(tickets, {
+        'resolution_time_hours': ('resolution_time_hours', 'mean'),
+        'ticket_id': ('ticket_id', 'count'),
+        'escalated': ('escalated', 'sum')
     })
     support['backlog'] = support['ticket_id'] - support['escalated']
     support['sla_adherence'] = 100 - (support['escalated'] / support['ticket_id'] * 100)
     
     # Security metrics  
-    security = incidents.groupby('customer_id').size().reset_index(name='incident_volume')
+    security = dim.aggregate_frame(incidents, {'incident_volume': (None, 'size')})
     
     # Feedback metrics
-    sentiment = feedback.groupby('customer_id')['nps_score'].mean()
+    sentiment = dim.aggregate_frame(feedback, {'sentiment': ('nps_score', 'mean')})
     
     # Merge all metrics
-    metrics = metrics.merge(support[['resolution_time_hours', 'backlog', 'sla_adherence']], on='customer_id', how='left')
-    metrics = metrics.merge(security, on='customer_id', how='left')
-    metrics = metrics.merge(sentiment.rename('sentiment'), on='customer_id', how='left')
+    metrics = metrics.merge(support[['resolution_time_hours', 'backlog', 'sla_adherence']], on='customer_key', how='left')
+    metrics = metrics.merge(security, on='customer_key', how='left')
+    metrics = metrics.merge(sentiment, on='customer_key', how='left')
     metrics = metrics.fillna(0)
     
     # Normalize metrics (0-100 scale)
@@ -49,6 +60,7 @@ def calculate_comprehensive_health_score():
         metrics['sla_adherence'] * 0.30              # SLA adherence (includes ticket resolution time)
     ).clip(0, 100)
     
+    count(rows=len(metrics))
     return metrics[['customer_id', 'company_name', 'comprehensive_health_score']]
 
 if __name__ == "__main__":
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""Customer dimension: normalized customer ids mapped to dense int32 surrogate keys."""
+
+import os
+import fcntl
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+ID_PATTERN = r'^\s*([A-Za-z]+)[\s_-]*0*(\d+)\s*$'
+
+# Same rule as normalize_customer_ids, for use inside DuckDB/dbt SQL
+NORMALIZE_SQL = (
+    "CASE WHEN regexp_matches({col}, '{pattern}') "
+    "THEN printf('%s_%03d', upper(regexp_extract({col}, '{pattern}', 1)), "
+    "CAST(regexp_extract({col}, '{pattern}', 2) AS BIGINT)) "
+    "ELSE trim({col}) END"
+)
+
+
+def normalize_sql(col):
+    """SQL expression normalizing the customer id column ``col``."""
+    return NORMALIZE_SQL.format(col=col, pattern=ID_PATTERN.replace("'", "''"))
+
+
+def normalize_customer_ids(ids):
+    """Canonical form of each id: 'CUST001', 'cust-1' and 'CUST_001' all become 'CUST_001'."""
+    ids = pd.Series(ids, dtype='category') if not isinstance(ids, pd.Series) else ids.astype('category')
+    # Normalize each distinct id once and broadcast through the category codes
+    categories = ids.cat.categories.astype(str)
+    parts = categories.str.extract(ID_PATTERN)
+    numbers = pd.to_numeric(parts[1], errors='coerce')
+    canonical = parts[0].str.upper() + '_' + numbers.map(lambda n: f"{int(n):03d}" if n == n else '')
+    canonical = canonical.where(numbers.notna(), pd.Series(categories.str.strip(), index=canonical.index))
+    lookup = canonical.to_numpy(dtype=object)
+    codes = ids.cat.codes.to_numpy()
+    return np.where(codes >= 0, lookup[codes], None)
+
+
+class CustomerDimension:
+    """Dense 0..n-1 int32 keys for customers, persisted so keys are stable across runs and stages."""
+
+    def __init__(self, path='../data/dimensions/customer_dim.csv'):
+        # path=None keeps the dimension in memory only
+        self.path = path
+        self.customer_ids = self._read()
+        self._index = pd.Index(self.customer_ids)
+
+    def __len__(self):
+        return len(self.customer_ids)
+
+    def _read(self):
+        if self.path and os.path.exists(self.path):
+            dim = pd.read_csv(self.path, dtype={'customer_id': str})
+            return dim.sort_values('customer_key')['customer_id'].to_numpy(dtype=object)
+        return np.empty(0, dtype=object)
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock on the dimension file, held across re-read, merge and write."""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # Per-process temp name so concurrent writers never share a partial file
+        tmp_path = f"{self.path}.tmp-{os.getpid()}"
+        pd.DataFrame({'customer_key': np.arange(len(self), dtype=np.int32),
+                      'customer_id': self.customer_ids}).to_csv(tmp_path, index=False)
+        os.replace(tmp_path, self.path)
+
+    def _append(self, ids):
+        new = pd.Index(ids).difference(self._index).sort_values()
+        if len(new):
+            self.customer_ids = np.concatenate([self.customer_ids, new.to_numpy(dtype=object)])
+            self._index = pd.Index(self.customer_ids)
+        return len(new)
+
+    def register(self, ids, save=True):
+        """Assign keys to ids not seen before (in sorted order); returns keys for all ``ids``.
+
+        Many processes register ids (loads, scoring, the window and anomaly
+        stores), and key-indexed state on disk depends on a key never being
+        reused. So new ids are merged under a file lock into whatever the file
+        holds by then, never into this process's possibly stale copy.
+        """
+        normalized = normalize_customer_ids(ids)
+        wanted = pd.unique(normalized[pd.notna(normalized)])
+        if len(pd.Index(wanted).difference(self._index)):
+            if save and self.path:
+                with self._locked():
+                    # Keys are append-only, so the file always extends what this process has
+                    self.customer_ids = self._read()
+                    self._index = pd.Index(self.customer_ids)
+                    if self._append(wanted):
+                        self.save()
+            else:
+                self._append(wanted)
+        return self._index.get_indexer(normalized).astype(np.int32)
+
+    def keys(self, ids):
+        """int32 key of each id (normalized first); -1 for customers not in the dimension."""
+        return self._index.get_indexer(normalize_customer_ids(ids)).astype(np.int32)
+
+    def ids(self, keys):
+        """Canonical customer ids for an array of keys."""
+        return self.customer_ids[np.asarray(keys)]
+
+    def aggregate(self, keys, values=None, how='sum'):
+        """Per-customer aggregate as an array indexed by customer key.
+
+        ``how`` is 'size' (rows), 'count' (non-null values), 'sum', 'mean', 'min'
+        or 'max'; NaNs are skipped like pandas does. Rows with key -1 are ignored.
+        Customers with no rows get 0 for size/count/sum and NaN otherwise.
+        """
+        # bincount wants intp keys; converting once here avoids a copy per call
+        keys = np.asarray(keys, dtype=np.intp)
+        n = len(self)
+        invalid = keys < 0
+        if how == 'size':
+            return np.bincount(keys[~invalid] if invalid.any() else keys, minlength=n)
+
+        values = _as_float(values)
+        invalid |= np.isnan(values)
+        if invalid.any():
+            keys, values = keys[~invalid], values[~invalid]
+        if how == 'count':
+            return np.bincount(keys, minlength=n)
+        if how == 'sum':
+            return np.bincount(keys, weights=values, minlength=n)
+        if how == 'mean':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return np.bincount(keys, weights=values, minlength=n) / np.bincount(keys, minlength=n)
+        if how in ('min', 'max'):
+            result = np.full(n, np.nan)
+            if len(keys):
+                order = np.argsort(keys, kind='stable')
+                sorted_keys = keys[order]
+                starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+                ufunc = np.minimum if how == 'min' else np.maximum
+                result[sorted_keys[starts]] = ufunc.reduceat(values[order], starts)
+            return result
+        raise ValueError(f"unknown aggregation {how!r}")
+
+    def aggregate_frame(self, df, aggs, key_col='customer_key'):
+        """Groupby replacement: ``{out_col: (col, how)}`` -> frame indexed by customer_key.
+
+        Like ``df.groupby('customer_id').agg(...)``, only customers that have
+        rows in ``df`` are returned. Keys are looked up from ``customer_id`` if
+        ``df`` has no ``key_col``.
+        """
+        keys = df[key_col].to_numpy() if key_col in df else self.keys(df['customer_id'])
+        keys = keys.astype(np.intp, copy=False)
+        sizes = self.aggregate(keys, how='size')
+        present = np.flatnonzero(sizes)
+        result = pd.DataFrame(index=pd.Index(present.astype(np.int32), name='customer_key'))
+        for out_col, (col, how) in aggs.items():
+            values = None if how == 'size' else df[col]
+            if how == 'count' and not _is_numeric(values):
+                values = values.notna()
+                how = 'sum'
+            result[out_col] = self.aggregate(keys, values, how)[present]
+        return result
+
+
+def _is_numeric(series):
+    return pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series)
+
+
+def _as_float(values):
+    if isinstance(values, pd.Series):
+        return values.to_numpy(dtype=np.float64, na_value=np.nan)
+    return np.asarray(values, dtype=np.float64)
+
+
+def benchmark(n_rows=5000000, n_customers=50000, seed=0):
+    """Seconds for a per-customer mean/sum/size: string groupby vs int key bincount."""
+    import time
+
+    rng = np.random.default_rng(seed)
+    ids = np.array([f"CUST_{i:05d}" for i in range(n_customers)], dtype=object)
+    df = pd.DataFrame({'customer_id': ids[rng.integers(0, n_customers, n_rows)],
+                       'resolution_time_hours': rng.uniform(1, 72, n_rows),
+                       'escalated': rng.random(n_rows) < 0.2})
+    dim = CustomerDimension(path=None)
+    dim.register(ids)
+    df['customer_key'] = dim.keys(df['customer_id'])
+
+    started = time.perf_counter()
+    df.groupby('customer_id').agg(mean_hours=('resolution_time_hours', 'mean'),
+                                  escalations=('escalated', 'sum'), tickets=('customer_id', 'size'))
+    groupby_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    dim.aggregate_frame(df, {'mean_hours': ('resolution_time_hours', 'mean'),
+                             'escalations': ('escalated', 'sum'), 'tickets': (None, 'size')})
+    bincount_seconds = time.perf_counter() - started
+    return {'rows': n_rows, 'customers': n_customers,
+            'groupby_seconds': groupby_seconds, 'bincount_seconds': bincount_seconds}
+
+
+def main():
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == '--benchmark':
+        n_rows = int(sys.argv[2]) if len(sys.argv) > 2 else 5000000
+        results = benchmark(n_rows)
+        print(f"Aggregated {results['rows']:,} rows over {results['customers']:,} customers")
+        print(f"  string groupby:   {results['groupby_seconds'] * 1000:.0f} ms")
+        print(f"  int key bincount: {results['bincount_seconds'] * 1000:.0f} ms")
+        return
+
+    dim = CustomerDimension()
+    dim.register(pd.read_csv('../data/raw/customers.csv', usecols=['customer_id'])['customer_id'])
+    print(f"Customer dimension: {len(dim)} customers in {dim.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,25 @@
+import os
 import pandas as pd
 import numpy as np
 
-def generate_executive_dashboard():
+def _raw_metrics(raw_dir, filename, aggregates):
+    """One row of aggregates over a raw CSV, from the shared query cache."""
+    from query_cache import get_cache
+    
+    path = os.path.join(raw_dir, filename).replace("'", "''")
+    table = get_cache().query(f"SELECT {aggregates} FROM read_csv_auto('{path}')", label=filename)
+    return table.to_pylist()[0]
+
+def generate_executive_dashboard(raw_dir='../data/raw', processed_dir='../data/processed',
+                                 ledger_path='../data/revenue_ledger.duckdb'):
     """Generate key insights for executive dashboard"""
     
     # Load processed data
     try:
-        health_data = pd.read_csv('../data/processed/customer_health_scores_latest.csv')
+        health_data = pd.read_csv(f'{processed_dir}/customer_health_scores_latest.csv')
     except:
         from load import load_to_processed
-        health_data = load_to_processed()
+        health_data = load_to_processed(raw_dir, processed_dir, ledger_path)
     
     insights = {}
     
@@ -19,28 +29,34 @@ def generate_executive_dashboard():
     insights['at_risk_customers'] = len(health_data[health_data['health_category'] == 'At Risk'])
     insights['champion_customers'] = len(health_data[health_data['health_category'] == 'Champion'])
     
-    # Revenue at Risk
-    at_risk_revenue = health_data[health_data['health_category'] == 'At Risk']['monthly_recurring_revenue'].sum()
-    total_revenue = health_data['monthly_recurring_revenue'].sum()
+    # Revenue at Risk: the ledger's maintained rollup when built, else the static MRR column
+    if os.path.exists(ledger_path):
+        from revenue_ledger import RevenueLedger
+        ledger = RevenueLedger(ledger_path, read_only=True)
+        at_risk_revenue, total_revenue = (round(v) for v in ledger.revenue_at_risk('At Risk'))
+        ledger.close()
+    else:
+        at_risk_revenue = health_data[health_data['health_category'] == 'At Risk']['monthly_recurring_revenue'].sum()
+        total_revenue = health_data['monthly_recurring_revenue'].sum()
     insights['revenue_at_risk'] = at_risk_revenue
     insights['revenue_at_risk_pct'] = (at_risk_revenue / total_revenue) * 100
     
-    # Support Metrics
-    tickets_df = pd.read_csv('../data/raw/support_tickets.csv')
-    insights['avg_resolution_time'] = tickets_df['resolution_time_hours'].mean()
-    insights['escalation_rate'] = (tickets_df['escalated'].sum() / len(tickets_df)) * 100
-    insights['avg_satisfaction'] = tickets_df['satisfaction_score'].mean()
+    # Raw-data metrics are aggregated in DuckDB and reused until the CSV changes
+    insights.update(_raw_metrics(raw_dir, 'support_tickets.csv', """
+        avg(resolution_time_hours) AS avg_resolution_time,
+        sum(escalated::BOOLEAN::INTEGER) / count(*) * 100 AS escalation_rate,
+        avg(satisfaction_score) AS avg_satisfaction"""))
     
     # Security Metrics
-    incidents_df = pd.read_csv('../data/raw/security_incidents.csv')
-    insights['avg_detection_time'] = incidents_df['mean_time_to_detect_minutes'].mean()
-    insights['avg_response_time'] = incidents_df['mean_time_to_respond_minutes'].mean()
-    insights['false_positive_rate'] = (incidents_df['false_positive'].sum() / len(incidents_df)) * 100
+    insights.update(_raw_metrics(raw_dir, 'security_incidents.csv', """
+        avg(mean_time_to_detect_minutes) AS avg_detection_time,
+        avg(mean_time_to_respond_minutes) AS avg_response_time,
+        sum(false_positive::BOOLEAN::INTEGER) / count(*) * 100 AS false_positive_rate"""))
     
     # Product Usage
-    usage_df = pd.read_csv('../data/raw/product_usage.csv')
-    insights['avg_feature_adoption'] = usage_df['feature_adoption_score'].mean()
-    insights['avg_license_utilization'] = usage_df['license_utilization_pct'].mean()
+    insights.update(_raw_metrics(raw_dir, 'product_usage.csv', """
+        avg(feature_adoption_score) AS avg_feature_adoption,
+        avg(license_utilization_pct) AS avg_license_utilization"""))
     
     return insights
 
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""Incremental data-quality and feature-drift monitoring in a single pass per table."""
+
+import os
+import glob
+import json
+from datetime import datetime, timedelta
+import duckdb
+import numpy as np
+import pandas as pd
+from db_snapshots import connect_reader
+
+MONITORS = {
+    'stg_security_incidents': {
+        'db_path': '../data/cybersec_health_dbt.duckdb',
+        'table': 'stg_security_incidents',
+        'timestamp_col': 'incident_timestamp',
+        'key_cols': ['customer_id', 'incident_timestamp', 'source_ip', 'attack_type'],
+        'required_cols': ['customer_id', 'attack_type', 'severity_level'],
+        'ranges': {'anomaly_score': [0, 100]},
+        'freshness_days': 7,
+    },
+    'churn_snapshots': {
+        'parquet_glob': '../data/snapshots/cutoff=*/part-0.parquet',
+        'required_cols': ['customer_id'],
+        'ranges': {'avg_nps': [0, 10], 'avg_license_util': [0, 1], 'avg_adoption_rate': [0, 1]},
+        'drift_cols': [
+            'contract_value', 'ticket_count', 'avg_resolution_time', 'avg_satisfaction',
+            'incident_count', 'avg_severity', 'avg_daily_users', 'avg_adoption_rate',
+            'avg_license_util', 'avg_nps', 'avg_rating', 'renewal_soon'
+        ],
+    },
+}
+
+THRESHOLDS = {
+    'max_null_fraction': 0.0,
+    'max_range_violations': 0,
+    'max_duplicates': 0,
+    'max_psi': 0.2,
+}
+
+
+class DataQualityError(Exception):
+    """Raised when a data-quality report does not pass its gate."""
+
+
+def key_hashes(df, key_cols):
+    """64-bit hash of each row's natural key."""
+    return pd.util.hash_pandas_object(df[key_cols], index=False).to_numpy(dtype=np.uint64)
+
+
+def _ident(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def population_stability_index(expected, actual, eps=1e-6):
+    """PSI between two histograms over the same bins."""
+    expected = np.asarray(expected, dtype=np.float64)
+    actual = np.asarray(actual, dtype=np.float64)
+    if expected.sum() == 0 or actual.sum() == 0:
+        return 0.0
+    e = np.clip(expected / expected.sum(), eps, None)
+    a = np.clip(actual / actual.sum(), eps, None)
+    return float(np.sum((a - e) * np.log(a / e)))
+
+
+def histogram_edges(values, bins=10):
+    """Quantile bin edges for a reference distribution (open-ended at both sides)."""
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return [-np.inf, np.inf]
+    inner = np.unique(np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1]))
+    return [-np.inf] + inner.tolist() + [np.inf]
+
+
+class ScanState:
+    """Running totals for one monitored table, updated chunk by chunk."""
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.rows = state.get('rows', 0)
+        self.nulls = state.get('nulls', {})
+        self.range_violations = state.get('range_violations', {})
+        self.duplicates = state.get('duplicates', 0)
+        self.histograms = state.get('histograms', {})
+        self.max_timestamp = state.get('max_timestamp')
+        self.watermark = state.get('watermark')
+        self.partitions = state.get('partitions', {})
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    def merge(self, other):
+        """Fold another (newer) scan's counters into this one."""
+        self.rows += other.rows
+        for name in ('nulls', 'range_violations'):
+            totals = getattr(self, name)
+            for col, count in getattr(other, name).items():
+                totals[col] = totals.get(col, 0) + count
+        self.duplicates += other.duplicates
+        for col, counts in other.histograms.items():
+            previous = self.histograms.get(col, [0] * len(counts))
+            self.histograms[col] = (np.asarray(previous) + counts).tolist()
+        if other.watermark is not None:
+            self.watermark = other.watermark
+        if other.max_timestamp is not None:
+            self.max_timestamp = other.max_timestamp
+        self.partitions.update(other.partitions)
+
+
+class DataQualityMonitor:
+    def __init__(self, monitors=None, state_dir='../data/quality', thresholds=None, chunk_vectors=100):
+        self.monitors = monitors or MONITORS
+        self.state_dir = state_dir
+        self.thresholds = {**THRESHOLDS, **(thresholds or {})}
+        # DuckDB vectors are 2048 rows, so chunks are ~200k rows by default
+        self.chunk_vectors = chunk_vectors
+
+    def _state_path(self, name):
+        return os.path.join(self.state_dir, f"{name}.json")
+
+    def _rows_path(self, name):
+        return os.path.join(self.state_dir, f"{name}_rows.npy")
+
+    def load_state(self, name):
+        try:
+            with open(self._state_path(name)) as f:
+                return ScanState(json.load(f))
+        except FileNotFoundError:
+            return ScanState()
+
+    def save_state(self, name, state, row_hashes):
+        os.makedirs(self.state_dir, exist_ok=True)
+        if row_hashes is not None:
+            # Written first: rows are only marked scanned once their counters can follow
+            with open(self._rows_path(name) + '.tmp', 'wb') as f:
+                np.save(f, row_hashes)
+            os.replace(self._rows_path(name) + '.tmp', self._rows_path(name))
+        tmp_path = self._state_path(name) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state.to_dict(), f, indent=2, default=str)
+        os.replace(tmp_path, self._state_path(name))
+
+    def set_reference(self, name, frame, bins=10):
+        """Store reference histograms (e.g. from the training snapshot) for drift checks."""
+        config = self.monitors[name]
+        reference = {}
+        for col in config.get('drift_cols', []):
+            values = frame[col].to_numpy(dtype=np.float64)
+            edges = histogram_edges(values, bins)
+            counts, _ = np.histogram(values[~np.isnan(values)], bins=edges)
+            reference[col] = {'edges': edges, 'counts': counts.tolist()}
+        os.makedirs(self.state_dir, exist_ok=True)
+        with open(os.path.join(self.state_dir, f"{name}_reference.json"), 'w') as f:
+            json.dump(reference, f, indent=2, default=float)
+        return reference
+
+    def load_reference(self, name):
+        try:
+            with open(os.path.join(self.state_dir, f"{name}_reference.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _new_partitions(self, config, state):
+        """Yield DataFrame chunks of Parquet files that have not been scanned yet."""
+        for path in sorted(glob.glob(config['parquet_glob'])):
+            stat = os.stat(path)
+            fingerprint = f"{stat.st_size}:{stat.st_mtime_ns}"
+            if state.partitions.get(path) == fingerprint:
+                continue
+            conn = duckdb.connect()
+            result = conn.execute("SELECT * FROM read_parquet(?)", [path])
+            yield from self._fetch_chunks(result)
+            conn.close()
+            state.partitions[path] = fingerprint
+
+    def _new_rows(self, config, seen_rows):
+        """Rows of a table not seen by an earlier scan, whatever their timestamp.
+
+        Each row is identified by a hash of all its columns, so rows loaded late
+        with old event times, and rows rewritten by a CDC update, are scanned
+        too. Returns (chunk iterator, hashes of every current row, duplicates),
+        where duplicates counts the extra rows of keys that new rows share.
+
+        The table (often a dbt view) is read and hashed once into a temp table;
+        the duplicate count and the new rows both come from that copy.
+        """
+        conn = connect_reader(config['db_path'])
+        table = _ident(config['table'])
+        columns = [row[0] for row in conn.execute(f"DESCRIBE {table}").fetchall()]
+        key_cols = config.get('key_cols')
+        key_hash = f"hash({', '.join(_ident(c) for c in key_cols)})" if key_cols else 'NULL'
+        conn.execute(f"""
+            CREATE OR REPLACE TEMP TABLE dq_scan AS
+            SELECT *, hash({', '.join(_ident(c) for c in columns)}) AS _dq_row_hash, {key_hash} AS _dq_key_hash
+            FROM {table}
+        """)
+        current = conn.execute("SELECT DISTINCT _dq_row_hash FROM dq_scan").fetchnumpy()['_dq_row_hash']
+        current = np.sort(np.asarray(current, dtype=np.uint64))
+        new = np.setdiff1d(current, seen_rows, assume_unique=True)
+
+        duplicates = 0
+        if len(new) == 0:
+            conn.execute("DROP TABLE dq_scan")
+            conn.close()
+            return iter(()), current, duplicates
+        conn.register('dq_new_rows', pd.DataFrame({'row_hash': new}))
+        if key_cols:
+            duplicates = conn.execute("""
+                SELECT COALESCE(SUM(n - 1), 0) FROM (
+                    SELECT COUNT(*) AS n, bool_or(_dq_row_hash IN (SELECT row_hash FROM dq_new_rows)) AS touched
+                    FROM dq_scan
+                    GROUP BY _dq_key_hash
+                ) WHERE n > 1 AND touched
+            """).fetchone()[0]
+        result = conn.execute("""
+            SELECT * EXCLUDE (_dq_row_hash, _dq_key_hash)
+            FROM dq_scan t SEMI JOIN dq_new_rows n ON t._dq_row_hash = n.row_hash
+        """)
+
+        def chunks():
+            yield from self._fetch_chunks(result)
+            conn.execute("DROP TABLE dq_scan")
+            conn.close()
+        return chunks(), current, int(duplicates)
+
+    def _fetch_chunks(self, result):
+        while True:
+            chunk = result.fetch_df_chunk(self.chunk_vectors)
+            if chunk.empty:
+                break
+            yield chunk
+
+    def scan(self, name, accept=False):
+        """Scan only new partitions/rows of one table and fold them into its state.
+
+        Checks are evaluated on the rows scanned by this run, so an old failure
+        does not fail every later gate; running totals stay in the saved state.
+        A failing scan is not saved, so its rows count as new (and fail again)
+        on every rerun until they are fixed, or until someone reviews them and
+        records the scan with ``accept=True``.
+        """
+        config = self.monitors[name]
+        state = self.load_state(name)
+        run = ScanState({'watermark': state.watermark, 'partitions': dict(state.partitions)})
+        reference = self.load_reference(name)
+        timestamp_col = config.get('timestamp_col')
+
+        row_hashes = None
+        if 'parquet_glob' in config:
+            chunks = self._new_partitions(config, run)
+        else:
+            path = self._rows_path(name)
+            seen_rows = np.load(path) if os.path.exists(path) else np.empty(0, dtype=np.uint64)
+            chunks, row_hashes, run.duplicates = self._new_rows(config, seen_rows)
+
+        for chunk in chunks:
+            run.rows += len(chunk)
+
+            for col, count in chunk.isna().sum().items():
+                run.nulls[col] = run.nulls.get(col, 0) + int(count)
+
+            for col, (low, high) in config.get('ranges', {}).items():
+                if col in chunk:
+                    values = pd.to_numeric(chunk[col], errors='coerce')
+                    bad = int(((values < low) | (values > high)).sum())
+                    run.range_violations[col] = run.range_violations.get(col, 0) + bad
+
+            for col, ref in reference.items():
+                if col in chunk:
+                    values = pd.to_numeric(chunk[col], errors='coerce').to_numpy(dtype=np.float64)
+                    counts, _ = np.histogram(values[~np.isnan(values)], bins=ref['edges'])
+                    previous = run.histograms.get(col, [0] * len(counts))
+                    run.histograms[col] = (np.asarray(previous) + counts).tolist()
+
+            # Latest event time only feeds the freshness check; it no longer decides what gets scanned
+            if timestamp_col and timestamp_col in chunk:
+                latest = chunk[timestamp_col].max()
+                if pd.notna(latest) and (run.watermark is None or latest > pd.Timestamp(run.watermark)):
+                    run.watermark = pd.Timestamp(latest).isoformat()
+                    run.max_timestamp = run.watermark
+
+        state.merge(run)
+        report = self.report(name, run, state, reference)
+        if report['passed'] or accept:
+            self.save_state(name, state, row_hashes)
+        return report
+
+    def report(self, name, run, state, reference):
+        """Compact pass/fail report for the rows one scan added."""
+        config = self.monitors[name]
+        checks = []
+
+        def check(test_name, value, threshold, passed):
+            checks.append({'test_name': test_name, 'test_result': 'PASS' if passed else 'FAIL',
+                           'value': value, 'threshold': threshold})
+
+        for col in config.get('required_cols', []):
+            fraction = run.nulls.get(col, 0) / run.rows if run.rows else 0.0
+            check(f"Nulls in {col}", round(fraction, 6), self.thresholds['max_null_fraction'],
+                  fraction <= self.thresholds['max_null_fraction'])
+        for col in config.get('ranges', {}):
+            violations = run.range_violations.get(col, 0)
+            check(f"{col} range", violations, self.thresholds['max_range_violations'],
+                  violations <= self.thresholds['max_range_violations'])
+        if config.get('key_cols'):
+            check('Duplicate keys', run.duplicates, self.thresholds['max_duplicates'],
+                  run.duplicates <= self.thresholds['max_duplicates'])
+        if config.get('freshness_days') is not None:
+            limit = datetime.now() - timedelta(days=config['freshness_days'])
+            fresh = state.max_timestamp is not None and pd.Timestamp(state.max_timestamp) >= limit
+            check('Data freshness', state.max_timestamp, limit.isoformat(), fresh)
+        for col, ref in reference.items():
+            if col in run.histograms:
+                psi = population_stability_index(ref['counts'], run.histograms[col])
+                check(f"PSI {col}", round(psi, 4), self.thresholds['max_psi'], psi <= self.thresholds['max_psi'])
+
+        return {
+            'table': name,
+            'rows': state.rows,
+            'new_rows': run.rows,
+            'passed': all(c['test_result'] == 'PASS' for c in checks),
+            'checks': checks,
+        }
+
+    def run(self, names=None, accept=False):
+        """Scan every configured table; returns one report per table."""
+        return [self.scan(name, accept) for name in (names or self.monitors)]
+
+
+def gate(reports):
+    """Raise DataQualityError if any report failed."""
+    failed = [f"{r['table']}: {c['test_name']}" for r in reports for c in r['checks']
+              if c['test_result'] == 'FAIL']
+    if failed:
+        raise DataQualityError("Data quality checks failed: " + ', '.join(failed))
+
+
+def main():
+    import sys
+
+    monitor = DataQualityMonitor()
+    if len(sys.argv) > 2 and sys.argv[1] == '--reference':
+        # Use a training snapshot cutoff as the drift reference
+        from training_snapshots import SnapshotBuilder
+        frame = SnapshotBuilder().load([sys.argv[2]])
+        monitor.set_reference('churn_snapshots', frame)
+        print(f"Stored drift reference from snapshot {sys.argv[2]} ({len(frame)} rows)")
+        return
+
+    # --accept records the scan even if it fails, once its rows have been reviewed
+    accept = '--accept' in sys.argv
+    reports = monitor.run([a for a in sys.argv[1:] if a != '--accept'] or None, accept=accept)
+    for report in reports:
+        print(f"{report['table']}: {report['new_rows']} new rows scanned, {report['rows']} total")
+        for c in report['checks']:
+            print(f"  [{c['test_result']}] {c['test_name']}: {c['value']} (threshold {c['threshold']})")
+    try:
+        gate(reports)
+    except DataQualityError as e:
+        print(e)
+        if accept:
+            print("Accepted: these rows won't be checked again")
+        else:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
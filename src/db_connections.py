@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""Process-wide DuckDB connection manager with Arrow results and prepared-statement reuse."""
+
+import time
+import threading
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+import numpy as np
+from db_snapshots import connect_reader, current_snapshot
+from instrumentation import span, enabled, duckdb_profile
+
+
+def sql_literal(value):
+    """Render a scalar parameter as a SQL literal, or raise TypeError if it has no simple form."""
+    if value is None:
+        return 'NULL'
+    if isinstance(value, (bool, np.bool_)):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    if isinstance(value, (float, np.floating)):
+        return f"'{float(value)!r}'::DOUBLE"
+    if isinstance(value, Decimal):
+        return f"'{value}'::DECIMAL"
+    if isinstance(value, datetime):
+        return f"TIMESTAMP '{value.isoformat(sep=' ')}'"
+    if isinstance(value, date):
+        return f"DATE '{value.isoformat()}'"
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    raise TypeError(f"no literal form for {type(value).__name__}")
+
+
+class QueryTimings:
+    """Count, total and max wall time per query label."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = defaultdict(lambda: {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0})
+
+    def record(self, label, seconds, rows=None):
+        ms = seconds * 1000
+        with self.lock:
+            stats = self.stats[label]
+            stats['calls'] += 1
+            stats['total_ms'] += ms
+            stats['max_ms'] = max(stats['max_ms'], ms)
+            stats['rows'] += rows or 0
+
+    def report(self):
+        with self.lock:
+            rows = [{'query': label, **stats, 'mean_ms': stats['total_ms'] / stats['calls']}
+                    for label, stats in self.stats.items()]
+        return sorted(rows, key=lambda r: r['total_ms'], reverse=True)
+
+
+class ConnectionManager:
+    """Shared read connections: one cursor per thread per database.
+
+    Cursors sit on the published snapshot handle from ``db_snapshots`` and are
+    replaced when a new snapshot is published. Parameterized queries are
+    prepared once per cursor and then run with EXECUTE, skipping re-planning.
+    Fetches with ``cache=True`` go through ``cache`` (a query_cache.QueryCache).
+    """
+
+    def __init__(self, prepare=True, cache=None):
+        self.prepare = prepare
+        self.cache = cache
+        self.timings = QueryTimings()
+        self._local = threading.local()
+
+    def _entry(self, db_path):
+        entries = getattr(self._local, 'entries', None)
+        if entries is None:
+            entries = self._local.entries = {}
+        snapshot = current_snapshot(db_path) or db_path
+        entry = entries.get(db_path)
+        if entry is None or entry['snapshot'] != snapshot:
+            if entry is not None:
+                entry['cursor'].close()
+            entry = entries[db_path] = {'snapshot': snapshot, 'cursor': connect_reader(db_path),
+                                        'prepared': {}}
+            if enabled():
+                # Per-query profiles are read back into the query's span
+                entry['cursor'].execute("SET enable_profiling = 'no_output'")
+        return entry
+
+    def cursor(self, db_path):
+        """This thread's cursor on the current snapshot of ``db_path``."""
+        return self._entry(db_path)['cursor']
+
+    def _run(self, entry, query, params):
+        cursor = entry['cursor']
+        if not params or not self.prepare or isinstance(params, dict):
+            return cursor.execute(query, params) if params else cursor.execute(query)
+        try:
+            args = ', '.join(sql_literal(p) for p in params)
+        except TypeError:
+            # Lists, frames etc. cannot be passed to EXECUTE; bind them normally
+            return cursor.execute(query, params)
+        name = entry['prepared'].get(query)
+        if name is None:
+            name = f"stmt_{len(entry['prepared'])}"
+            cursor.execute(f"PREPARE {name} AS {query}")
+            entry['prepared'][query] = name
+        return cursor.execute(f"EXECUTE {name}({args})")
+
+    def execute(self, db_path, query, params=None, label=None):
+        """Run a query on this thread's cursor and return it for fetching."""
+        started = time.perf_counter()
+        with span('duckdb.execute', query=label or _label(query)):
+            result = self._run(self._entry(db_path), query, params)
+        self.timings.record(label or _label(query), time.perf_counter() - started)
+        return result
+
+    def fetch_arrow(self, db_path, query, params=None, label=None, cache=False):
+        """Query result as a pyarrow Table (columnar, no per-row conversion).
+
+        With ``cache=True`` the result is reused until the snapshot or files it
+        reads change; treat cached tables as shared and read-only.
+        """
+        if cache and self.cache is not None:
+            return self.cache.get_or_run(db_path, query, params,
+                                         lambda: self.fetch_arrow(db_path, query, params, label), label)
+        started = time.perf_counter()
+        with span('duckdb.query', query=label or _label(query)) as s:
+            entry = self._entry(db_path)
+            result = self._run(entry, query, params)
+            # Newer DuckDB releases renamed fetch_arrow_table to to_arrow_table
+            table = (getattr(result, 'to_arrow_table', None) or result.fetch_arrow_table)()
+            if enabled():
+                s.add(rows=table.num_rows, bytes=table.nbytes)
+                s.set(**duckdb_profile(entry['cursor']))
+        self.timings.record(label or _label(query), time.perf_counter() - started, table.num_rows)
+        return table
+
+    def fetch_df(self, db_path, query, params=None, label=None, cache=False):
+        """Query result as a DataFrame built from Arrow buffers.
+
+        ``self_destruct`` frees each Arrow column as it is converted, so peak
+        memory stays near one copy of the result instead of two. Cached tables
+        are shared, so those are converted without it.
+        """
+        table = self.fetch_arrow(db_path, query, params, label, cache=cache)
+        shared = cache and self.cache is not None
+        return table.to_pandas(split_blocks=True, self_destruct=not shared, date_as_object=False)
+
+    def fetch_numpy(self, db_path, query, params=None, label=None):
+        """Query result as a dict of NumPy arrays, one per column."""
+        started = time.perf_counter()
+        with span('duckdb.query', query=label or _label(query)) as s:
+            entry = self._entry(db_path)
+            arrays = self._run(entry, query, params).fetchnumpy()
+            rows = len(next(iter(arrays.values()))) if arrays else 0
+            if enabled():
+                s.add(rows=rows)
+                s.set(**duckdb_profile(entry['cursor']))
+        self.timings.record(label or _label(query), time.perf_counter() - started, rows)
+        return arrays
+
+    def stream_batches(self, db_path, query, params=None, batch_size=100000, label=None):
+        """Yield Arrow record batches so large results never exist in memory at once."""
+        started = time.perf_counter()
+        # A dedicated cursor, since the caller may run other queries between batches
+        cursor = connect_reader(db_path)
+        rows = 0
+        try:
+            reader = cursor.execute(query, params or []).fetch_record_batch(batch_size)
+            for batch in reader:
+                rows += batch.num_rows
+                yield batch
+        finally:
+            cursor.close()
+            self.timings.record(label or _label(query), time.perf_counter() - started, rows)
+
+
+def _label(query):
+    return ' '.join(query.split())[:60]
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_manager():
+    """The process-wide ConnectionManager."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            from query_cache import get_cache
+            _manager = ConnectionManager(cache=get_cache())
+        return _manager
+
+
+def main():
+    import sys
+
+    db_path = sys.argv[1] if len(sys.argv) > 1 else '../data/cybersec_health_dbt.duckdb'
+    manager = get_manager()
+    tables = manager.fetch_df(db_path, "SELECT table_name, estimated_size FROM duckdb_tables()")
+    for table in tables.itertuples():
+        manager.fetch_arrow(db_path, f"SELECT * FROM {table.table_name}", label=table.table_name)
+    print(f"{'query':<40} {'calls':>6} {'rows':>10} {'mean ms':>9} {'max ms':>9}")
+    for row in manager.timings.report():
+        print(f"{row['query'][:40]:<40} {row['calls']:>6} {row['rows']:>10} "
+              f"{row['mean_ms']:>9.2f} {row['max_ms']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
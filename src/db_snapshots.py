@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Published read-only DuckDB snapshots, so readers never contend with the pipeline writer."""
+
+import os
+import shutil
+import threading
+from datetime import datetime
+import duckdb
+
+_readers = {}
+_readers_lock = threading.Lock()
+
+
+def publish_root(db_path):
+    """Directory holding the published snapshots of ``db_path``."""
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), 'published', stem)
+
+
+def current_snapshot(db_path):
+    """Path of the latest published snapshot of ``db_path``, or None if none exists."""
+    root = publish_root(db_path)
+    try:
+        with open(os.path.join(root, 'CURRENT')) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    path = os.path.join(root, name)
+    return path if os.path.exists(path) else None
+
+
+def connect_reader(db_path):
+    """Read-only cursor on the latest published snapshot of ``db_path``.
+
+    One database handle per snapshot is kept open for the process and every
+    caller gets its own cursor on it, so closing the cursor is cheap. Until a
+    snapshot has been published this falls back to opening ``db_path`` itself.
+    """
+    snapshot = current_snapshot(db_path) or db_path
+    key = os.path.abspath(db_path)
+    with _readers_lock:
+        cached = _readers.get(key)
+        if cached is None or cached[0] != snapshot:
+            # Cursors already handed out keep the previous snapshot open until closed
+            _readers[key] = (snapshot, duckdb.connect(snapshot, read_only=True))
+        return _readers[key][1].cursor()
+
+
+class SnapshotPublisher:
+    """Copies a finished build into an immutable snapshot and repoints CURRENT at it.
+
+    The pipeline keeps writing to ``db_path`` (the staging database); readers
+    only ever open published files, which are never written to again.
+    """
+
+    def __init__(self, db_path, keep=3):
+        self.db_path = db_path
+        self.keep = keep
+        self.root = publish_root(db_path)
+
+    def snapshots(self):
+        """Published snapshot files, oldest first."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(f for f in os.listdir(self.root) if f.endswith('.duckdb'))
+
+    def publish(self):
+        """Snapshot the staging database; returns the new snapshot path."""
+        # Flush the WAL so the database file alone is a complete copy
+        conn = duckdb.connect(self.db_path)
+        conn.execute("CHECKPOINT")
+        conn.close()
+
+        os.makedirs(self.root, exist_ok=True)
+        stem = os.path.splitext(os.path.basename(self.db_path))[0]
+        name = f"{stem}-{datetime.now().strftime('%Y%m%d%H%M%S%f')}.duckdb"
+        path = os.path.join(self.root, name)
+        shutil.copyfile(self.db_path, path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+        pointer = os.path.join(self.root, 'CURRENT')
+        with open(pointer + '.tmp', 'w') as f:
+            f.write(name)
+        os.replace(pointer + '.tmp', pointer)
+        self.prune()
+        return path
+
+    def prune(self):
+        """Delete all but the newest ``keep`` snapshots."""
+        current = current_snapshot(self.db_path)
+        for name in self.snapshots()[:-self.keep]:
+            path = os.path.join(self.root, name)
+            if path == current:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                # Still open by a reader on a platform that locks open files
+                pass
+
+
+def main():
+    import sys
+
+    db_paths = sys.argv[2:] or ['../data/cybersec_health_dbt.duckdb']
+    command = sys.argv[1] if len(sys.argv) > 1 else 'list'
+    for db_path in db_paths:
+        publisher = SnapshotPublisher(db_path)
+        if command == 'publish':
+            print(f"Published {db_path} -> {publisher.publish()}")
+        else:
+            print(f"{db_path}: current snapshot {current_snapshot(db_path) or '(none)'}")
+            for name in publisher.snapshots():
+                print(f"  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,35 @@
-import pandas as pd
+from instrumentation import traced
+from extract_common import CsvSchema, read_csv_chunks, DEFAULT_CHUNKSIZE
 
-def extract_customer_feedback():
-    """Extract customer feedback and satisfaction metrics"""
-    df = pd.read_csv('../data/raw/customer_feedback.csv')
-    df['survey_date'] = pd.to_datetime(df['survey_date'])
-    
-    # Calculate composite satisfaction score
-    df['composite_satisfaction'] = (df['product_satisfaction'] + df['support_satisfaction']) / 2
-    df['renewal_risk'] = df['likelihood_to_renew'].map({
-        'High': 'Low Risk', 'Medium': 'Medium Risk', 'Low': 'High Risk'
-    })
-    
+FEEDBACK_SCHEMA = CsvSchema(
+    categories={'likelihood_to_renew': ['Low', 'Medium', 'High']},
+    dates=['survey_date', 'feedback_date'],
+    numeric={'nps_score': 'float32', 'satisfaction_score': 'float32',
+             'product_satisfaction': 'float32', 'support_satisfaction': 'float32'},
+    keys=['customer_id'],
+)
+
+RENEWAL_RISK = {'High': 'Low Risk', 'Medium': 'Medium Risk', 'Low': 'High Risk'}
+
+def derive_feedback_metrics(df):
+    """Add composite satisfaction and renewal risk to one typed chunk"""
+    if 'product_satisfaction' in df and 'support_satisfaction' in df:
+        df['composite_satisfaction'] = (df['product_satisfaction'] + df['support_satisfaction']) / 2
+    # Mapping a categorical maps its categories only, so the result stays categorical
+    df['renewal_risk'] = df['likelihood_to_renew'].map(RENEWAL_RISK)
     return df
 
+def iter_customer_feedback(path='../data/raw/customer_feedback.csv', chunksize=DEFAULT_CHUNKSIZE, engine='pandas'):
+    """Yield typed customer feedback chunks with derived scores"""
+    for chunk in read_csv_chunks(path, FEEDBACK_SCHEMA, chunksize, engine):
+        yield derive_feedback_metrics(chunk)
+
+@traced('extract.customer_feedback')
+def extract_customer_feedback(path='../data/raw/customer_feedback.csv', engine='pandas'):
+    """Extract customer feedback and satisfaction metrics"""
+    return next(iter_customer_feedback(path, chunksize=None, engine=engine))
+
 if __name__ == "__main__":
     feedback = extract_customer_feedback()
     print(f"Extracted {len(feedback)} feedback records")
-    print(f"Average NPS: {feedback['nps_score'].mean():.2f}")
\ No newline at end of file
+    print(f"Average NPS: {feedback['nps_score'].mean():.2f}")
@@ -1,21 +1,37 @@
-import pandas as pd
+from instrumentation import traced
+from extract_common import CsvSchema, read_csv_chunks, DEFAULT_CHUNKSIZE
 
-def extract_security_incidents():
-    """Extract security incident data and calculate response metrics"""
-    df = pd.read_csv('../data/raw/security_incidents.csv')
-    df['detected_date'] = pd.to_datetime(df['detected_date'])
-    df['resolved_date'] = pd.to_datetime(df['resolved_date'])
-    
-    # Calculate key security metrics
-    df['is_resolved'] = df['resolved_date'].notna()
+SEVERITY_LEVELS = ['Low', 'Medium', 'High', 'Critical']
+
+INCIDENT_SCHEMA = CsvSchema(
+    categories={'incident_type': None, 'severity': SEVERITY_LEVELS, 'status': None},
+    dates=['detected_date', 'resolved_date'],
+    booleans=['false_positive'],
+    numeric={'mean_time_to_detect_minutes': 'float32', 'mean_time_to_respond_minutes': 'float32'},
+    keys=['customer_id'],
+)
+
+def derive_incident_metrics(df):
+    """Add response metrics to one typed chunk"""
+    if 'resolved_date' in df:
+        df['is_resolved'] = df['resolved_date'].notna()
     df['total_response_time'] = df['mean_time_to_detect_minutes'] + df['mean_time_to_respond_minutes']
-    df['severity_score'] = df['severity'].map({
-        'Low': 1, 'Medium': 2, 'High': 3, 'Critical': 4
-    })
-    
+    # Category codes follow SEVERITY_LEVELS, so the score is code + 1 (NaN for unknown levels)
+    codes = df['severity'].cat.codes
+    df['severity_score'] = (codes + 1).where((codes >= 0) & (codes < len(SEVERITY_LEVELS))).astype('Int8')
     return df
 
+def iter_security_incidents(path='../data/raw/security_incidents.csv', chunksize=DEFAULT_CHUNKSIZE, engine='pandas'):
+    """Yield typed security incident chunks with response metrics"""
+    for chunk in read_csv_chunks(path, INCIDENT_SCHEMA, chunksize, engine):
+        yield derive_incident_metrics(chunk)
+
+@traced('extract.security_incidents')
+def extract_security_incidents(path='../data/raw/security_incidents.csv', engine='pandas'):
+    """Extract security incident data and calculate response metrics"""
+    return next(iter_security_incidents(path, chunksize=None, engine=engine))
+
 if __name__ == "__main__":
     incidents = extract_security_incidents()
     print(f"Extracted {len(incidents)} security incidents")
-    print(f"Average detection time: {incidents['mean_time_to_detect_minutes'].mean():.2f} minutes")
\ No newline at end of file
+    print(f"Average detection time: {incidents['mean_time_to_detect_minutes'].mean():.2f} minutes")
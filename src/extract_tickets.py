@@ -1,19 +1,33 @@
-import pandas as pd
 from datetime import datetime
+from instrumentation import traced
+from extract_common import CsvSchema, read_csv_chunks, DEFAULT_CHUNKSIZE
 
-def extract_support_tickets():
-    """Extract support ticket data and calculate key metrics"""
-    df = pd.read_csv('../data/raw/support_tickets.csv')
-    df['created_date'] = pd.to_datetime(df['created_date'])
-    df['resolved_date'] = pd.to_datetime(df['resolved_date'])
-    
-    # Calculate metrics
-    df['is_resolved'] = df['resolved_date'].notna()
-    df['days_to_resolve'] = (df['resolved_date'] - df['created_date']).dt.total_seconds() / 3600 / 24
-    
+TICKET_SCHEMA = CsvSchema(
+    categories={'ticket_type': None, 'priority': ['Low', 'Medium', 'High', 'Critical'], 'status': None},
+    dates=['created_date', 'resolved_date'],
+    booleans=['escalated'],
+    numeric={'resolution_time_hours': 'float32', 'satisfaction_score': 'float32'},
+    keys=['customer_id'],
+)
+
+def derive_ticket_metrics(df):
+    """Add per-ticket metrics to one typed chunk"""
+    if 'resolved_date' in df:
+        df['is_resolved'] = df['resolved_date'].notna()
+        df['days_to_resolve'] = ((df['resolved_date'] - df['created_date']).dt.total_seconds() / 3600 / 24).astype('float32')
     return df
 
+def iter_support_tickets(path='../data/raw/support_tickets.csv', chunksize=DEFAULT_CHUNKSIZE, engine='pandas'):
+    """Yield typed support ticket chunks with metrics"""
+    for chunk in read_csv_chunks(path, TICKET_SCHEMA, chunksize, engine):
+        yield derive_ticket_metrics(chunk)
+
+@traced('extract.support_tickets')
+def extract_support_tickets(path='../data/raw/support_tickets.csv', engine='pandas'):
+    """Extract support ticket data and calculate key metrics"""
+    return next(iter_support_tickets(path, chunksize=None, engine=engine))
+
 if __name__ == "__main__":
     tickets = extract_support_tickets()
     print(f"Extracted {len(tickets)} support tickets")
-    print(f"Average resolution time: {tickets['resolution_time_hours'].mean():.2f} hours")
\ No newline at end of file
+    print(f"Average resolution time: {tickets['resolution_time_hours'].mean():.2f} hours")
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""Parallel backfill of daily health score history from as-of slices of the raw data."""
+
+import os
+import glob
+import shutil
+import hashlib
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+# Event-time column of each input (first one present is used). Inputs with no
+# event time (a current snapshot, like product_usage) are used as-is every day.
+EVENT_DATES = {
+    'customers': ['contract_start_date'],
+    'tickets': ['created_date'],
+    'incidents': ['incident_timestamp', 'incident_date', 'detected_date'],
+    'feedback': ['feedback_date'],
+    'usage': [],
+}
+
+# Inputs the scorers expect one row per customer from: keep the latest as of the day
+LATEST_PER_CUSTOMER = {'feedback', 'usage'}
+
+SCORER_MODULES = ('transform.py', 'comprehensive_health_score.py')
+
+_worker = {}
+
+
+def formula_version():
+    """Hash of the scoring modules, so changing a formula invalidates backfilled days."""
+    digest = hashlib.sha256()
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in SCORER_MODULES:
+        with open(os.path.join(src_dir, name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+class AsOfInputs:
+    """Raw frames sorted by event time, sliced to any day without copying the history."""
+
+    def __init__(self, frames):
+        self.frames = {}
+        self.ends = {}
+        for name, df in frames.items():
+            col = next((c for c in EVENT_DATES.get(name, []) if c in df), None)
+            if col is None:
+                self.frames[name] = df
+                continue
+            times = pd.to_datetime(df[col], errors='coerce')
+            # Rows with no event time sort first and are treated as always known
+            order = np.argsort(times.to_numpy(dtype='datetime64[ns]').astype(np.int64), kind='stable')
+            self.frames[name] = df.iloc[order].reset_index(drop=True)
+            self.ends[name] = times.iloc[order].to_numpy(dtype='datetime64[ns]')
+
+    def as_of(self, day):
+        """Inputs as they stood at the end of ``day``."""
+        cutoff = np.datetime64(pd.Timestamp(day) + pd.Timedelta(days=1), 'ns')
+        inputs = {}
+        for name, df in self.frames.items():
+            if name in self.ends:
+                times = self.ends[name]
+                known = np.isnat(times).sum()
+                df = df.iloc[:known + np.searchsorted(times[known:], cutoff, side='left')]
+            if name in LATEST_PER_CUSTOMER and 'customer_id' in df:
+                df = df.drop_duplicates('customer_id', keep='last')
+            inputs[name] = df
+        return inputs
+
+
+def _init_worker(data_dir, dim_path):
+    """Each worker loads the raw data once and then scores many days from it."""
+    from transform import load_health_inputs
+    from customer_dim import CustomerDimension
+
+    _worker['inputs'] = AsOfInputs(load_health_inputs(data_dir))
+    _worker['dim'] = CustomerDimension(dim_path)
+
+
+def score_day(inputs, dim, day):
+    """Health scores (both formulas) for one as-of day."""
+    from transform import calculate_customer_health_score
+    from comprehensive_health_score import calculate_comprehensive_health_score
+
+    day_inputs = inputs.as_of(day)
+    if day_inputs['customers'].empty:
+        return pd.DataFrame(columns=['customer_id', 'customer_health_score', 'health_category',
+                                     'comprehensive_health_score'])
+    health = calculate_customer_health_score(day_inputs, dim)
+    comprehensive = calculate_comprehensive_health_score(day_inputs, dim)
+    scores = health[['customer_id', 'customer_health_score', 'health_category']].merge(
+        comprehensive[['customer_id', 'comprehensive_health_score']], on='customer_id', how='left')
+    scores['health_category'] = scores['health_category'].astype(str)
+    return scores
+
+
+def _write_partition(output_dir, day, scores, version):
+    partition = os.path.join(output_dir, f"score_date={day}")
+    tmp_partition = partition + '.tmp'
+    shutil.rmtree(tmp_partition, ignore_errors=True)
+    os.makedirs(tmp_partition)
+    scores.to_parquet(os.path.join(tmp_partition, 'part-0.parquet'), index=False)
+    with open(os.path.join(tmp_partition, 'VERSION'), 'w') as f:
+        f.write(version)
+    shutil.rmtree(partition, ignore_errors=True)
+    os.replace(tmp_partition, partition)
+
+
+def _backfill_days(output_dir, days, version):
+    """Score and write a chunk of days; only one day's scores are held at a time."""
+    rows = {}
+    for day in days:
+        scores = score_day(_worker['inputs'], _worker['dim'], day)
+        _write_partition(output_dir, day, scores, version)
+        rows[day] = len(scores)
+    return rows
+
+
+class HealthBackfill:
+    def __init__(self, data_dir='../data/raw', output_dir='../data/processed/score_history',
+                 dim_path='../data/dimensions/customer_dim.csv', max_workers=None, chunk_days=7):
+        self.data_dir = data_dir
+        self.output_dir = output_dir
+        self.dim_path = dim_path
+        self.max_workers = max_workers
+        self.chunk_days = chunk_days
+
+    @staticmethod
+    def days(start, end):
+        return [d.strftime('%Y-%m-%d') for d in pd.date_range(start, end, freq='D')]
+
+    def existing(self, version=None):
+        """Days with a complete partition (from the given formula version, if any)."""
+        done = []
+        for path in glob.glob(os.path.join(self.output_dir, 'score_date=*', 'VERSION')):
+            with open(path) as f:
+                if version is None or f.read().strip() == version:
+                    done.append(os.path.basename(os.path.dirname(path)).split('=', 1)[1])
+        return sorted(done)
+
+    def run(self, start, end, overwrite=False):
+        """Backfill [start, end]; days already scored with the current formulas are skipped.
+
+        Partitions are written atomically, so an interrupted run resumes by
+        simply running again. Returns {day: customers scored}.
+        """
+        from customer_dim import CustomerDimension
+        from transform import HEALTH_INPUTS
+
+        version = formula_version()
+        done = set() if overwrite else set(self.existing(version))
+        todo = [d for d in self.days(start, end) if d not in done]
+        if not todo:
+            return {}
+
+        # Register every customer up front so workers only read the dimension
+        customers = pd.read_csv(os.path.join(self.data_dir, HEALTH_INPUTS['customers']),
+                                usecols=['customer_id'])
+        CustomerDimension(self.dim_path).register(customers['customer_id'])
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        # Half-written partitions left by an interrupted run
+        for stale in glob.glob(os.path.join(self.output_dir, 'score_date=*.tmp')):
+            shutil.rmtree(stale, ignore_errors=True)
+        chunks = [todo[i:i + self.chunk_days] for i in range(0, len(todo), self.chunk_days)]
+        results = {}
+        with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                 initargs=(self.data_dir, self.dim_path)) as pool:
+            futures = [pool.submit(_backfill_days, self.output_dir, chunk, version) for chunk in chunks]
+            for future in as_completed(futures):
+                results.update(future.result())
+                print(f"  {len(results)}/{len(todo)} days scored")
+        return results
+
+    def load(self, start=None, end=None, version=None):
+        """Score history as one frame with a score_date column, for trend charts.
+
+        Only days scored with ``version`` (the current formula by default) are
+        included, so a chart never mixes scores from different formulas; rerun
+        the backfill to rescore older days.
+        """
+        import duckdb
+
+        version = version or formula_version()
+        days = [d for d in self.existing(version) if (start is None or d >= start) and (end is None or d <= end)]
+        if not days:
+            return pd.DataFrame()
+        files = [os.path.join(self.output_dir, f"score_date={d}", 'part-0.parquet') for d in days]
+        conn = duckdb.connect()
+        df = conn.execute(
+            "SELECT * FROM read_parquet($files, hive_partitioning = true) ORDER BY score_date, customer_id",
+            {'files': files}
+        ).df()
+        conn.close()
+        return df
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('start')
+    parser.add_argument('end', nargs='?', default=pd.Timestamp.today().strftime('%Y-%m-%d'))
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-days', type=int, default=7)
+    parser.add_argument('--overwrite', action='store_true', help='rescore days even if current')
+    args = parser.parse_args()
+
+    backfill = HealthBackfill(max_workers=args.workers, chunk_days=args.chunk_days)
+    started = time.perf_counter()
+    results = backfill.run(args.start, args.end, overwrite=args.overwrite)
+    print(f"Backfilled {len(results)} days in {time.perf_counter() - started:.1f}s "
+          f"(formula version {formula_version()}); "
+          f"{len(backfill.existing(formula_version()))} of {len(backfill.existing())} days "
+          f"in {backfill.output_dir} are current")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""Near-real-time security incident ingestion with micro-batch alert scoring."""
+
+import os
+import json
+import time
+import queue
+import socket
+import random
+import threading
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+import duckdb
+import numpy as np
+import pandas as pd
+from data_quality import key_hashes
+
+SEVERITY_SCORES = {'Low': 1, 'Medium': 2, 'High': 3, 'Critical': 4}
+
+STREAM_KEY = ['customer_id', 'incident_timestamp', 'source_ip', 'attack_type']
+
+STORE_DDL = """
+CREATE TABLE IF NOT EXISTS stream_security_incidents (
+    customer_id VARCHAR,
+    incident_timestamp TIMESTAMP,
+    source_ip VARCHAR,
+    attack_type VARCHAR,
+    severity_level VARCHAR,
+    severity_score INTEGER,
+    anomaly_score DOUBLE,
+    ingested_at TIMESTAMP
+)
+"""
+
+_END = object()
+
+
+class FileTailSource:
+    """Tail a JSONL file from a byte offset, yielding (offset_after_line, line)."""
+
+    def __init__(self, path, offset=0, follow=True, poll_interval=0.05):
+        self.path = path
+        self.offset = offset
+        self.follow = follow
+        self.poll_interval = poll_interval
+        self.stopped = threading.Event()
+
+    def __iter__(self):
+        while not os.path.exists(self.path) and self.follow and not self.stopped.is_set():
+            time.sleep(self.poll_interval)
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            while not self.stopped.is_set():
+                line = f.readline()
+                if line.endswith(b'\n'):
+                    self.offset = f.tell()
+                    yield self.offset, line
+                    continue
+                # Partial line: rewind and wait for the writer to finish it
+                f.seek(self.offset)
+                if not self.follow:
+                    return
+                time.sleep(self.poll_interval)
+
+    def stop(self):
+        self.stopped.set()
+
+
+class SocketSource:
+    """Line-delimited JSON over TCP; yields (sequence_number, line).
+
+    Delivery is at-least-once only if producers replay unacknowledged events;
+    the checkpoint records how many events were committed.
+    """
+
+    def __init__(self, host='127.0.0.1', port=9999, offset=0):
+        self.host = host
+        self.port = port
+        self.offset = offset
+        self.stopped = threading.Event()
+        self.server = socket.create_server((host, port), reuse_port=False)
+        self.server.settimeout(0.2)
+
+    def __iter__(self):
+        while not self.stopped.is_set():
+            try:
+                conn, _ = self.server.accept()
+            except socket.timeout:
+                continue
+            with conn, conn.makefile('rb') as stream:
+                for line in stream:
+                    if self.stopped.is_set():
+                        return
+                    self.offset += 1
+                    yield self.offset, line
+
+    def stop(self):
+        self.stopped.set()
+        self.server.close()
+
+
+class IncidentAggregates:
+    """Per-customer daily incident counts and severity sums over a sliding window."""
+
+    def __init__(self, window_days=30):
+        self.window_days = window_days
+        self.days = defaultdict(dict)
+
+    def update(self, batch):
+        """Fold a batch of incidents in; returns the customer ids it touched."""
+        daily = batch.groupby([batch['customer_id'], batch['incident_timestamp'].dt.date]).agg(
+            count=('severity_score', 'size'), severity_sum=('severity_score', 'sum'))
+        for (customer_id, day), row in daily.iterrows():
+            count, severity_sum = self.days[customer_id].get(day, (0, 0.0))
+            self.days[customer_id][day] = (count + int(row['count']), severity_sum + float(row['severity_sum']))
+        return daily.index.get_level_values(0).unique().tolist()
+
+    def load(self, conn):
+        """Rebuild the window from the incident store (e.g. after a restart)."""
+        rows = conn.execute("""
+            SELECT customer_id, incident_timestamp::date AS day,
+                   COUNT(*) AS count, SUM(severity_score) AS severity_sum
+            FROM stream_security_incidents
+            WHERE incident_timestamp >= CURRENT_DATE - ?::INTEGER
+            GROUP BY 1, 2
+        """, [self.window_days]).fetchall()
+        self.days = defaultdict(dict)
+        for customer_id, day, count, severity_sum in rows:
+            self.days[customer_id][day] = (int(count), float(severity_sum or 0))
+
+    def snapshot(self, customer_ids, today=None):
+        """Windowed metrics for the given customers, expiring days that fell out."""
+        cutoff = (today or datetime.now().date()) - timedelta(days=self.window_days)
+        records = []
+        for customer_id in customer_ids:
+            days = self.days.get(customer_id, {})
+            for day in [d for d in days if d < cutoff]:
+                del days[day]
+            count = sum(c for c, _ in days.values())
+            severity = sum(s for _, s in days.values())
+            records.append({'customer_id': customer_id, 'recent_incidents': count,
+                            'avg_severity': severity / count if count else 0.0})
+        return pd.DataFrame(records, columns=['customer_id', 'recent_incidents', 'avg_severity'])
+
+
+class StreamStats:
+    """Throughput and end-to-end latency of committed events."""
+
+    def __init__(self, max_samples=100000):
+        self.started = time.time()
+        self.events = 0
+        self.duplicates = 0
+        self.batches = 0
+        self.alerts = 0
+        self.queue_high_water = 0
+        self.latencies = deque(maxlen=max_samples)
+
+    def report(self):
+        elapsed = max(time.time() - self.started, 1e-9)
+        latencies = np.asarray(self.latencies) * 1000 if self.latencies else np.zeros(1)
+        return {
+            'events': self.events,
+            'duplicates': self.duplicates,
+            'batches': self.batches,
+            'alerts': self.alerts,
+            'events_per_sec': round(self.events / elapsed, 1),
+            'latency_p50_ms': round(float(np.percentile(latencies, 50)), 2),
+            'latency_p95_ms': round(float(np.percentile(latencies, 95)), 2),
+            'latency_max_ms': round(float(latencies.max()), 2),
+            'queue_high_water': self.queue_high_water,
+        }
+
+
+class StreamIngestor:
+    def __init__(self, store_path='../data/cybersec_health_stream.duckdb',
+                 checkpoint_path='../data/stream/checkpoint.json', batch_size=5000,
+                 max_wait=0.5, max_queue=50000, alert_system=None,
+                 customers_path='../data/raw/customers.csv', dedup=None):
+        self.store_path = store_path
+        self.checkpoint_path = checkpoint_path
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        # Bounded queue: a full queue blocks the reader, pushing back on the source
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.alert_system = alert_system
+        self.customers_path = customers_path
+        self.dedup = dedup
+        self.aggregates = None
+        self.alerted = set()
+        self.stats = StreamStats()
+        self._customer_names = None
+
+    def load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'offset': 0, 'events': 0}
+
+    def save_checkpoint(self, offset):
+        os.makedirs(os.path.dirname(self.checkpoint_path) or '.', exist_ok=True)
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'offset': offset, 'events': self.stats.events,
+                       'updated_at': datetime.now().isoformat()}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def customer_names(self):
+        if self._customer_names is None:
+            try:
+                customers = pd.read_csv(self.customers_path, usecols=['customer_id', 'company_name'])
+                self._customer_names = dict(zip(customers['customer_id'], customers['company_name']))
+            except (FileNotFoundError, ValueError):
+                self._customer_names = {}
+        return self._customer_names
+
+    def _read(self, source):
+        for offset, line in source:
+            self.queue.put((offset, line, time.time()))
+            self.stats.queue_high_water = max(self.stats.queue_high_water, self.queue.qsize())
+        self.queue.put(_END)
+
+    def parse(self, items):
+        """Turn raw JSON lines into a typed incident frame."""
+        records = []
+        for _, line, received in items:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            event['_received'] = received
+            records.append(event)
+        batch = pd.DataFrame.from_records(records)
+        if batch.empty:
+            return batch
+        for col in STREAM_KEY + ['severity_level', 'anomaly_score', 'emitted_at']:
+            if col not in batch:
+                batch[col] = None
+        batch['incident_timestamp'] = pd.to_datetime(batch['incident_timestamp'], errors='coerce')
+        batch = batch.dropna(subset=['customer_id', 'incident_timestamp'])
+        batch['severity_score'] = batch['severity_level'].map(SEVERITY_SCORES).fillna(0).astype(int)
+        batch['anomaly_score'] = pd.to_numeric(batch['anomaly_score'], errors='coerce')
+        return batch
+
+    def process(self, conn, items):
+        """Dedup, store, aggregate and alert for one micro-batch, then checkpoint."""
+        batch = self.parse(items)
+        alerts = []
+        if not batch.empty:
+            unique, duplicates = self.dedup.dedup(batch, 'stream_incidents', commit=False)
+            self.stats.duplicates += len(duplicates)
+            if not unique.empty:
+                store = unique[STREAM_KEY + ['severity_level', 'severity_score', 'anomaly_score']].copy()
+                store['ingested_at'] = pd.Timestamp.now()
+                conn.register('stream_batch', store)
+                conn.execute("INSERT INTO stream_security_incidents SELECT * FROM stream_batch")
+                conn.unregister('stream_batch')
+                # Keys are committed only once the rows are in the store
+                self.dedup.index('stream_incidents').add(key_hashes(unique, STREAM_KEY))
+
+                touched = self.aggregates.update(unique)
+                alerts = self.evaluate(touched)
+
+        committed = time.time()
+        self.save_checkpoint(items[-1][0])
+        self.stats.batches += 1
+        self.stats.events += len(items)
+        if not batch.empty:
+            # End-to-end from the producer's timestamp when it sent one, else from receipt
+            started = pd.to_numeric(batch['emitted_at'], errors='coerce').fillna(batch['_received'])
+            self.stats.latencies.extend((committed - started).tolist())
+        return alerts
+
+    def evaluate(self, customer_ids):
+        """Re-run the incident alert rule for only the customers a batch touched."""
+        if self.alert_system is None:
+            return []
+        metrics = self.aggregates.snapshot(customer_ids)
+        names = self.customer_names()
+        metrics['customer_name'] = metrics['customer_id'].map(names).fillna(metrics['customer_id'])
+        alerts = [a for a in self.alert_system.critical_incident_alerts(metrics)
+                  if a['customer_id'] not in self.alerted]
+        threshold = self.alert_system.config['thresholds']['critical_incidents']
+        # Alert once per threshold crossing, re-arming when the customer drops back below
+        self.alerted |= {a['customer_id'] for a in alerts}
+        self.alerted -= set(metrics.loc[metrics['recent_incidents'] < threshold, 'customer_id'])
+        if alerts:
+            self.alert_system.save_alerts(alerts)
+            self.stats.alerts += len(alerts)
+        return alerts
+
+    def run(self, source, max_events=None, idle_timeout=None):
+        """Consume ``source`` until it ends, ``max_events`` or ``idle_timeout`` seconds idle."""
+        from incident_dedup import Deduplicator, NATURAL_KEYS
+
+        if self.dedup is None:
+            self.dedup = Deduplicator(keys={**NATURAL_KEYS, 'stream_incidents': STREAM_KEY})
+        conn = duckdb.connect(self.store_path)
+        conn.execute(STORE_DDL)
+        self.aggregates = IncidentAggregates()
+        self.aggregates.load(conn)
+        if self.alert_system is not None:
+            threshold = self.alert_system.config['thresholds']['critical_incidents']
+            existing = self.aggregates.snapshot(list(self.aggregates.days))
+            self.alerted = set(existing.loc[existing['recent_incidents'] >= threshold, 'customer_id'])
+
+        reader = threading.Thread(target=self._read, args=(source,), daemon=True)
+        reader.start()
+
+        batch = []
+        deadline = None
+        last_event = time.time()
+        finished = False
+        while not finished:
+            timeout = max(deadline - time.time(), 0) if batch else 0.1
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _END:
+                finished = True
+            elif item is not None:
+                batch.append(item)
+                last_event = time.time()
+                if len(batch) == 1:
+                    deadline = time.time() + self.max_wait
+
+            if batch and (finished or len(batch) >= self.batch_size or time.time() >= deadline):
+                self.process(conn, batch)
+                batch = []
+            if max_events is not None and self.stats.events >= max_events:
+                finished = True
+            if idle_timeout is not None and not batch and time.time() - last_event > idle_timeout:
+                finished = True
+
+        source.stop()
+        conn.close()
+        return self.stats.report()
+
+
+def make_event(customers=500, when=None):
+    """One synthetic SIEM incident event."""
+    when = when or datetime.now()
+    return {
+        'customer_id': f"CUST_{random.randint(1, customers):03d}",
+        'incident_timestamp': when.isoformat(timespec='microseconds'),
+        'source_ip': f"{random.randint(1, 223)}.{random.randint(0, 255)}.{random.randint(0, 255)}.{random.randint(1, 254)}",
+        'attack_type': random.choice(['Malware', 'DDoS', 'Intrusion']),
+        'severity_level': random.choices(['Low', 'Medium', 'High', 'Critical'], weights=[40, 35, 20, 5])[0],
+        'anomaly_score': round(random.uniform(0, 100), 2),
+        'emitted_at': time.time(),
+    }
+
+
+def _paced(n_events, rate):
+    started = time.time()
+    for i in range(n_events):
+        if rate:
+            delay = started + i / rate - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        yield (json.dumps(make_event()) + '\n').encode()
+
+
+def produce_file(path, n_events, rate=None):
+    """Append synthetic events to a JSONL file (a local stand-in for the SIEM feed)."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'ab') as f:
+        for line in _paced(n_events, rate):
+            f.write(line)
+            f.flush()
+
+
+def produce_socket(host, port, n_events, rate=None):
+    """Send synthetic events to a SocketSource."""
+    with socket.create_connection((host, port)) as conn:
+        for line in _paced(n_events, rate):
+            conn.sendall(line)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('command', choices=['run', 'produce'])
+    parser.add_argument('--file', default='../data/stream/incidents.jsonl')
+    parser.add_argument('--socket', type=int, help='listen on / send to this TCP port instead of a file')
+    parser.add_argument('--events', type=int, default=10000)
+    parser.add_argument('--rate', type=float, help='events/sec for the producer (default: as fast as possible)')
+    parser.add_argument('--max-events', type=int)
+    parser.add_argument('--idle-timeout', type=float)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--no-alerts', action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'produce':
+        if args.socket:
+            produce_socket('127.0.0.1', args.socket, args.events, args.rate)
+        else:
+            produce_file(args.file, args.events, args.rate)
+        print(f"Produced {args.events} events")
+        return
+
+    alert_system = None
+    if not args.no_alerts:
+        from alert_system import AlertSystem
+        alert_system = AlertSystem()
+    ingestor = StreamIngestor(batch_size=args.batch_size, alert_system=alert_system)
+    checkpoint = ingestor.load_checkpoint()
+    if args.socket:
+        source = SocketSource(port=args.socket, offset=checkpoint['offset'])
+    else:
+        source = FileTailSource(args.file, offset=checkpoint['offset'])
+
+    print(f"Streaming incidents (resuming at offset {checkpoint['offset']})...")
+    report = ingestor.run(source, max_events=args.max_events, idle_timeout=args.idle_timeout)
+    for key, value in report.items():
+        print(f"  {key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""Spans, counters and memory snapshots for pipeline stages, exported as JSON lines and Chrome traces.
+
+Tracing is off unless PIPELINE_TRACE_DIR is set (or enable() is called); when
+off, span() hands back a shared no-op and traced functions call straight
+through. PIPELINE_TRACE_MEMORY=1 adds tracemalloc peaks per span, which slows
+allocation-heavy code noticeably, so it is opt-in even when tracing.
+"""
+
+import os
+import json
+import time
+import atexit
+import resource
+import threading
+import functools
+import tracemalloc
+from datetime import datetime
+
+_state = None
+
+
+class _NullSpan:
+    """Stands in for a span when tracing is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, **counters):
+        pass
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    def __init__(self, state, name, attrs):
+        self.state = state
+        self.name = name
+        self.attrs = attrs
+        self.counters = {}
+        self.parent = None
+        self.traced_peak = 0
+
+    def add(self, **counters):
+        """Add to this span's counters (rows, bytes_read, ...)."""
+        for key, value in counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = self.state.stack()
+        self.parent = stack[-1] if stack else None
+        stack.append(self)
+        self.span_id = self.state.next_id()
+        self.rss_before = _peak_rss_mb()
+        if self.state.memory:
+            # Fold the peak so far into the parent before this span takes over the counter
+            peak = tracemalloc.get_traced_memory()[1]
+            if self.parent is not None:
+                self.parent.traced_peak = max(self.parent.traced_peak, peak)
+            tracemalloc.reset_peak()
+            self.traced_start = tracemalloc.get_traced_memory()[0]
+        self.wall_start = time.time()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.started
+        record = {
+            'name': self.name,
+            'span_id': self.span_id,
+            'parent_id': self.parent.span_id if self.parent is not None else None,
+            'start_us': int(self.wall_start * 1e6),
+            'duration_ms': duration * 1000,
+            'peak_rss_mb': _peak_rss_mb(),
+            'rss_growth_mb': _peak_rss_mb() - self.rss_before,
+        }
+        if self.state.memory:
+            self.traced_peak = max(self.traced_peak, tracemalloc.get_traced_memory()[1])
+            record['traced_peak_mb'] = (self.traced_peak - self.traced_start) / 1e6
+            if self.parent is not None:
+                self.parent.traced_peak = max(self.parent.traced_peak, self.traced_peak)
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        record['counters'] = self.counters
+        record['attrs'] = self.attrs
+        self.state.stack().pop()
+        self.state.write(record)
+        return False
+
+
+class _TraceState:
+    def __init__(self, trace_dir, run_id, memory):
+        self.trace_dir = trace_dir
+        self.run_id = run_id
+        self.memory = memory
+        self.run_dir = os.path.join(trace_dir, run_id)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.pid = None
+        self.file = None
+        self.counter = 0
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def next_id(self):
+        with self.lock:
+            self.counter += 1
+            return f"{os.getpid()}-{self.counter}"
+
+    def write(self, record):
+        record.update(run_id=self.run_id, pid=os.getpid(), tid=threading.get_ident())
+        line = json.dumps(record, default=str) + '\n'
+        with self.lock:
+            if self.pid != os.getpid():
+                # Forked workers write their own file rather than the parent's handle
+                os.makedirs(self.run_dir, exist_ok=True)
+                self.file = open(os.path.join(self.run_dir, f"spans-{os.getpid()}.jsonl"), 'a')
+                self.pid = os.getpid()
+            self.file.write(line)
+            self.file.flush()
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def enable(trace_dir='../data/traces', memory=None, run_id=None):
+    """Turn tracing on for this process and any processes it starts."""
+    global _state
+    run_id = run_id or os.environ.get('PIPELINE_RUN_ID') or datetime.now().strftime('%Y%m%d-%H%M%S')
+    memory = os.environ.get('PIPELINE_TRACE_MEMORY') == '1' if memory is None else memory
+    os.environ.update(PIPELINE_TRACE_DIR=trace_dir, PIPELINE_RUN_ID=run_id,
+                      PIPELINE_TRACE_MEMORY='1' if memory else '0')
+    if 'PIPELINE_TRACE_OWNER' not in os.environ:
+        os.environ['PIPELINE_TRACE_OWNER'] = str(os.getpid())
+        atexit.register(_export_at_exit)
+    _state = _TraceState(trace_dir, run_id, memory)
+    return _state.run_dir
+
+
+def enabled():
+    return _state is not None
+
+
+def span(name, **attrs):
+    """Context manager timing a block; ``with span('x') as s: s.add(rows=n)``."""
+    if _state is None:
+        return _NULL_SPAN
+    return Span(_state, name, attrs)
+
+
+def traced(name=None):
+    """Decorator running the function inside a span (named after it by default)."""
+    def decorate(fn):
+        span_name = name or f"{fn.__module__}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _state is None:
+                return fn(*args, **kwargs)
+            with Span(_state, span_name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def current_span():
+    """Innermost open span on this thread (a no-op span when there is none)."""
+    if _state is None:
+        return _NULL_SPAN
+    stack = _state.stack()
+    return stack[-1] if stack else _NULL_SPAN
+
+
+def count(**counters):
+    """Add counters to the innermost open span."""
+    if _state is not None:
+        current_span().add(**counters)
+
+
+def record(name, start, duration, **attrs):
+    """Record a span timed elsewhere (e.g. a dbt model); ``start`` is epoch seconds."""
+    if _state is None:
+        return
+    parent = current_span()
+    _state.write({
+        'name': name, 'span_id': _state.next_id(),
+        'parent_id': getattr(parent, 'span_id', None),
+        'start_us': int(start * 1e6), 'duration_ms': duration * 1000,
+        'counters': {}, 'attrs': attrs,
+    })
+
+
+def record_dbt_results(run_results_path):
+    """Turn dbt's run_results.json into one span per model."""
+    if _state is None or not os.path.exists(run_results_path):
+        return
+    with open(run_results_path) as f:
+        results = json.load(f).get('results', [])
+    for result in results:
+        timing = [t for t in result.get('timing', []) if t.get('started_at') and t.get('completed_at')]
+        if not timing:
+            continue
+        start = min(_iso_seconds(t['started_at']) for t in timing)
+        end = max(_iso_seconds(t['completed_at']) for t in timing)
+        response = result.get('adapter_response') or {}
+        record(f"dbt.{result.get('unique_id', 'node')}", start, end - start,
+               status=result.get('status'), rows_affected=response.get('rows_affected'))
+
+
+def _iso_seconds(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+def duckdb_profile(cursor):
+    """Headline metrics of the last query on ``cursor`` if profiling is on, else {}."""
+    get_info = getattr(cursor, 'get_profiling_information', None)
+    if get_info is None:
+        return {}
+    try:
+        info = json.loads(get_info(format='json'))
+    except Exception:
+        return {}
+    keys = ('latency', 'cpu_time', 'rows_returned', 'cumulative_rows_scanned',
+            'total_bytes_read', 'system_peak_buffer_memory')
+    return {key: info[key] for key in keys if key in info}
+
+
+def load_spans(run_dir):
+    spans = []
+    for name in sorted(os.listdir(run_dir)):
+        if name.startswith('spans-') and name.endswith('.jsonl'):
+            with open(os.path.join(run_dir, name)) as f:
+                spans.extend(json.loads(line) for line in f if line.strip())
+    return spans
+
+
+def export_chrome(run_dir, output_path=None):
+    """Write the run's spans as a Chrome trace (chrome://tracing, Perfetto)."""
+    events = []
+    for s in load_spans(run_dir):
+        args = dict(s.get('attrs', {}), **s.get('counters', {}))
+        for key in ('peak_rss_mb', 'rss_growth_mb', 'traced_peak_mb', 'error'):
+            if key in s:
+                args[key] = s[key]
+        events.append({'name': s['name'], 'cat': s['name'].split('.', 1)[0], 'ph': 'X',
+                       'ts': s['start_us'], 'dur': int(s['duration_ms'] * 1000),
+                       'pid': s['pid'], 'tid': s['tid'], 'args': args})
+    output_path = output_path or os.path.join(run_dir, 'trace.json')
+    with open(output_path + '.tmp', 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, default=str)
+    os.replace(output_path + '.tmp', output_path)
+    return output_path
+
+
+def summarize(run_dir):
+    """Per span name: calls, total/max ms, summed counters and the highest peak RSS."""
+    summary = {}
+    for s in load_spans(run_dir):
+        entry = summary.setdefault(s['name'], {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                                               'peak_rss_mb': 0.0, 'counters': {}})
+        entry['calls'] += 1
+        entry['total_ms'] += s['duration_ms']
+        entry['max_ms'] = max(entry['max_ms'], s['duration_ms'])
+        entry['peak_rss_mb'] = max(entry['peak_rss_mb'], s.get('peak_rss_mb') or 0.0)
+        for key, value in s.get('counters', {}).items():
+            entry['counters'][key] = entry['counters'].get(key, 0) + value
+    return dict(sorted(summary.items(), key=lambda item: item[1]['total_ms'], reverse=True))
+
+
+def _export_at_exit():
+    if _state is not None and str(os.getpid()) == os.environ.get('PIPELINE_TRACE_OWNER'):
+        if os.path.isdir(_state.run_dir):
+            export_chrome(_state.run_dir)
+
+
+if os.environ.get('PIPELINE_TRACE_DIR'):
+    enable(os.environ['PIPELINE_TRACE_DIR'])
+
+
+def main():
+    import sys
+
+    trace_dir = os.environ.get('PIPELINE_TRACE_DIR', '../data/traces')
+    runs = sorted(os.listdir(trace_dir)) if os.path.isdir(trace_dir) else []
+    if not runs:
+        print(f"No traced runs in {trace_dir}")
+        return
+    run_id = sys.argv[2] if len(sys.argv) > 2 else runs[-1]
+    run_dir = os.path.join(trace_dir, run_id)
+    if len(sys.argv) > 1 and sys.argv[1] == 'chrome':
+        print(f"Chrome trace written to {export_chrome(run_dir)}")
+        return
+
+    print(f"Run {run_id}")
+    print(f"{'span':<45} {'calls':>6} {'total ms':>10} {'max ms':>10} {'rss MB':>8}  counters")
+    for name, entry in summarize(run_dir).items():
+        counters = ', '.join(f"{k}={v:,}" for k, v in entry['counters'].items())
+        print(f"{name[:45]:<45} {entry['calls']:>6} {entry['total_ms']:>10.1f} "
+              f"{entry['max_ms']:>10.1f} {entry['peak_rss_mb']:>8.0f}  {counters}")
+
+
+if __name__ == "__main__":
+    main()
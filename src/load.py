@@ -1,24 +1,38 @@
+import os
 import pandas as pd
 from datetime import datetime
+from instrumentation import traced, count
 
-def load_to_processed():
+@traced('load.processed')
+def load_to_processed(raw_dir='../data/raw', processed_dir='../data/processed',
+                      ledger_path='../data/revenue_ledger.duckdb', dim_path='../data/dimensions/customer_dim.csv'):
     """Load transformed data to processed directory"""
-    from transform import calculate_customer_health_score
+    from transform import calculate_customer_health_score, load_health_inputs
+    from customer_dim import CustomerDimension
     
     # Calculate health scores
-    health_data = calculate_customer_health_score()
+    health_data = calculate_customer_health_score(load_health_inputs(raw_dir), CustomerDimension(dim_path))
     
     # Save to processed directory
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_file = f"../data/processed/customer_health_scores_{timestamp}.csv"
+    output_file = f"{processed_dir}/customer_health_scores_{timestamp}.csv"
     
     health_data.to_csv(output_file, index=False)
     
     # Create latest version
-    health_data.to_csv("../data/processed/customer_health_scores_latest.csv", index=False)
+    health_data.to_csv(f"{processed_dir}/customer_health_scores_latest.csv", index=False)
+    count(rows=len(health_data))
     
     print(f"Loaded {len(health_data)} records to {output_file}")
     
+    # Re-bucket MRR-at-risk rollups for customers whose health category changed
+    if os.path.exists(ledger_path):
+        from revenue_ledger import RevenueLedger
+        ledger = RevenueLedger(ledger_path)
+        moved = ledger.update_health(health_data.set_index('customer_id')['health_category'])
+        ledger.close()
+        print(f"Revenue ledger: {moved} customers changed health category")
+    
     # Summary statistics
     print("\nHealth Score Distribution:")
     print(health_data['health_category'].value_counts())
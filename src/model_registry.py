@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""Versioned model registry with checksums, schema fingerprints and lazy loading."""
+
+import os
+import json
+import fcntl
+import shutil
+import hashlib
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+import joblib
+
+LoadedModel = namedtuple('LoadedModel', ['version', 'model', 'scaler', 'manifest'])
+
+ARTIFACTS = ('model.pkl', 'scaler.pkl')
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+class RegistryError(Exception):
+    """Raised when a registered model cannot be loaded safely."""
+
+
+class SchemaMismatchError(RegistryError):
+    """Raised when the caller's feature columns differ from the model's."""
+
+
+def schema_fingerprint(feature_cols):
+    """Fingerprint of an ordered list of feature columns."""
+    return hashlib.sha256('\x1f'.join(feature_cols).encode()).hexdigest()[:16]
+
+
+def file_checksum(path):
+    """SHA-256 of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    def __init__(self, root='../models'):
+        self.root = root
+
+    def versions(self):
+        """List registered versions, oldest first."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root)
+                      if name.startswith('v') and name[1:].isdigit()
+                      and os.path.exists(os.path.join(self.root, name, 'manifest.json')))
+
+    def current_version(self):
+        """Version the CURRENT pointer refers to, or None if nothing is registered."""
+        try:
+            with open(os.path.join(self.root, 'CURRENT')) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def set_current(self, version):
+        """Atomically repoint CURRENT at an existing version."""
+        if version not in self.versions():
+            raise RegistryError(f"Unknown model version: {version}")
+        tmp_path = os.path.join(self.root, f"CURRENT.tmp-{os.getpid()}")
+        with open(tmp_path, 'w') as f:
+            f.write(version)
+        os.replace(tmp_path, os.path.join(self.root, 'CURRENT'))
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock on the registry, held while a version number is taken and published."""
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, '.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def register(self, model, scaler, feature_cols, metadata=None, make_current=True,
+                 extra_artifacts=None):
+        """Store a model as a new immutable version directory.
+
+        ``extra_artifacts`` maps file names to callables that write the artifact
+        to a given path; they are checksummed like the model itself. Artifacts
+        are written to a per-process directory first; the next version number
+        is only taken under the registry lock, so concurrent trainings each
+        get their own version.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        tmp_dir = os.path.join(self.root, f".register-{os.getpid()}-{threading.get_ident()}.tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        # Uncompressed dumps so arrays can be memory-mapped on load
+        joblib.dump(model, os.path.join(tmp_dir, 'model.pkl'))
+        joblib.dump(scaler, os.path.join(tmp_dir, 'scaler.pkl'))
+        for name, writer in (extra_artifacts or {}).items():
+            writer(os.path.join(tmp_dir, name))
+
+        artifacts = sorted(set(ARTIFACTS) | set(extra_artifacts or {}))
+        checksums = {name: file_checksum(os.path.join(tmp_dir, name)) for name in artifacts}
+
+        with self._locked():
+            # Any directory named like a version counts, complete or not
+            taken = [int(name[1:]) for name in os.listdir(self.root) if name.startswith('v') and name[1:].isdigit()]
+            version = f"v{max(taken, default=0) + 1:04d}"
+            manifest = {
+                'version': version,
+                'registered_at': datetime.now().isoformat(),
+                'feature_cols': list(feature_cols),
+                'feature_schema': schema_fingerprint(feature_cols),
+                'checksums': checksums,
+                'metadata': metadata or {},
+            }
+            with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(tmp_dir, os.path.join(self.root, version))
+            if make_current:
+                self.set_current(version)
+        return version
+
+    def manifest(self, version=None):
+        """Read a version's manifest (the current one by default)."""
+        version = version or self.current_version()
+        if version is None:
+            raise RegistryError(f"No model registered in {self.root}")
+        with open(os.path.join(self.root, version, 'manifest.json')) as f:
+            return json.load(f)
+
+    def artifact_path(self, name, version=None):
+        """Path of an artifact inside a version directory."""
+        return os.path.join(self.root, version or self.current_version(), name)
+
+    def verify(self, version):
+        """Check every artifact against the checksums recorded at registration."""
+        manifest = self.manifest(version)
+        for name, expected in manifest['checksums'].items():
+            if file_checksum(os.path.join(self.root, version, name)) != expected:
+                raise RegistryError(f"Checksum mismatch for {version}/{name}")
+        return manifest
+
+    def load(self, version=None, feature_cols=None, mmap_mode='r', verify=True):
+        """Load a version from disk, bypassing the process-wide cache."""
+        version = version or self.current_version()
+        if version is None:
+            raise RegistryError(f"No model registered in {self.root}")
+        manifest = self.verify(version) if verify else self.manifest(version)
+
+        if feature_cols is not None and schema_fingerprint(feature_cols) != manifest['feature_schema']:
+            raise SchemaMismatchError(
+                f"Model {version} was trained on {manifest['feature_cols']}, "
+                f"got {list(feature_cols)}")
+
+        model = joblib.load(os.path.join(self.root, version, 'model.pkl'), mmap_mode=mmap_mode)
+        scaler = joblib.load(os.path.join(self.root, version, 'scaler.pkl'), mmap_mode=mmap_mode)
+        return LoadedModel(version, model, scaler, manifest)
+
+
+def get_model(root='../models', version=None, feature_cols=None):
+    """Load a model once per process and share it between callers."""
+    registry = ModelRegistry(root)
+    version = version or registry.current_version()
+    if version is None:
+        raise RegistryError(f"No model registered in {root}")
+
+    key = (os.path.abspath(root), version)
+    with _cache_lock:
+        loaded = _cache.get(key)
+        if loaded is None:
+            loaded = registry.load(version)
+            _cache[key] = loaded
+
+    if feature_cols is not None and schema_fingerprint(feature_cols) != loaded.manifest['feature_schema']:
+        raise SchemaMismatchError(
+            f"Model {version} was trained on {loaded.manifest['feature_cols']}, "
+            f"got {list(feature_cols)}")
+    return loaded
+
+
+def clear_cache():
+    """Drop all cached models (e.g. after registering a new version)."""
+    with _cache_lock:
+        _cache.clear()
+
+
+def main():
+    import sys
+
+    registry = ModelRegistry()
+    if len(sys.argv) > 2 and sys.argv[1] == 'promote':
+        registry.set_current(sys.argv[2])
+
+    current = registry.current_version()
+    for version in registry.versions():
+        manifest = registry.manifest(version)
+        marker = '*' if version == current else ' '
+        print(f"{marker} {version}  {manifest['registered_at']}  schema={manifest['feature_schema']}")
+
+
+if __name__ == "__main__":
+    main()
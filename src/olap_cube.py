@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""Pre-aggregated OLAP cubes for slicing incidents and customers by dimension and time."""
+
+import os
+import json
+import time
+import shutil
+import glob
+import numpy as np
+import pandas as pd
+from db_connections import get_manager
+
+# Each cube is stored at day grain over all of its dimensions, one Parquet
+# partition per month of ``time_col``; measures are kept as count/sum/sum of
+# squares so any coarser rollup (and its means and variances) can be derived.
+CUBES = {
+    'security_incidents': {
+        'db_path': '../data/cybersec_health_dbt.duckdb',
+        'source': "stg_security_incidents i LEFT JOIN customers c USING (customer_id)",
+        'time_col': 'i.incident_timestamp',
+        'dims': {
+            'industry': 'c.industry',
+            'risk_score': 'c.risk_score',
+            'severity_level': 'i.severity_level',
+            'attack_type': 'i.attack_type',
+        },
+        'measures': {
+            'severity_score': 'i.severity_score',
+            'anomaly_score': 'i.anomaly_score',
+        },
+    },
+    'customers': {
+        # Partitioned by renewal month, so "value up for renewal" slices by time
+        'db_path': '../data/cybersec_health_dbt.duckdb',
+        'source': "customers c",
+        'time_col': 'c.contract_end_date',
+        'dims': {
+            'industry': 'c.industry',
+            'risk_score': 'c.risk_score',
+        },
+        'measures': {
+            'contract_value': 'c.contract_value',
+            'monthly_recurring_revenue': 'c.monthly_recurring_revenue',
+        },
+    },
+}
+
+TIME_GRAINS = ('day', 'week', 'month', 'quarter', 'year')
+
+# Dimension member for NULLs (e.g. incidents with no matching customer), so
+# they are counted and can be sliced like any other member
+NULL_MEMBER = '(none)'
+
+# Grains a cuboid at each grain can be rolled up to. Weeks straddle month,
+# quarter and year boundaries, so a week cuboid only answers week queries.
+GRAIN_ROLLUPS = {
+    'day': set(TIME_GRAINS),
+    'week': {'week'},
+    'month': {'month', 'quarter', 'year'},
+    'quarter': {'quarter', 'year'},
+    'year': {'year'},
+}
+
+
+def _month_expr(time_col):
+    return f"strftime(date_trunc('month', {time_col}), '%Y-%m')"
+
+
+class OlapCube:
+    def __init__(self, name, config=None, root='../data/cube'):
+        self.name = name
+        self.config = config or CUBES[name]
+        self.root = os.path.join(root, name)
+        self.dims = list(self.config['dims'])
+        self.measures = list(self.config['measures'])
+        self._cells = None
+        self._cuboids = {}
+
+    def _state_path(self):
+        return os.path.join(self.root, 'state.json')
+
+    def load_state(self):
+        try:
+            with open(self._state_path()) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'partitions': {}}
+
+    def partition_fingerprints(self):
+        """{month: fingerprint} of the source rows, from one aggregate-only scan."""
+        config = self.config
+        columns = ', '.join(list(config['dims'].values()) + list(config['measures'].values()))
+        rows = get_manager().fetch_df(config['db_path'], f"""
+            SELECT {_month_expr(config['time_col'])} AS month,
+                   COUNT(*) AS row_count,
+                   CAST(SUM(hash({columns}, {config['time_col']})) AS VARCHAR) AS content_hash
+            FROM {config['source']}
+            WHERE {config['time_col']} IS NOT NULL
+            GROUP BY 1
+        """, label=f"cube_fingerprint:{self.name}")
+        return {r.month: f"{r.row_count}:{r.content_hash}" for r in rows.itertuples()}
+
+    def build_query(self):
+        """Day-grain aggregation over all dimensions for the months bound as ``?``."""
+        config = self.config
+        dims = [f"CAST({expr} AS VARCHAR) AS {name}" for name, expr in config['dims'].items()]
+        measures = []
+        for name, expr in config['measures'].items():
+            measures += [f"COUNT({expr}) AS cnt_{name}",
+                         f"SUM({expr})::DOUBLE AS sum_{name}",
+                         f"SUM(({expr})::DOUBLE * ({expr})::DOUBLE) AS sumsq_{name}"]
+        return f"""
+            SELECT {_month_expr(config['time_col'])} AS month,
+                   CAST({config['time_col']} AS DATE) AS day,
+                   {', '.join(dims)},
+                   COUNT(*) AS n,
+                   {', '.join(measures)}
+            FROM {config['source']}
+            WHERE {_month_expr(config['time_col'])} IN (SELECT UNNEST(?::VARCHAR[]))
+            GROUP BY ALL
+        """
+
+    def refresh(self, full=False):
+        """Rebuild only the month partitions whose source rows changed."""
+        state = self.load_state()
+        fingerprints = self.partition_fingerprints()
+        changed = sorted(m for m, fp in fingerprints.items() if full or state['partitions'].get(m) != fp)
+        removed = sorted(set(state['partitions']) - set(fingerprints))
+
+        if changed:
+            cells = get_manager().fetch_df(self.config['db_path'], self.build_query(), [changed],
+                                           label=f"cube_build:{self.name}")
+            for month, part in cells.groupby('month', sort=False):
+                self._write_partition(month, part.drop(columns='month'))
+            # A month can match nothing after the GROUP BY only if it had no rows
+            for month in set(changed) - set(cells['month']):
+                self._write_partition(month, cells.iloc[:0].drop(columns='month'))
+        for month in removed:
+            shutil.rmtree(os.path.join(self.root, f"month={month}"), ignore_errors=True)
+
+        state['partitions'] = fingerprints
+        os.makedirs(self.root, exist_ok=True)
+        with open(self._state_path() + '.tmp', 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(self._state_path() + '.tmp', self._state_path())
+        self._cells = None
+        self._cuboids = {}
+        return {'rebuilt': changed, 'removed': removed,
+                'unchanged': len(fingerprints) - len(changed)}
+
+    def _write_partition(self, month, cells):
+        partition = os.path.join(self.root, f"month={month}")
+        tmp_partition = partition + '.tmp'
+        shutil.rmtree(tmp_partition, ignore_errors=True)
+        os.makedirs(tmp_partition)
+        cells.to_parquet(os.path.join(tmp_partition, 'part-0.parquet'), index=False)
+        shutil.rmtree(partition, ignore_errors=True)
+        os.replace(tmp_partition, partition)
+
+    def cells(self):
+        """Base cuboid (day grain, all dimensions) with derived time grains; cached."""
+        if self._cells is None:
+            paths = sorted(glob.glob(os.path.join(self.root, 'month=*', 'part-0.parquet')))
+            frames = [pd.read_parquet(p) for p in paths]
+            cells = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(
+                columns=['day'] + self.dims + ['n'])
+            day = pd.to_datetime(cells['day'])
+            cells['day'] = day
+            cells['week'] = (day - pd.to_timedelta(day.dt.weekday, unit='D')).dt.strftime('%Y-%m-%d')
+            cells['month'] = day.dt.strftime('%Y-%m')
+            cells['quarter'] = day.dt.year.astype(str) + '-Q' + day.dt.quarter.astype(str)
+            cells['year'] = day.dt.year.astype(str)
+            for col in self.dims:
+                cells[col] = cells[col].fillna(NULL_MEMBER).astype('category')
+            for col in ('week', 'month', 'quarter', 'year'):
+                cells[col] = cells[col].astype('category')
+            self._cells = cells
+            self._cuboids = {tuple(self.dims) + ('day',): cells}
+        return self._cells
+
+    def _additive_cols(self):
+        cols = ['n']
+        for name in self.measures:
+            cols += [f"cnt_{name}", f"sum_{name}", f"sumsq_{name}"]
+        return cols
+
+    def rollup(self, by=(), where=None):
+        """Additive cells grouped by ``by`` (dimensions and/or time grains) after filtering.
+
+        The rollup is derived from the smallest cached cuboid that still has every
+        column needed, and cached itself, so repeated slices get cheaper.
+        """
+        self.cells()
+        by = list(by)
+        where = where or {}
+        needed = set(by) | set(where)
+        unknown = needed - set(self.dims) - set(TIME_GRAINS)
+        if unknown:
+            raise KeyError(f"unknown cube columns: {sorted(unknown)}")
+
+        key = tuple(sorted(needed))
+        source = self._cuboids.get(key)
+        if source is None:
+            candidates = [(len(c), c) for cols, c in self._cuboids.items()
+                          if needed <= set(cols) | _implied_grains(cols)]
+            parent = min(candidates, key=lambda item: item[0])[1]
+            source = self._group(parent, list(key))
+            self._cuboids[key] = source
+
+        mask = np.ones(len(source), dtype=bool)
+        for col, value in where.items():
+            mask &= _match(source[col], value)
+        return self._group(source[mask], by)
+
+    def _group(self, cells, by):
+        if not by:
+            return cells[self._additive_cols()].sum().to_frame().T
+        by_cols = [c for c in by if c in cells]
+        missing = [c for c in by if c not in cells]
+        if missing:
+            # Coarser time grains are derived from a finer one present in the cuboid
+            cells = cells.assign(**{g: _derive_grain(cells, g) for g in missing})
+        grouped = cells.groupby(by_cols + missing, observed=True, dropna=False)[self._additive_cols()].sum()
+        return grouped.reset_index()
+
+    def query(self, by=(), where=None, measures=None):
+        """Slice/dice the cube; ``measures`` like ['count', 'sum:x', 'mean:x', 'var:x', 'std:x']."""
+        cells = self.rollup(by, where)
+        measures = measures or ['count'] + [f"mean:{m}" for m in self.measures]
+        result = cells[list(by)].copy()
+        for spec in measures:
+            agg, _, name = spec.partition(':')
+            if agg == 'count':
+                result['count'] = cells['n'].astype(np.int64)
+                continue
+            cnt, total, sumsq = cells[f"cnt_{name}"], cells[f"sum_{name}"], cells[f"sumsq_{name}"]
+            if agg == 'sum':
+                result[spec] = total
+            elif agg == 'mean':
+                result[spec] = total / cnt.where(cnt > 0)
+            elif agg in ('var', 'std'):
+                var = (sumsq - total ** 2 / cnt.where(cnt > 0)) / (cnt - 1).where(cnt > 1)
+                result[spec] = var.clip(lower=0) if agg == 'var' else np.sqrt(var.clip(lower=0))
+            else:
+                raise ValueError(f"unknown measure {spec!r}")
+        return result
+
+
+def _implied_grains(cols):
+    """Time grains that can be rolled up exactly from the grains among ``cols``."""
+    implied = set()
+    for grain in TIME_GRAINS:
+        if grain in cols:
+            implied |= GRAIN_ROLLUPS[grain]
+    return implied
+
+
+def _derive_grain(cells, grain):
+    """Coarser time grain computed from a finer grain column in ``cells`` that nests in it.
+
+    Weeks never serve as the source: only ``day`` can produce a week, and a
+    week cannot produce anything else.
+    """
+    if 'day' in cells:
+        day = pd.to_datetime(cells['day'])
+    elif 'month' in cells:
+        day = pd.to_datetime(cells['month'].astype(str) + '-01')
+    elif 'quarter' in cells:
+        day = pd.PeriodIndex(cells['quarter'].astype(str), freq='Q').to_timestamp()
+    else:
+        day = pd.to_datetime(cells['year'].astype(str) + '-01-01')
+    day = pd.Series(day, index=cells.index)
+    if grain == 'week':
+        return (day - pd.to_timedelta(day.dt.weekday, unit='D')).dt.strftime('%Y-%m-%d')
+    if grain == 'month':
+        return day.dt.strftime('%Y-%m')
+    if grain == 'quarter':
+        return day.dt.year.astype(str) + '-Q' + day.dt.quarter.astype(str)
+    return day.dt.year.astype(str)
+
+
+def _match(column, value):
+    """Filter mask: scalar equality, list membership, or a (low, high) half-open range."""
+    if isinstance(value, tuple):
+        low, high = value
+        # Time grains are ISO-formatted strings, so ranges compare lexically
+        is_time = pd.api.types.is_datetime64_any_dtype(column)
+        values = column if is_time else column.astype(str)
+        bound = pd.Timestamp if is_time else str
+        mask = np.ones(len(column), dtype=bool)
+        if low is not None:
+            mask &= (values >= bound(low)).to_numpy()
+        if high is not None:
+            mask &= (values < bound(high)).to_numpy()
+        return mask
+    if isinstance(value, (list, set)):
+        return column.isin(list(value)).to_numpy()
+    return (column == value).to_numpy()
+
+
+def check_grains(name, root='../data/cube'):
+    """Answer every time grain from a fresh cube and from one warmed by every other query.
+
+    The cuboid cache must never change an answer; returns the grains whose
+    warmed result differs from the fresh one (empty when consistent).
+    """
+    def normalized(frame, by):
+        return frame.sort_values(by).reset_index(drop=True).astype({c: str for c in by})
+
+    mismatches = []
+    for grain in TIME_GRAINS:
+        fresh = OlapCube(name, root=root)
+        expected = normalized(fresh.query([grain]), [grain])
+
+        warmed = OlapCube(name, root=root)
+        for other in TIME_GRAINS:
+            if other != grain:
+                warmed.query([other])
+            # Every dimension, so a member lost by one of its rollups shows up
+            for dim in warmed.dims:
+                warmed.query([other, dim])
+        actual = normalized(warmed.query([grain]), [grain])
+
+        same = expected.shape == actual.shape and expected[grain].equals(actual[grain])
+        if same:
+            numeric = expected.columns.drop(grain)
+            same = np.allclose(expected[numeric].to_numpy(dtype=float), actual[numeric].to_numpy(dtype=float),
+                               equal_nan=True)
+        if not same:
+            mismatches.append(grain)
+    return mismatches
+
+
+def main():
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('command', choices=['refresh', 'query', 'check'])
+    parser.add_argument('cube', nargs='?')
+    parser.add_argument('--by', default='', help='comma-separated dimensions/time grains')
+    parser.add_argument('--where', action='append', default=[],
+                        help='col=value, col=a|b (any of) or col=low..high (range)')
+    parser.add_argument('--measure', action='append', help="e.g. count, sum:contract_value, std:anomaly_score")
+    parser.add_argument('--full', action='store_true', help='rebuild every partition')
+    args = parser.parse_args()
+
+    if args.command == 'refresh':
+        for name in [args.cube] if args.cube else CUBES:
+            started = time.perf_counter()
+            result = OlapCube(name).refresh(full=args.full)
+            print(f"{name}: rebuilt {len(result['rebuilt'])} month(s), removed {len(result['removed'])}, "
+                  f"{result['unchanged']} unchanged ({time.perf_counter() - started:.2f}s)")
+        return
+
+    if args.command == 'check':
+        failed = False
+        for name in [args.cube] if args.cube else CUBES:
+            mismatches = check_grains(name)
+            print(f"{name}: {'cached rollups match fresh ones' if not mismatches else 'MISMATCH in ' + ', '.join(mismatches)}")
+            failed |= bool(mismatches)
+        if failed:
+            sys.exit(1)
+        return
+
+    where = {}
+    for clause in args.where:
+        col, _, value = clause.partition('=')
+        if '..' in value:
+            low, high = value.split('..', 1)
+            where[col] = (low or None, high or None)
+        elif '|' in value:
+            where[col] = value.split('|')
+        else:
+            where[col] = value
+    cube = OlapCube(args.cube)
+    cube.cells()
+    started = time.perf_counter()
+    result = cube.query([c for c in args.by.split(',') if c], where, args.measure)
+    elapsed = time.perf_counter() - started
+    print(result.to_string(index=False))
+    print(f"\n{len(result)} rows in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
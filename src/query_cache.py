@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""Result cache for read queries, keyed by normalized SQL, parameters and the versions of the data read.
+
+A query's data version is the published snapshot it runs against (snapshots
+are immutable, so a new dbt run means a new version) plus a size/mtime
+fingerprint of every file it reads through read_csv/read_parquet/..., found
+by walking DuckDB's parse tree and the definitions of any views it uses.
+Queries calling CURRENT_DATE/today() are keyed on the date as well; queries
+calling now(), random() and the like are never cached.
+
+Results are Arrow tables held in an in-memory LRU with a byte budget. Entries
+pushed out of memory, and any result that took longer than ``share_ms`` to
+compute, are written as Arrow IPC files to a disk tier that other processes
+read (memory-mapped) too; the disk tier has its own byte budget.
+"""
+
+import os
+import re
+import glob
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import date
+import duckdb
+import pyarrow as pa
+import pyarrow.ipc as ipc
+from instrumentation import span, count
+
+DEFAULT_CACHE_DIR = os.environ.get('QUERY_CACHE_DIR') or \
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'query_cache')
+
+FILE_FUNCTIONS = {'read_csv', 'read_csv_auto', 'read_parquet', 'parquet_scan', 'read_json',
+                  'read_json_auto', 'read_ndjson', 'read_ndjson_auto'}
+# Functions whose value only changes day to day, so the date joins the key
+DAILY_FUNCTIONS = {'current_date', 'today'}
+VOLATILE_FUNCTIONS = {'now', 'current_timestamp', 'get_current_timestamp', 'current_time', 'localtime',
+                      'localtimestamp', 'transaction_timestamp', 'random', 'uuid', 'gen_random_uuid',
+                      'setseed', 'nextval', 'currval'}
+
+SQL_TOKENS = re.compile(r"""
+    (?P<literal>'(?:[^']|'')*')
+  | (?P<ident>"(?:[^"]|"")*")
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<space>\s+)
+  | (?P<word>[^'"\s/-]+|.)
+""", re.S | re.X)
+
+VIEW_BODY = re.compile(r'^\s*CREATE\s+(?:OR\s+REPLACE\s+)?(?:TEMP(?:ORARY)?\s+)?VIEW\s+.+?\s+AS\s+(.*?);?\s*$',
+                       re.S | re.I)
+
+
+def normalize_sql(sql):
+    """Case-fold and collapse whitespace outside quotes, drop comments and a trailing ';'."""
+    parts = []
+    for match in SQL_TOKENS.finditer(sql):
+        kind = match.lastgroup
+        if kind in ('literal', 'ident'):
+            parts.append(match.group())
+        elif kind in ('comment', 'space'):
+            if parts and parts[-1] != ' ':
+                parts.append(' ')
+        else:
+            parts.append(match.group().lower())
+    return ''.join(parts).strip().rstrip(';').strip()
+
+
+def _param_key(params):
+    # NumPy scalars hash like their Python values; anything else falls back to repr
+    return json.dumps(params, sort_keys=True, default=lambda v: v.item() if hasattr(v, 'item') else repr(v))
+
+
+def _is_remote(path):
+    return '://' in path
+
+
+class QueryAnalysis:
+    """Tables, files and time dependence of one SELECT, from DuckDB's parse tree (no binding)."""
+
+    def __init__(self, tables=(), files=(), daily=False, volatile=False):
+        self.tables = set(tables)
+        self.files = set(files)
+        self.daily = daily
+        self.volatile = volatile
+
+    def merge(self, other):
+        self.tables |= other.tables
+        self.files |= other.files
+        self.daily = self.daily or other.daily
+        self.volatile = self.volatile or other.volatile
+
+    def walk(self, node):
+        if isinstance(node, list):
+            for child in node:
+                self.walk(child)
+            return
+        if not isinstance(node, dict):
+            return
+        kind = node.get('type')
+        if kind == 'BASE_TABLE':
+            name = node.get('table_name', '')
+            # Replacement scans: FROM 'data/x.parquet'
+            if '/' in name or '*' in name or re.search(r'\.(csv|parquet|json|tsv)(\.gz)?$', name, re.I):
+                self.files.add(name)
+            else:
+                self.tables.add(name.lower())
+        elif node.get('class') == 'FUNCTION':
+            name = (node.get('function_name') or '').lower()
+            if name in FILE_FUNCTIONS:
+                self.files.update(_string_constants(node.get('children', [])))
+            elif name in VOLATILE_FUNCTIONS:
+                self.volatile = True
+            elif name in DAILY_FUNCTIONS:
+                self.daily = True
+        elif kind == 'COLUMN_REF' and len(node.get('column_names', [])) == 1:
+            # CURRENT_DATE and friends parse as bare column references
+            name = node['column_names'][0].lower()
+            self.volatile = self.volatile or name in VOLATILE_FUNCTIONS
+            self.daily = self.daily or name in DAILY_FUNCTIONS
+        for value in node.values():
+            if isinstance(value, (dict, list)):
+                self.walk(value)
+
+
+def _string_constants(node):
+    found = []
+    if isinstance(node, list):
+        for child in node:
+            found.extend(_string_constants(child))
+    elif isinstance(node, dict):
+        if node.get('type') == 'VALUE_CONSTANT':
+            value = node.get('value', {})
+            if not value.get('is_null') and isinstance(value.get('value'), str):
+                found.append(value['value'])
+        else:
+            for value in node.values():
+                found.extend(_string_constants(value))
+    return found
+
+
+class QueryCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, memory_bytes=256 * 2**20, disk_bytes=2 * 2**30,
+                 share_ms=100):
+        self.cache_dir = cache_dir
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.share_ms = share_ms
+        self.lock = threading.RLock()
+        self.memory = OrderedDict()     # key -> (table, cost_ms, base)
+        self.memory_used = 0
+        self.latest = {}                # base -> key currently cached for it
+        self.analyses = {}              # normalized sql -> QueryAnalysis, or None if uncacheable
+        self.views = {}                 # db version -> {view name: select sql}
+        self.metrics = {'hits': 0, 'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'bypassed': 0,
+                        'saved_ms': 0.0, 'evictions': 0, 'spills': 0, 'invalidations': 0}
+        self._parser = duckdb.connect()
+        self._files_conn = None
+
+    # --- keys and versions ---
+
+    def analyze(self, normalized):
+        """Parse a normalized statement once; None if it is not a cacheable SELECT."""
+        with self.lock:
+            if normalized in self.analyses:
+                return self.analyses[normalized]
+            tree = json.loads(self._parser.execute("SELECT json_serialize_sql(?)", [normalized]).fetchone()[0])
+        analysis = None
+        if not tree.get('error'):
+            analysis = QueryAnalysis()
+            analysis.walk(tree.get('statements', []))
+            if analysis.volatile or any(_is_remote(f) for f in analysis.files):
+                analysis = None
+        with self.lock:
+            self.analyses[normalized] = analysis
+        return analysis
+
+    def db_version(self, db_path):
+        """Published snapshot name, or the file's size/mtime when nothing is published yet."""
+        from db_snapshots import current_snapshot
+
+        snapshot = current_snapshot(db_path)
+        if snapshot is not None:
+            return os.path.basename(snapshot)
+        stats = []
+        for path in (db_path, db_path + '.wal'):
+            if os.path.exists(path):
+                st = os.stat(path)
+                stats.append([st.st_size, st.st_mtime_ns])
+        return stats
+
+    def _view_sql(self, db_path, version):
+        key = (os.path.abspath(db_path), json.dumps(version))
+        with self.lock:
+            if key in self.views:
+                return self.views[key]
+        from db_snapshots import connect_reader
+
+        cursor = connect_reader(db_path)
+        try:
+            rows = cursor.execute("SELECT view_name, sql FROM duckdb_views() WHERE NOT internal").fetchall()
+        finally:
+            cursor.close()
+        views = {}
+        for name, sql in rows:
+            match = VIEW_BODY.match(sql or '')
+            if match:
+                views[name.lower()] = normalize_sql(match.group(1))
+        with self.lock:
+            self.views[key] = views
+        return views
+
+    def resolve(self, db_path, analysis, version):
+        """Fold in what the referenced views read (recursively); None if any of it is uncacheable."""
+        if db_path is None or not analysis.tables:
+            return analysis
+        views = self._view_sql(db_path, version)
+        resolved = QueryAnalysis()
+        resolved.merge(analysis)
+        pending = [t for t in analysis.tables if t in views]
+        seen = set()
+        while pending:
+            name = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            inner = self.analyze(views[name])
+            if inner is None:
+                return None
+            resolved.merge(inner)
+            pending.extend(t for t in inner.tables if t in views)
+        return resolved
+
+    @staticmethod
+    def file_versions(files):
+        versions = {}
+        for pattern in sorted(files):
+            matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+            fingerprints = []
+            for path in matches:
+                try:
+                    st = os.stat(path)
+                    fingerprints.append([os.path.abspath(path), st.st_size, st.st_mtime_ns])
+                except FileNotFoundError:
+                    fingerprints.append([os.path.abspath(path), None, None])
+            versions[os.path.abspath(pattern)] = fingerprints
+        return versions
+
+    def keys(self, db_path, sql, params=None):
+        """(key, base) for a query, or None if it cannot be cached.
+
+        ``base`` identifies the query itself; ``key`` adds the data versions, so
+        a base only ever has one live key and a new version replaces the old.
+        """
+        normalized = normalize_sql(sql)
+        analysis = self.analyze(normalized)
+        if analysis is None:
+            return None
+        versions = {}
+        if db_path is not None:
+            versions['db'] = self.db_version(db_path)
+            analysis = self.resolve(db_path, analysis, versions['db'])
+            if analysis is None:
+                return None
+        versions['files'] = self.file_versions(analysis.files)
+        if analysis.daily:
+            versions['date'] = date.today().isoformat()
+        db = os.path.abspath(db_path) if db_path is not None else None
+        base = hashlib.sha256(json.dumps([db, normalized, _param_key(params)]).encode()).hexdigest()[:24]
+        key = hashlib.sha256(json.dumps([base, versions], sort_keys=True).encode()).hexdigest()[:24]
+        return key, base
+
+    # --- storage ---
+
+    def _disk_path(self, key, base):
+        return os.path.join(self.cache_dir, f"{base}-{key}.arrow")
+
+    def _lookup(self, key, base):
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                self.memory.move_to_end(key)
+                self.metrics['memory_hits'] += 1
+                return entry[0], entry[1]
+        path = self._disk_path(key, base)
+        try:
+            source = pa.memory_map(path)
+        except FileNotFoundError:
+            return None, None
+        reader = ipc.open_file(source)
+        table = reader.read_all()
+        cost_ms = float((table.schema.metadata or {}).get(b'cost_ms', b'0'))
+        table = table.replace_schema_metadata(None)
+        os.utime(path)
+        with self.lock:
+            self.metrics['disk_hits'] += 1
+        self._remember(key, base, table, cost_ms)
+        return table, cost_ms
+
+    def _remember(self, key, base, table, cost_ms):
+        """Put a result in the memory tier, spilling least recently used entries to disk."""
+        with self.lock:
+            previous = self.latest.get(base)
+            self.latest[base] = key
+            if previous is not None and previous != key:
+                self._drop(previous, base)
+                self.metrics['invalidations'] += 1
+            if key in self.memory:
+                return
+            self.memory[key] = (table, cost_ms, base)
+            self.memory_used += table.nbytes
+            while self.memory_used > self.memory_bytes and len(self.memory) > 1:
+                old_key, (old_table, old_cost, old_base) = self.memory.popitem(last=False)
+                self.memory_used -= old_table.nbytes
+                self.metrics['evictions'] += 1
+                if self.latest.get(old_base) == old_key and self._write(old_key, old_base, old_table, old_cost):
+                    self.metrics['spills'] += 1
+
+    def _drop(self, key, base):
+        entry = self.memory.pop(key, None)
+        if entry is not None:
+            self.memory_used -= entry[0].nbytes
+        # Other processes' results for older versions of this query go too
+        for path in glob.glob(os.path.join(self.cache_dir, f"{base}-*.arrow")):
+            if path != self._disk_path(self.latest[base], base):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _write(self, key, base, table, cost_ms):
+        if table.nbytes > self.disk_bytes:
+            return False
+        path = self._disk_path(key, base)
+        if os.path.exists(path):
+            return True
+        os.makedirs(self.cache_dir, exist_ok=True)
+        table = table.replace_schema_metadata({'cost_ms': str(cost_ms)})
+        with ipc.new_file(path + f".{os.getpid()}.tmp", table.schema) as writer:
+            writer.write_table(table)
+        os.replace(path + f".{os.getpid()}.tmp", path)
+        self._trim_disk()
+        return True
+
+    def _trim_disk(self):
+        """Delete the least recently used files until the disk tier fits its budget."""
+        files = []
+        for path in glob.glob(os.path.join(self.cache_dir, '*.arrow')):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        used = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if used <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+                used -= size
+            except OSError:
+                pass
+
+    # --- queries ---
+
+    def get_or_run(self, db_path, sql, params, run, label=None):
+        """Cached Arrow result of ``sql`` on ``db_path``, calling ``run()`` to compute it on a miss."""
+        started = time.perf_counter()
+        keys = self.keys(db_path, sql, params)
+        if keys is None:
+            with self.lock:
+                self.metrics['bypassed'] += 1
+            return run()
+        key, base = keys
+        with span('query_cache.lookup', query=label or ' '.join(sql.split())[:60]) as s:
+            table, cost_ms = self._lookup(key, base)
+            if table is not None:
+                saved = max(cost_ms - (time.perf_counter() - started) * 1000, 0.0)
+                with self.lock:
+                    self.metrics['hits'] += 1
+                    self.metrics['saved_ms'] += saved
+                s.set(hit=True)
+                count(query_cache_hits=1)
+                return table
+
+        run_started = time.perf_counter()
+        table = run()
+        cost_ms = (time.perf_counter() - run_started) * 1000
+        with self.lock:
+            self.metrics['misses'] += 1
+        count(query_cache_misses=1)
+        self._remember(key, base, table, cost_ms)
+        if cost_ms >= self.share_ms:
+            self._write(key, base, table, cost_ms)
+        return table
+
+    def query(self, sql, params=None, label=None):
+        """Cached result of a query over files only (read_csv, read_parquet, ...), as Arrow."""
+        def run():
+            with self.lock:
+                if self._files_conn is None:
+                    self._files_conn = duckdb.connect()
+                cursor = self._files_conn.cursor()
+            try:
+                result = cursor.execute(sql, params) if params else cursor.execute(sql)
+                return (getattr(result, 'to_arrow_table', None) or result.fetch_arrow_table)()
+            finally:
+                cursor.close()
+        return self.get_or_run(None, sql, params, run, label)
+
+    # --- metrics ---
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.metrics)
+            stats['memory_entries'] = len(self.memory)
+            stats['memory_bytes'] = self.memory_used
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        stats['disk_bytes'] = sum(os.path.getsize(p) for p in glob.glob(os.path.join(self.cache_dir, '*.arrow')))
+        return stats
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            self.memory_used = 0
+            self.latest.clear()
+        for path in glob.glob(os.path.join(self.cache_dir, '*.arrow')):
+            os.remove(path)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """The process-wide QueryCache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = QueryCache()
+        return _cache
+
+
+def main():
+    import sys
+
+    cache = get_cache()
+    if len(sys.argv) > 1 and sys.argv[1] == 'clear':
+        cache.clear()
+        print(f"Cleared {cache.cache_dir}")
+        return
+    stats = cache.stats()
+    files = glob.glob(os.path.join(cache.cache_dir, '*.arrow'))
+    print(f"Disk tier {cache.cache_dir}: {len(files)} results, {stats['disk_bytes'] / 1e6:.1f} MB "
+          f"of {cache.disk_bytes / 1e6:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
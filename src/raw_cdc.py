@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""Row-level change data capture between successive drops of the raw CSV files.
+
+Each drop is staged as text (so DuckDB's type inference can't make an
+unchanged row look changed) with a hash of its natural key and of the whole
+row, and joined against the hashes kept from the previous drop. Only the
+inserted, updated and deleted rows are applied to the DuckDB table, in one
+transaction, and each non-empty change set is published as
+``<root>/<table>/changes/version=N/part-0.parquet`` for incremental
+consumers (see ``ChangeCapture.changes``).
+"""
+
+import os
+import json
+import time
+import shutil
+from datetime import datetime
+import duckdb
+import pandas as pd
+from incident_dedup import NATURAL_KEYS
+from customer_dim import normalize_sql
+from instrumentation import traced, count
+
+# Natural key of each raw file (column names as they appear in data/raw)
+CDC_KEYS = {
+    **NATURAL_KEYS,
+    'customers': ['customer_id'],
+    'product_usage': ['customer_id'],
+    'customer_feedback': ['customer_id', 'feedback_date'],
+    'contract_events': ['event_id'],
+}
+
+KEY_HASH = '_cdc_key_hash'
+ROW_HASH = '_cdc_row_hash'
+OP = '_cdc_op'
+ROW_NUMBER = '_cdc_row'
+
+# DuckDB's hash() is only stable within a version; state from another version forces a full reload
+HASH_FUNCTION = f"duckdb {duckdb.__version__}"
+
+
+def _ident(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _literal(text):
+    return "'" + text.replace("'", "''") + "'"
+
+
+class ChangeCapture:
+    def __init__(self, conn, root='../data/cdc/raw', quarantine_dir='../data/quarantine', keys=None):
+        self.conn = conn
+        self.root = root
+        self.quarantine_dir = quarantine_dir
+        self.keys = keys or CDC_KEYS
+
+    def _dir(self, table):
+        return os.path.join(self.root, table)
+
+    def _state_path(self, table):
+        return os.path.join(self._dir(table), 'state.parquet')
+
+    def _repeats_path(self, table):
+        return os.path.join(self._dir(table), 'repeats.parquet')
+
+    def manifest(self, table):
+        try:
+            with open(os.path.join(self._dir(table), 'manifest.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'version': 0, 'columns': None, 'types': None, 'key': None, 'hash': None, 'source': None,
+                    'versions': []}
+
+    def _write_manifest(self, table, manifest):
+        path = os.path.join(self._dir(table), 'manifest.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(path + '.tmp', path)
+
+    def _table_exists(self, table):
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = ? AND NOT temporary", [table]).fetchone()[0] > 0
+
+    def key_columns(self, table, columns):
+        """Configured natural key, or the whole row when the file doesn't have those columns."""
+        key = self.keys.get(table)
+        if key and all(c in columns for c in key):
+            return list(key)
+        return list(columns)
+
+    def infer_types(self, csv_path):
+        """[column, type] pairs DuckDB infers for the whole file, as a plain read_csv_auto load would."""
+        return [list(row[:2]) for row in self.conn.execute(
+            f"DESCRIBE SELECT * FROM read_csv({_literal(csv_path)}, sample_size = -1)").fetchall()]
+
+    def _stage(self, table, csv_path):
+        """Load a drop as text into the temp table cdc_drop, with key and row hashes; returns (columns, key, duplicates).
+
+        Rows repeating a key are dropped. Only repeats the previous drop didn't
+        have are appended to the quarantine file, so restaging an unchanged
+        file doesn't quarantine its duplicates a second time.
+        """
+        source = f"read_csv({_literal(csv_path)}, all_varchar = true)"
+        columns = [row[0] for row in self.conn.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()]
+        key = self.key_columns(table, columns)
+        hashes = f"hash({', '.join(map(_ident, key))}) AS {KEY_HASH}, hash({', '.join(map(_ident, columns))}) AS {ROW_HASH}"
+        if 'customer_id' in columns:
+            # Normalize each distinct id once rather than running the regexes on every row
+            self.conn.execute(f"""
+                CREATE OR REPLACE TEMP TABLE cdc_drop AS
+                WITH file AS MATERIALIZED (SELECT row_number() OVER () AS {ROW_NUMBER}, * FROM {source}),
+                ids AS (SELECT id, {normalize_sql('id')} AS canonical FROM (SELECT DISTINCT customer_id AS id FROM file))
+                SELECT *, {hashes} FROM (
+                    SELECT file.* REPLACE (ids.canonical AS customer_id)
+                    FROM file LEFT JOIN ids ON file.customer_id IS NOT DISTINCT FROM ids.id)
+            """)
+        else:
+            self.conn.execute(f"""
+                CREATE OR REPLACE TEMP TABLE cdc_drop AS
+                SELECT *, {hashes} FROM (SELECT row_number() OVER () AS {ROW_NUMBER}, * FROM {source})
+            """)
+        # Repeated keys within one drop: the first occurrence wins, the rest are quarantined
+        self.conn.execute(f"""
+            CREATE OR REPLACE TEMP TABLE cdc_repeats AS
+            SELECT {ROW_NUMBER}, {KEY_HASH}, {ROW_HASH} FROM cdc_drop
+            QUALIFY row_number() OVER (PARTITION BY {KEY_HASH} ORDER BY {ROW_NUMBER}) > 1
+        """)
+        duplicates = self.conn.execute("SELECT COUNT(*) FROM cdc_repeats").fetchone()[0]
+        repeats_path = self._repeats_path(table)
+        if duplicates:
+            # Repeats the previous drop already had were quarantined then; restaging must not append them again
+            fresh = f"SELECT {ROW_NUMBER} FROM cdc_repeats"
+            if os.path.exists(repeats_path):
+                fresh = f"""SELECT r.{ROW_NUMBER} FROM cdc_repeats r ANTI JOIN read_parquet({_literal(repeats_path)}) p
+                            ON r.{KEY_HASH} = p.{KEY_HASH} AND r.{ROW_HASH} = p.{ROW_HASH}"""
+            rows = self.conn.execute(f"SELECT * EXCLUDE ({ROW_NUMBER}, {KEY_HASH}, {ROW_HASH}) FROM cdc_drop "
+                                     f"WHERE {ROW_NUMBER} IN ({fresh}) ORDER BY {ROW_NUMBER}").df()
+            if len(rows):
+                os.makedirs(self.quarantine_dir, exist_ok=True)
+                path = os.path.join(self.quarantine_dir, f"{table}.csv")
+                rows.assign(quarantined_at=pd.Timestamp.now()).to_csv(
+                    path, mode='a', header=not os.path.exists(path), index=False)
+            self.conn.execute(f"DELETE FROM cdc_drop WHERE {ROW_NUMBER} IN (SELECT {ROW_NUMBER} FROM cdc_repeats)")
+        os.makedirs(self._dir(table), exist_ok=True)
+        self.conn.execute(f"COPY (SELECT {KEY_HASH}, {ROW_HASH} FROM cdc_repeats) "
+                          f"TO {_literal(repeats_path + '.tmp')} (FORMAT PARQUET)")
+        os.replace(repeats_path + '.tmp', repeats_path)
+        self.conn.execute("DROP TABLE cdc_repeats")
+        return columns, key, duplicates
+
+    @traced('cdc.capture')
+    def capture(self, table, csv_path):
+        """Diff ``csv_path`` against the previous drop, apply the changes to ``table`` and publish them."""
+        started = time.perf_counter()
+        manifest = self.manifest(table)
+        source = None
+        if os.path.exists(csv_path):
+            stat = os.stat(csv_path)
+            source = {'path': os.path.abspath(csv_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        table_exists = self._table_exists(table)
+        summary = {'table': table, 'version': manifest['version'], 'inserts': 0, 'updates': 0, 'deletes': 0,
+                   'duplicates': 0, 'rebuilt': False}
+        if source is not None and source == manifest['source'] and table_exists:
+            # Same file as last time: nothing to read
+            summary['seconds'] = time.perf_counter() - started
+            return summary
+
+        columns, key, duplicates = self._stage(table, csv_path)
+        inferred = self.infer_types(csv_path)
+        state_path = self._state_path(table)
+        has_state = os.path.exists(state_path)
+        # A new table, a file whose columns or inferred types changed (e.g. a count that now has
+        # decimals or 'N/A') or state hashed differently is reloaded in full with the new types
+        rebuild = not (table_exists and has_state and columns == manifest['columns']
+                       and inferred == manifest.get('types') and key == manifest['key']
+                       and manifest['hash'] == HASH_FUNCTION)
+        if rebuild:
+            self.conn.execute(f"CREATE OR REPLACE TABLE {_ident(table)} "
+                              f"({', '.join(f'{_ident(c)} {t}' for c, t in inferred)})")
+        types = dict(inferred)
+        casts = ', '.join(f"CAST(d.{_ident(c)} AS {types[c]}) AS {_ident(c)}" for c in columns)
+        changed = f"SELECT 'insert' AS {OP}, d.{KEY_HASH}, {casts} FROM cdc_drop d"
+        if not rebuild:
+            changed = f"""
+                SELECT CASE WHEN s.{KEY_HASH} IS NULL THEN 'insert' ELSE 'update' END AS {OP}, d.{KEY_HASH}, {casts}
+                FROM cdc_drop d LEFT JOIN read_parquet({_literal(state_path)}) s ON d.{KEY_HASH} = s.{KEY_HASH}
+                WHERE s.{KEY_HASH} IS NULL OR s.{ROW_HASH} <> d.{ROW_HASH}"""
+        if has_state:
+            state_columns = {row[0] for row in self.conn.execute(
+                f"DESCRIBE SELECT * FROM read_parquet({_literal(state_path)})").fetchall()}
+            # Deleted rows carry only their key; after a reload every previous key is deleted
+            key_casts = ''.join(f", TRY_CAST(s.{_ident(c)} AS {types[c]}) AS {_ident(c)}"
+                                for c in key if c in state_columns and c in types)
+            changed += f"""
+                UNION ALL BY NAME
+                SELECT 'delete' AS {OP}, s.{KEY_HASH}{key_casts}
+                FROM read_parquet({_literal(state_path)}) s
+                {'' if rebuild else f'ANTI JOIN cdc_drop d ON s.{KEY_HASH} = d.{KEY_HASH}'}"""
+        self.conn.execute(f"CREATE OR REPLACE TEMP TABLE cdc_changes AS {changed}")
+        ops = dict(self.conn.execute(f"SELECT {OP}, COUNT(*) FROM cdc_changes GROUP BY ALL").fetchall())
+        summary.update(inserts=ops.get('insert', 0), updates=ops.get('update', 0), deletes=ops.get('delete', 0),
+                       duplicates=duplicates, rebuilt=rebuild)
+
+        if sum(ops.values()):
+            summary['version'] = manifest['version'] + 1
+            self._apply(table, key, summary['version'])
+            manifest['version'] = summary['version']
+            entry = {k: summary[k] for k in ('version', 'inserts', 'updates', 'deletes', 'rebuilt')}
+            entry.update(at=datetime.now().isoformat(timespec='seconds'), source=csv_path)
+            manifest['versions'].append(entry)
+            count(rows=sum(ops.values()))
+
+        os.makedirs(self._dir(table), exist_ok=True)
+        self.conn.execute(f"COPY (SELECT {KEY_HASH}, {ROW_HASH}, {', '.join(map(_ident, key))} FROM cdc_drop) "
+                          f"TO {_literal(state_path + '.tmp')} (FORMAT PARQUET)")
+        os.replace(state_path + '.tmp', state_path)
+        self.conn.execute("DROP TABLE cdc_drop")
+        self.conn.execute("DROP TABLE cdc_changes")
+        manifest.update(columns=columns, types=inferred, key=key, hash=HASH_FUNCTION, source=source)
+        # The manifest is written last; a crash before it replays the same change set,
+        # which _apply makes idempotent
+        self._write_manifest(table, manifest)
+        summary['seconds'] = time.perf_counter() - started
+        return summary
+
+    def _apply(self, table, key, version):
+        """Delete every changed key, insert the new row versions, then publish the change set."""
+        match = ' AND '.join(f"t.{_ident(c)} IS NOT DISTINCT FROM c.{_ident(c)}" for c in key)
+        try:
+            self.conn.execute("BEGIN TRANSACTION")
+            # Inserted keys are deleted too, so replaying a change set never duplicates rows
+            self.conn.execute(f"DELETE FROM {_ident(table)} t USING cdc_changes c WHERE {match}")
+            self.conn.execute(f"INSERT INTO {_ident(table)} BY NAME "
+                              f"SELECT * EXCLUDE ({OP}, {KEY_HASH}) FROM cdc_changes WHERE {OP} <> 'delete'")
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+        target = os.path.join(self._dir(table), 'changes', f"version={version}")
+        tmp = target + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        self.conn.execute(f"COPY cdc_changes TO {_literal(os.path.join(tmp, 'part-0.parquet'))} (FORMAT PARQUET)")
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp, target)
+
+    def changes(self, table, since=0):
+        """Published changes to ``table`` after version ``since``, oldest first, with a version column.
+
+        Consumers keep the last version they processed and pass it back.
+        """
+        manifest = self.manifest(table)
+        paths = [os.path.join(self._dir(table), 'changes', f"version={v['version']}", 'part-0.parquet')
+                 for v in manifest['versions'] if v['version'] > since]
+        if not paths:
+            return pd.DataFrame()
+        conn = duckdb.connect()
+        df = conn.execute("SELECT * FROM read_parquet($paths, hive_partitioning = true, union_by_name = true) "
+                          "ORDER BY version", {'paths': paths}).df()
+        conn.close()
+        return df
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--db', default='../data/cybersec_health_raw.duckdb')
+    parser.add_argument('--raw-dir', default='../data/raw')
+    parser.add_argument('--root', default='../data/cdc/raw')
+    parser.add_argument('--changes', metavar='TABLE', help='print the change log of one table instead')
+    args = parser.parse_args()
+
+    conn = duckdb.connect(args.db)
+    cdc = ChangeCapture(conn, root=args.root)
+    if args.changes:
+        for v in cdc.manifest(args.changes)['versions']:
+            print(f"v{v['version']:<4} {v['at']}  +{v['inserts']:,} ~{v['updates']:,} -{v['deletes']:,}"
+                  f"{'  (full reload)' if v['rebuilt'] else ''}")
+        conn.close()
+        return
+
+    for file in sorted(os.listdir(args.raw_dir)):
+        if file.endswith('.csv'):
+            s = cdc.capture(file[:-4], os.path.join(args.raw_dir, file))
+            notes = ' full reload' if s['rebuilt'] else ''
+            if s['duplicates']:
+                notes += f" ({s['duplicates']} repeated keys dropped)"
+            print(f"{s['table']:<22} v{s['version']:<4} +{s['inserts']:,} ~{s['updates']:,} -{s['deletes']:,}"
+                  f"{notes} in {s['seconds'] * 1000:.0f} ms")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
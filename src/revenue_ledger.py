@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""Append-only revenue ledger: contract events applied to per-customer MRR with incremental rollups."""
+
+import os
+from datetime import datetime
+import duckdb
+import numpy as np
+import pandas as pd
+from customer_dim import normalize_customer_ids
+
+# How each contract event type moves MRR. revenue_impact is an annual contract
+# value change, so 'delta' events move MRR by revenue_impact / 12; 'none'
+# events are recorded (they are still history) but leave MRR unchanged.
+# Renewals and extensions book revenue the customer already pays.
+EVENT_EFFECTS = {
+    'Opening Balance': 'opening',
+    'Upsell': 'delta',
+    'Upgrade': 'delta',
+    'Expansion': 'delta',
+    'Downgrade': 'delta',
+    'Contraction': 'delta',
+    'Churn': 'delta',
+    'Cancellation': 'delta',
+    'Contract Renewal': 'none',
+    'Contract Extension': 'none',
+}
+MONTHS_PER_YEAR = 12
+
+UNSCORED = 'Unscored'
+
+LEDGER_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS ledger_events (
+        seq BIGINT PRIMARY KEY,
+        event_id VARCHAR UNIQUE,
+        customer_id VARCHAR,
+        event_date DATE,
+        event_type VARCHAR,
+        revenue_impact DOUBLE,
+        mrr_delta DOUBLE,
+        recorded_at TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ledger_events_customer ON ledger_events (customer_id)",
+    """
+    CREATE TABLE IF NOT EXISTS ledger_balances (
+        customer_id VARCHAR PRIMARY KEY,
+        mrr DOUBLE,
+        health_category VARCHAR,
+        last_event_date DATE,
+        events BIGINT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ledger_rollups (
+        health_category VARCHAR PRIMARY KEY,
+        customers BIGINT,
+        mrr DOUBLE
+    )
+    """,
+]
+
+
+def mrr_deltas(events):
+    """MRR change of each event row from its event_type and revenue_impact."""
+    effects = events['event_type'].map(EVENT_EFFECTS).fillna('delta')
+    impact = pd.to_numeric(events['revenue_impact'], errors='coerce').fillna(0.0)
+    return np.select([effects == 'opening', effects == 'delta'],
+                     [impact, impact / MONTHS_PER_YEAR], 0.0)
+
+
+class RevenueLedger:
+    """Contract events are only ever appended; balances and rollups are updated per batch.
+
+    ``ledger_balances`` holds each customer's current MRR and health category
+    and ``ledger_rollups`` the MRR per health category, both adjusted by the
+    deltas of each appended batch, so reading revenue at risk never touches
+    the event history. As-of lookups sum a customer's deltas up to a date
+    through the customer index, with per-customer histories cached in memory.
+    """
+
+    def __init__(self, path='../data/revenue_ledger.duckdb', read_only=False):
+        self.path = path
+        self.read_only = read_only
+        if not read_only:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = duckdb.connect(path, read_only=read_only)
+        if not read_only:
+            for ddl in LEDGER_DDL:
+                self.conn.execute(ddl)
+        self.balances = self.conn.execute(
+            "SELECT * FROM ledger_balances").df().set_index('customer_id')
+        self.rollup_frame = self.conn.execute(
+            "SELECT * FROM ledger_rollups").df().set_index('health_category')
+        self.next_seq = self.conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM ledger_events").fetchone()[0]
+        self._history = {}
+
+    def close(self):
+        self.conn.close()
+
+    def append(self, events):
+        """Apply contract events not already in the ledger; returns how many were new.
+
+        ``events`` needs event_id, customer_id, event_date, event_type and
+        revenue_impact. Events are applied in (event_date, event_id) order;
+        since MRR is a sum of deltas, a backdated event only changes as-of
+        lookups from its date onwards.
+        """
+        events = events[['event_id', 'customer_id', 'event_date', 'event_type', 'revenue_impact']].copy()
+        events['customer_id'] = normalize_customer_ids(events['customer_id'])
+        events['event_date'] = pd.to_datetime(events['event_date'])
+        self.conn.register('incoming_events', events)
+        new = self.conn.execute("""
+            SELECT i.* FROM incoming_events i
+            WHERE NOT EXISTS (SELECT 1 FROM ledger_events e WHERE e.event_id = i.event_id)
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY i.event_id) = 1
+            ORDER BY i.event_date, i.event_id
+        """).df()
+        self.conn.unregister('incoming_events')
+        if new.empty:
+            return 0
+
+        new.insert(0, 'seq', np.arange(self.next_seq, self.next_seq + len(new), dtype=np.int64))
+        new['mrr_delta'] = mrr_deltas(new)
+        new['recorded_at'] = datetime.now()
+
+        per_customer = new.groupby('customer_id').agg(
+            mrr=('mrr_delta', 'sum'), last_event_date=('event_date', 'max'), events=('seq', 'size'))
+        balances = self._apply_deltas(per_customer)
+
+        self.conn.execute("BEGIN")
+        try:
+            self.conn.register('new_events', new)
+            self.conn.execute("""
+                INSERT INTO ledger_events
+                SELECT seq, event_id, customer_id, event_date, event_type,
+                       revenue_impact, mrr_delta, recorded_at
+                FROM new_events
+            """)
+            self.conn.unregister('new_events')
+            self._persist(balances)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.next_seq += len(new)
+        for customer_id in per_customer.index:
+            self._history.pop(customer_id, None)
+        return len(new)
+
+    def _apply_deltas(self, per_customer):
+        """Fold per-customer deltas into balances and rollups; returns the changed balance rows."""
+        new_customers = per_customer.index.difference(self.balances.index)
+        if len(new_customers):
+            opened = pd.DataFrame({'mrr': 0.0, 'health_category': UNSCORED,
+                                   'last_event_date': pd.NaT, 'events': 0}, index=new_customers)
+            self.balances = pd.concat([self.balances, opened])
+            self._adjust_rollup(pd.Series(UNSCORED, index=new_customers), 1, 0.0)
+
+        changed = self.balances.loc[per_customer.index].copy()
+        changed['mrr'] += per_customer['mrr']
+        changed['events'] += per_customer['events']
+        changed['last_event_date'] = pd.concat(
+            [pd.to_datetime(changed['last_event_date']), per_customer['last_event_date']], axis=1).max(axis=1)
+        self.balances.loc[changed.index, ['mrr', 'events']] = changed[['mrr', 'events']]
+        self.balances['last_event_date'] = pd.to_datetime(self.balances['last_event_date'])
+        self.balances.loc[changed.index, 'last_event_date'] = changed['last_event_date']
+        self._adjust_rollup(changed['health_category'], 0, per_customer['mrr'])
+        return changed
+
+    def _adjust_rollup(self, categories, customers, mrr):
+        """Add ``customers`` (per row) and ``mrr`` to each row's category in the rollup."""
+        deltas = pd.DataFrame({'customers': customers, 'mrr': mrr}, index=categories.index)
+        deltas = deltas.groupby(categories.to_numpy()).sum()
+        rollup = self.rollup_frame.reindex(self.rollup_frame.index.union(deltas.index), fill_value=0)
+        rollup.loc[deltas.index, ['customers', 'mrr']] += deltas[['customers', 'mrr']].to_numpy()
+        rollup.index.name = 'health_category'
+        self.rollup_frame = rollup
+
+    def _persist(self, balances):
+        rows = balances.reset_index().rename(columns={'index': 'customer_id'})
+        self.conn.register('changed_balances', rows)
+        self.conn.execute("""
+            INSERT OR REPLACE INTO ledger_balances
+            SELECT customer_id, mrr, health_category, last_event_date, events FROM changed_balances
+        """)
+        self.conn.unregister('changed_balances')
+        self.conn.register('rollup_rows', self.rollup_frame.reset_index())
+        self.conn.execute("""
+            INSERT OR REPLACE INTO ledger_rollups
+            SELECT health_category, customers, mrr FROM rollup_rows
+        """)
+        self.conn.unregister('rollup_rows')
+
+    def open_balances(self, customers):
+        """Opening-balance events from customers.csv (MRR at contract start), once per customer."""
+        customer_ids = normalize_customer_ids(customers['customer_id'])
+        return self.append(pd.DataFrame({
+            'event_id': [f"OPEN-{c}" for c in customer_ids],
+            'customer_id': customer_ids,
+            'event_date': customers['contract_start_date'],
+            'event_type': 'Opening Balance',
+            'revenue_impact': customers['monthly_recurring_revenue'],
+        }))
+
+    def update_health(self, categories):
+        """Move customers whose health category changed between rollup buckets.
+
+        ``categories`` maps customer_id to health_category; only the changed
+        customers' current MRR is moved, the event history is not read.
+        """
+        categories = pd.Series(categories.to_numpy(), index=normalize_customer_ids(categories.index))
+        categories = categories[categories.index.isin(self.balances.index)]
+        categories = categories[~categories.index.duplicated(keep='last')]
+        current = self.balances.loc[categories.index, 'health_category']
+        moved = categories.index[current.to_numpy() != categories.to_numpy()]
+        if not len(moved):
+            return 0
+        mrr = self.balances.loc[moved, 'mrr']
+        self._adjust_rollup(self.balances.loc[moved, 'health_category'], -1, -mrr)
+        self.balances.loc[moved, 'health_category'] = categories[moved]
+        self._adjust_rollup(categories[moved], 1, mrr)
+
+        self.conn.execute("BEGIN")
+        try:
+            self._persist(self.balances.loc[moved])
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return len(moved)
+
+    def rollups(self):
+        """Customers and MRR per health category, straight from the maintained rollup."""
+        rollup = self.rollup_frame.copy()
+        return rollup[rollup['customers'] > 0].sort_values('mrr', ascending=False)
+
+    def revenue_at_risk(self, category='At Risk'):
+        """(MRR in ``category``, total MRR) from the rollup."""
+        rollup = self.rollup_frame
+        at_risk = rollup['mrr'].get(category, 0.0)
+        return float(at_risk), float(rollup['mrr'].sum())
+
+    def mrr(self, customer_ids=None):
+        """Current MRR per customer (all customers if ``customer_ids`` is None)."""
+        mrr = self.balances['mrr']
+        if customer_ids is None:
+            return mrr.copy()
+        return mrr.reindex(normalize_customer_ids(customer_ids))
+
+    def history(self, customer_id):
+        """(event dates, MRR after each) for one customer, cached until it gets new events."""
+        customer_id = normalize_customer_ids([customer_id])[0]
+        cached = self._history.get(customer_id)
+        if cached is None:
+            rows = self.conn.execute("""
+                SELECT event_date, mrr_delta FROM ledger_events
+                WHERE customer_id = ? ORDER BY event_date, seq
+            """, [customer_id]).fetchnumpy()
+            cached = (rows['event_date'].astype('datetime64[D]'), np.cumsum(rows['mrr_delta']))
+            self._history[customer_id] = cached
+        return cached
+
+    def mrr_as_of(self, customer_id, as_of):
+        """MRR of one customer at the end of ``as_of`` (0 before its first event)."""
+        dates, mrr = self.history(customer_id)
+        i = np.searchsorted(dates, np.datetime64(pd.Timestamp(as_of).date(), 'D'), side='right')
+        return float(mrr[i - 1]) if i else 0.0
+
+    def mrr_as_of_all(self, as_of):
+        """MRR of every customer at the end of ``as_of``, in one indexed scan."""
+        return self.conn.execute("""
+            SELECT customer_id, SUM(mrr_delta) AS mrr FROM ledger_events
+            WHERE event_date <= ? GROUP BY customer_id ORDER BY customer_id
+        """, [pd.Timestamp(as_of).date()]).df().set_index('customer_id')['mrr']
+
+
+def sync(ledger, customers_path='../data/raw/customers.csv',
+         events_path='../data/raw/contract_events.csv',
+         health_path='../data/processed/customer_health_scores_latest.csv'):
+    """Open new customers, append new contract events and refresh health categories."""
+    opened = ledger.open_balances(pd.read_csv(customers_path)) if os.path.exists(customers_path) else 0
+    appended = ledger.append(pd.read_csv(events_path)) if os.path.exists(events_path) else 0
+    moved = 0
+    if os.path.exists(health_path):
+        health = pd.read_csv(health_path, usecols=['customer_id', 'health_category'])
+        moved = ledger.update_health(health.set_index('customer_id')['health_category'])
+    return {'opened': opened, 'appended': appended, 'moved': moved}
+
+
+def main():
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'sync'
+    if command == 'sync':
+        ledger = RevenueLedger()
+        result = sync(ledger)
+        print(f"Ledger: {result['opened']} opening balances, {result['appended']} new events, "
+              f"{result['moved']} customers changed health category")
+    else:
+        ledger = RevenueLedger(read_only=True)
+    if command == 'asof':
+        customer_id, as_of = sys.argv[2], sys.argv[3]
+        print(f"{customer_id} MRR as of {as_of}: ${ledger.mrr_as_of(customer_id, as_of):,.2f}")
+        return
+
+    print(f"\n{'health_category':<20} {'customers':>10} {'mrr':>14}")
+    for category, row in ledger.rollups().iterrows():
+        print(f"{category:<20} {int(row['customers']):>10} {row['mrr']:>14,.2f}")
+    at_risk, total = ledger.revenue_at_risk()
+    print(f"\nMRR at risk: ${at_risk:,.2f} of ${total:,.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,14 +3,26 @@
 
 from churn_predictor import ChurnPredictor
 from alert_system import AlertSystem
-import schedule
+from incident_anomaly import IncidentAnomalyDetector
+from data_quality import DataQualityMonitor, DataQualityError, gate
+from instrumentation import span, traced
 import time
 from datetime import datetime
 
+@traced('pipeline.ml')
 def run_daily_ml_pipeline():
     """Run the complete ML pipeline daily."""
     print(f"\n=== Running ML Pipeline - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===")
     
+    # Step 0: Gate on data quality (only new rows are scanned)
+    print("0. Checking data quality...")
+    try:
+        with span('pipeline.data_quality'):
+            gate(DataQualityMonitor().run())
+    except DataQualityError as e:
+        print(f"Pipeline stopped: {e}")
+        return
+    
     # Step 1: Train/update churn model
     print("1. Training churn prediction model...")
     predictor = ChurnPredictor()
@@ -19,17 +31,25 @@ def run_daily_ml_pipeline():
     # Step 2: Generate predictions
     print("2. Generating churn predictions...")
     predictions = predictor.predict_churn()
-    predictions.to_csv('../data/processed/churn_predictions.csv', index=False)
+    with span('pipeline.save_predictions', rows=len(predictions)):
+        predictions.to_csv('../data/processed/churn_predictions.csv', index=False)
+    
+    # Step 3: Score yesterday's incidents against each customer's seasonal baseline
+    print("3. Detecting incident spikes...")
+    spikes = IncidentAnomalyDetector(db_path=predictor.db_path).refresh()
+    print(f"   {len(spikes)} spikes")
     
-    # Step 3: Run alert system
-    print("3. Running alert system...")
-    alert_system = AlertSystem()
+    # Step 4: Run alert system
+    print("4. Running alert system...")
+    alert_system = AlertSystem(predictor=predictor)
     alert_system.run_alert_check()
     
     print("=== ML Pipeline Complete ===\n")
 
 def run_scheduler():
     """Run scheduled ML pipeline."""
+    import schedule
+    
     # Schedule daily run at 8 AM
     schedule.every().day.at("08:00").do(run_daily_ml_pipeline)
     
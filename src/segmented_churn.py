@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""Segmented churn models (one per industry or other segment column)."""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from db_connections import get_manager
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import roc_auc_score, precision_score, recall_score
+
+GLOBAL_SEGMENT = '__global__'
+
+
+def _holdout_split(rows, order_rank, holdout_fraction):
+    """Split row indices into train/holdout, sampling the holdout evenly across contract start dates."""
+    if holdout_fraction <= 0 or len(rows) < 2:
+        return np.sort(rows), rows[:0]
+    rows = rows[np.argsort(order_rank[rows], kind='stable')]
+    is_holdout = np.zeros(len(rows), dtype=bool)
+    is_holdout[::max(int(round(1 / holdout_fraction)), 2)] = True
+    return np.sort(rows[~is_holdout]), np.sort(rows[is_holdout])
+
+
+def _score(model, X, y):
+    """Holdout metrics for one fitted model."""
+    if len(y) == 0:
+        return {'auc': None, 'precision': None, 'recall': None}
+    if len(model.classes_) < 2:
+        probs = np.full(len(y), float(model.classes_[0]))
+    else:
+        probs = model.predict_proba(X)[:, 1]
+    preds = (probs >= 0.5).astype(int)
+    return {
+        'auc': float(roc_auc_score(y, probs)) if len(np.unique(y)) == 2 else None,
+        'precision': float(precision_score(y, preds, zero_division=0)),
+        'recall': float(recall_score(y, preds, zero_division=0)),
+    }
+
+
+def _fit_segment(cache_dir, segment, rows, params, holdout_fraction):
+    """Fit and evaluate one segment's model from the memory-mapped feature matrix."""
+    started = time.perf_counter()
+    X = np.load(os.path.join(cache_dir, 'X.npy'), mmap_mode='r')
+    y = np.load(os.path.join(cache_dir, 'y.npy'), mmap_mode='r')
+    order = np.load(os.path.join(cache_dir, 'order.npy'), mmap_mode='r')
+    order_rank = np.empty(len(order), dtype=np.int64)
+    order_rank[order] = np.arange(len(order))
+
+    train_rows, holdout_rows = _holdout_split(np.asarray(rows), order_rank, holdout_fraction)
+    model = RandomForestClassifier(**params)
+    model.fit(X[train_rows], y[train_rows])
+
+    metrics = {'rows': int(len(rows)), 'churn_rate': float(y[rows].mean()) if len(rows) else 0.0}
+    metrics.update(_score(model, X[holdout_rows], y[holdout_rows]))
+    metrics['training_seconds'] = round(time.perf_counter() - started, 3)
+    return segment, model, metrics
+
+
+class SegmentedChurnModel:
+    def __init__(self, predictor, segment_col='industry', min_segment_size=200,
+                 holdout_fraction=0.2, n_estimators=100, max_workers=None,
+                 model_dir='../models/segments'):
+        self.predictor = predictor
+        self.segment_col = segment_col
+        self.min_segment_size = min_segment_size
+        self.holdout_fraction = holdout_fraction
+        self.n_estimators = n_estimators
+        self.max_workers = max_workers
+        self.model_dir = model_dir
+        self.models = {}
+        self.forests = {}
+        self.scaler = None
+        self.metrics = {}
+
+    def segment_column_sql(self):
+        """``segment_col`` quoted as an identifier, after checking it is a column of ``customers``.
+
+        The name comes from the command line, so it is never pasted into SQL as-is.
+        """
+        columns = get_manager().fetch_numpy(self.predictor.db_path, "DESCRIBE customers",
+                                            label='customer_columns')['column_name']
+        if self.segment_col not in set(columns):
+            raise ValueError(f"unknown segment column {self.segment_col!r}; "
+                             f"customers has {', '.join(columns)}")
+        return '"' + self.segment_col.replace('"', '""') + '"'
+
+    def segment_labels(self, customer_ids):
+        """Segment value for each customer id, aligned to ``customer_ids``."""
+        segments = get_manager().fetch_numpy(
+            self.predictor.db_path,
+            f"SELECT customer_id, CAST({self.segment_column_sql()} AS VARCHAR) AS segment FROM customers",
+            label='segment_labels')
+        lookup = pd.Series(segments['segment'], index=segments['customer_id'])
+        return lookup.reindex(np.asarray(customer_ids)).fillna(GLOBAL_SEGMENT).to_numpy()
+
+    def train(self):
+        """Train the global model and every large-enough segment concurrently."""
+        from churn_training import ChurnTrainer
+
+        started = time.perf_counter()
+        # Fail on a bad column before the feature matrix is built
+        self.segment_column_sql()
+        trainer = ChurnTrainer(self.predictor, cache_root=self.predictor.cache_root, n_estimators=self.n_estimators)
+        cache_dir = trainer.build_feature_matrix()
+        _, y, self.scaler = trainer.load_feature_matrix(cache_dir)
+        customer_ids = np.load(os.path.join(cache_dir, 'customer_ids.npy'))
+        segments = self.segment_labels(customer_ids)
+
+        tasks = {GLOBAL_SEGMENT: np.arange(len(y))}
+        small = {}
+        for segment in np.unique(segments):
+            rows = np.flatnonzero(segments == segment)
+            if segment == GLOBAL_SEGMENT or len(rows) < self.min_segment_size \
+                    or len(np.unique(y[rows])) < 2:
+                small[segment] = int(len(rows))
+            else:
+                tasks[segment] = rows
+
+        # Each process grows its forest single-threaded; parallelism is across segments
+        params = {'n_estimators': self.n_estimators, 'random_state': 42, 'n_jobs': 1}
+        with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [pool.submit(_fit_segment, cache_dir, segment, rows, params, self.holdout_fraction)
+                       for segment, rows in tasks.items()]
+            results = [future.result() for future in futures]
+
+        self.models = {segment: model for segment, model, _ in results}
+        self.forests = {}
+        self.metrics = {segment: metrics for segment, _, metrics in results}
+        for segment, rows in small.items():
+            self.metrics[segment] = {'rows': rows, 'routed_to': GLOBAL_SEGMENT}
+
+        return {
+            'segment_col': self.segment_col,
+            'feature_store_version': os.path.basename(cache_dir),
+            'segments': self.metrics,
+            'training_seconds': round(time.perf_counter() - started, 3),
+        }
+
+    def _forest(self, segment):
+        """Flattened forest of one segment, built the first time a small batch needs it."""
+        from batch_scoring import FlatForest
+
+        if segment not in self.forests:
+            self.forests[segment] = FlatForest.from_sklearn(self.models[segment])
+        return self.forests[segment]
+
+    def predict_proba(self, X_scaled, segments):
+        """Route each row to its segment's model (or the global one) in one pass.
+
+        Each segment's rows go through BatchScorer.score_matrix, which picks
+        the flat forest or sklearn by batch size as for the global model.
+        """
+        from batch_scoring import BatchScorer, FLAT_FOREST_MAX_ROWS
+
+        scorer = BatchScorer(self.predictor)
+        keys = [GLOBAL_SEGMENT] + sorted(k for k in self.models if k != GLOBAL_SEGMENT)
+        # Unknown or small segments get code -1, which becomes the global model (0)
+        codes = pd.Categorical(np.asarray(segments), categories=keys).codes.astype(np.int64)
+        codes[codes < 0] = 0
+
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(keys) + 1))
+        probs = np.empty(len(codes))
+        for code, key in enumerate(keys):
+            rows = order[bounds[code]:bounds[code + 1]]
+            if len(rows):
+                forest = self._forest(key) if len(rows) <= FLAT_FOREST_MAX_ROWS else None
+                probs[rows] = scorer.score_matrix(X_scaled[rows], scaled=True, model=self.models[key], forest=forest)
+        return probs
+
+    def predict_frame(self, features):
+        """Score a frame produced by ChurnPredictor.extract_features."""
+        from batch_scoring import risk_bands
+        from churn_predictor import FEATURE_COLS
+
+        X = features[FEATURE_COLS].to_numpy(dtype=np.float64)
+        # The scaler rejects an empty batch
+        X_scaled = self.scaler.transform(X) if len(X) else X
+        probs = self.predict_proba(X_scaled, self.segment_labels(features['customer_id']))
+        results = features[['customer_id', 'contract_value']].copy()
+        results['churn_probability'] = probs
+        results['risk_level'] = risk_bands(probs)
+        return results
+
+    def save(self, summary):
+        """Register the segment models as one version."""
+        from churn_predictor import FEATURE_COLS
+        from model_registry import ModelRegistry
+
+        return ModelRegistry(self.model_dir).register(self.models, self.scaler, FEATURE_COLS, summary)
+
+    def load(self, version=None):
+        """Load a registered set of segment models."""
+        from churn_predictor import FEATURE_COLS
+        from model_registry import get_model
+
+        loaded = get_model(self.model_dir, version, feature_cols=FEATURE_COLS)
+        self.models, self.scaler = loaded.model, loaded.scaler
+        self.segment_col = loaded.manifest['metadata'].get('segment_col', self.segment_col)
+        self.metrics = loaded.manifest['metadata'].get('segments', {})
+        self.forests = {}
+        return self
+
+
+def train_and_register(predictor, segment_col='industry', model_dir=None):
+    """Train and register the segment models, printing one line per segment; returns the version."""
+    segmented = SegmentedChurnModel(predictor, segment_col=segment_col,
+                                    model_dir=model_dir or os.path.join(predictor.model_dir, 'segments'))
+    summary = segmented.train()
+    version = segmented.save(summary)
+
+    print(f"Trained {len(segmented.models)} models by {segment_col} "
+          f"in {summary['training_seconds']:.1f}s (registered as {version})")
+    for segment, metrics in sorted(summary['segments'].items()):
+        if 'routed_to' in metrics:
+            print(f"  {segment:<20} {metrics['rows']:>7} rows -> global model")
+        else:
+            auc = f"{metrics['auc']:.3f}" if metrics['auc'] is not None else "n/a"
+            print(f"  {segment:<20} {metrics['rows']:>7} rows  AUC {auc}  "
+                  f"churn {metrics['churn_rate']:.1%}  {metrics['training_seconds']:.1f}s")
+    return version
+
+
+def main():
+    import sys
+    from churn_predictor import ChurnPredictor
+
+    train_and_register(ChurnPredictor(), sys.argv[1] if len(sys.argv) > 1 else 'industry')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+"""Customer-sharded execution: per-shard scoring and alerting in separate processes or on other machines.
+
+Customers are assigned to one of N shards by an md5 of their normalized id,
+which is the same in Python and in DuckDB SQL, on every machine and version.
+``prepare`` splits the raw CSVs and the dbt source tables into per-shard
+Parquet partitions under a run directory; any number of ``work`` processes,
+local or on other hosts sharing the run directory, then claim shards with an
+exclusive lock file and write each shard's health scores, churn predictions,
+alerts and partial aggregates. ``merge`` combines the partials (counts, sums,
+sums of squares, min/max, fixed-bin histograms) into fleet-level KPIs without
+reading any per-customer rows back.
+
+Paths are stored absolute in plan.json, so remote workers must mount the
+shared filesystem at the same path.
+"""
+
+import os
+import json
+import time
+import glob
+import shutil
+import socket
+import hashlib
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from instrumentation import span, traced, count
+
+# Tables the churn features and alert risk factors are computed from
+DB_TABLES = ('customers', 'support_tickets', 'security_incidents', 'product_usage', 'customer_feedback')
+
+HEALTH_BINS = 100          # fixed [0, 100] score histogram, so shard histograms add up
+SCORE_RANGE = (0.0, 100.0)
+DEFAULT_LEASE_SECONDS = 3600
+
+
+def shard_of(customer_ids, n_shards):
+    """Shard number of each customer id (normalized first), as an int array."""
+    from customer_dim import normalize_customer_ids
+
+    ids = pd.Series(normalize_customer_ids(customer_ids), dtype='category')
+    # Hash each distinct id once and broadcast through the category codes
+    per_id = np.array([int(hashlib.md5(str(c).encode()).hexdigest()[:8], 16) % n_shards
+                       for c in ids.cat.categories], dtype=np.int64)
+    codes = ids.cat.codes.to_numpy()
+    return np.where(codes >= 0, per_id[np.maximum(codes, 0)], 0)
+
+
+def shard_sql(col, n_shards):
+    """SQL expression equal to shard_of for the customer id column ``col``."""
+    from customer_dim import normalize_sql
+
+    normalized = normalize_sql(f"CAST({col} AS VARCHAR)")
+    return f"coalesce(('0x' || md5({normalized})[1:8])::BIGINT % {n_shards}, 0)"
+
+
+def _quote(path):
+    return "'" + path.replace("'", "''") + "'"
+
+
+class ShardedRun:
+    def __init__(self, run_dir):
+        self.run_dir = os.path.abspath(run_dir)
+        self.plan_path = os.path.join(self.run_dir, 'plan.json')
+        self._plan = None
+
+    @property
+    def plan(self):
+        if self._plan is None:
+            with open(self.plan_path) as f:
+                self._plan = json.load(f)
+        return self._plan
+
+    def shard_dir(self, shard):
+        return os.path.join(self.run_dir, 'shards', f"shard={shard}")
+
+    def output_dir(self, shard):
+        return os.path.join(self.shard_dir(shard), 'output')
+
+    def is_done(self, shard):
+        return os.path.exists(os.path.join(self.output_dir(shard), 'partials.json'))
+
+    # --- coordinator ---
+
+    @traced('sharding.prepare')
+    def prepare(self, n_shards, raw_dir='../data/raw', db_path='../data/cybersec_health_dbt.duckdb',
+                model_dir='../models', dim_path='../data/dimensions/customer_dim.csv',
+                alert_config='../config/alert_config.json'):
+        """Partition the inputs into ``n_shards`` and write plan.json."""
+        import duckdb
+        from transform import HEALTH_INPUTS
+        from customer_dim import CustomerDimension
+        from model_registry import ModelRegistry
+        from db_snapshots import current_snapshot
+
+        model_version = ModelRegistry(model_dir).current_version()
+        if model_version is None:
+            raise RuntimeError(f"No registered churn model in {model_dir}; train one before a sharded run")
+
+        # Register every customer up front so shard workers only read the dimension
+        customers = pd.read_csv(os.path.join(raw_dir, HEALTH_INPUTS['customers']), usecols=['customer_id'])
+        CustomerDimension(dim_path).register(customers['customer_id'])
+
+        snapshot = current_snapshot(db_path) or db_path
+        inputs_dir = os.path.join(self.run_dir, 'inputs')
+        shutil.rmtree(inputs_dir, ignore_errors=True)
+        os.makedirs(inputs_dir)
+        conn = duckdb.connect()
+        conn.execute(f"ATTACH {_quote(os.path.abspath(snapshot))} AS src (READ_ONLY)")
+        sources = {f"raw_{name}": f"read_csv_auto({_quote(os.path.abspath(os.path.join(raw_dir, file)))})"
+                   for name, file in HEALTH_INPUTS.items()}
+        sources.update({f"db_{table}": f"src.{table}" for table in DB_TABLES})
+        rows = {}
+        for name, source in sources.items():
+            with span('sharding.partition', input=name):
+                target = os.path.join(inputs_dir, name)
+                # One streaming pass per input, written as hive partitions shard=0..N-1
+                conn.execute(f"COPY (SELECT *, {shard_sql('customer_id', n_shards)} AS shard FROM {source}) "
+                             f"TO {_quote(target)} (FORMAT PARQUET, PARTITION_BY (shard))")
+                rows[name] = conn.execute(f"SELECT count(*) FROM {source}").fetchone()[0]
+                count(rows=rows[name])
+        conn.close()
+
+        plan = {
+            'n_shards': n_shards,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'inputs': sorted(sources),
+            'input_rows': rows,
+            'db_snapshot': os.path.abspath(snapshot),
+            'model_dir': os.path.abspath(model_dir),
+            'model_version': model_version,
+            'dim_path': os.path.abspath(dim_path),
+            'alert_config': os.path.abspath(alert_config),
+        }
+        os.makedirs(self.run_dir, exist_ok=True)
+        with open(self.plan_path + '.tmp', 'w') as f:
+            json.dump(plan, f, indent=2)
+        os.replace(self.plan_path + '.tmp', self.plan_path)
+        self._plan = plan
+        return plan
+
+    def reset(self):
+        """Drop shard outputs and claims, keeping the partitioned inputs."""
+        shutil.rmtree(os.path.join(self.run_dir, 'shards'), ignore_errors=True)
+
+    def status(self):
+        n = self.plan['n_shards']
+        done = [s for s in range(n) if self.is_done(s)]
+        claimed = [s for s in range(n) if s not in done and os.path.exists(os.path.join(self.shard_dir(s), 'CLAIM'))]
+        return {'shards': n, 'done': len(done), 'running': len(claimed), 'pending': n - len(done) - len(claimed)}
+
+    # --- workers ---
+
+    def claim(self, shard, worker, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Take an exclusive claim on a shard; an expired claim (crashed worker) is taken over."""
+        os.makedirs(self.shard_dir(shard), exist_ok=True)
+        path = os.path.join(self.shard_dir(shard), 'CLAIM')
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(path) < lease_seconds:
+                        return False
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'worker': worker, 'host': socket.gethostname(), 'pid': os.getpid(),
+                           'claimed': time.time()}, f)
+            return True
+        return False
+
+    def work(self, worker=None, lease_seconds=DEFAULT_LEASE_SECONDS, max_shards=None):
+        """Claim and run shards until none are left; returns {shard: seconds}."""
+        worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+        timings = {}
+        for shard in range(self.plan['n_shards']):
+            if max_shards is not None and len(timings) >= max_shards:
+                break
+            if self.is_done(shard) or not self.claim(shard, worker, lease_seconds):
+                continue
+            started = time.perf_counter()
+            self.run_shard(shard, worker)
+            timings[shard] = time.perf_counter() - started
+        return timings
+
+    def _shard_connection(self, shard):
+        """In-memory DuckDB with one view per input, reading only this shard's partition."""
+        import duckdb
+
+        conn = duckdb.connect()
+        for name in self.plan['inputs']:
+            files = os.path.join(self.run_dir, 'inputs', name, '*', '*.parquet')
+            view = name.split('_', 1)[1] if name.startswith('db_') else name
+            conn.execute(f"CREATE VIEW {view} AS SELECT * EXCLUDE (shard) FROM "
+                         f"read_parquet({_quote(files)}, hive_partitioning = true) WHERE shard = {shard}")
+        return conn
+
+    @traced('sharding.shard')
+    def run_shard(self, shard, worker=None):
+        """Score, predict and alert for one shard, then publish its outputs atomically."""
+        from transform import HEALTH_INPUTS, calculate_customer_health_score
+        from comprehensive_health_score import calculate_comprehensive_health_score
+        from customer_dim import CustomerDimension
+        from churn_predictor import ChurnPredictor, FEATURE_QUERY
+        from batch_scoring import BatchScorer
+        from alert_system import AlertSystem, RISK_QUERY
+
+        started = time.perf_counter()
+        plan = self.plan
+        conn = self._shard_connection(shard)
+
+        with span('sharding.extract', shard=shard):
+            inputs = {name: conn.execute(f"SELECT * FROM raw_{name}").df() for name in HEALTH_INPUTS}
+            features = conn.execute(FEATURE_QUERY).df().fillna(0)
+            risk_df = conn.execute(RISK_QUERY).df()
+        conn.close()
+
+        dim = CustomerDimension(plan['dim_path'])
+        health = calculate_customer_health_score(inputs, dim)
+        comprehensive = calculate_comprehensive_health_score(inputs, dim)
+        health = health.merge(comprehensive[['customer_id', 'comprehensive_health_score']], on='customer_id', how='left')
+        health['health_category'] = health['health_category'].astype(str)
+
+        predictor = ChurnPredictor(db_path=plan['db_snapshot'], model_dir=plan['model_dir'])
+        predictor.load_model()
+        active = features[features['churned'] == 0]
+        predictions = BatchScorer(predictor, model_dir=plan['model_dir']).score_frame(active)
+        predictions = predictions.sort_values('churn_probability', ascending=False)
+
+        alert_system = AlertSystem(plan['alert_config'], predictor=predictor)
+        at_risk = alert_system.get_at_risk_customers(predictions=predictions, risk_df=risk_df)
+        alerts = pd.DataFrame(alert_system.generate_alerts(at_risk))
+
+        partials = partial_aggregates(health, predictions, alerts)
+        partials['shard'] = {'shard': shard, 'worker': worker, 'host': socket.gethostname(),
+                             'seconds': time.perf_counter() - started}
+
+        output = self.output_dir(shard)
+        tmp = f"{output}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        keep = [c for c in ('customer_id', 'customer_key', 'company_name', 'monthly_recurring_revenue',
+                            'customer_health_score', 'health_category', 'comprehensive_health_score')
+                if c in health]
+        health[keep].to_parquet(os.path.join(tmp, 'health_scores.parquet'), index=False)
+        predictions.assign(risk_level=predictions['risk_level'].astype(str)).to_parquet(
+            os.path.join(tmp, 'churn_predictions.parquet'), index=False)
+        alerts.astype(str).to_parquet(os.path.join(tmp, 'alerts.parquet'), index=False)
+        # Written last: its presence marks the shard as complete
+        with open(os.path.join(tmp, 'partials.json'), 'w') as f:
+            json.dump(partials, f)
+        shutil.rmtree(output, ignore_errors=True)
+        os.replace(tmp, output)
+        count(customers=len(health), alerts=len(alerts))
+        return partials
+
+    # --- results ---
+
+    def partials(self):
+        parts = []
+        for shard in range(self.plan['n_shards']):
+            if not self.is_done(shard):
+                raise RuntimeError(f"shard {shard} of {self.run_dir} has not finished")
+            with open(os.path.join(self.output_dir(shard), 'partials.json')) as f:
+                parts.append(json.load(f))
+        return parts
+
+    @traced('sharding.merge')
+    def merge(self):
+        """Fleet KPIs from the shards' partial aggregates; written to fleet_kpis.json."""
+        parts = self.partials()
+        merged = merge_partials([{k: v for k, v in p.items() if k != 'shard'} for p in parts])
+        kpis = fleet_kpis(merged)
+        seconds = [p['shard']['seconds'] for p in parts]
+        kpis['shards'] = {'count': len(parts), 'busy_seconds': sum(seconds), 'max_shard_seconds': max(seconds),
+                          # 1.0 when every shard took equally long
+                          'balance': sum(seconds) / (len(seconds) * max(seconds)) if max(seconds) else 1.0}
+        path = os.path.join(self.run_dir, 'fleet_kpis.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(kpis, f, indent=2)
+        os.replace(path + '.tmp', path)
+        return kpis
+
+    def load(self, output):
+        """One per-shard output (health_scores, churn_predictions, alerts) across all shards."""
+        import duckdb
+
+        files = glob.glob(os.path.join(self.run_dir, 'shards', 'shard=*', 'output', f"{output}.parquet"))
+        if not files:
+            return pd.DataFrame()
+        conn = duckdb.connect()
+        df = conn.execute("SELECT * FROM read_parquet($files, union_by_name = true)", {'files': files}).df()
+        conn.close()
+        return df
+
+
+def _histogram(values):
+    return np.histogram(np.clip(values, *SCORE_RANGE), bins=HEALTH_BINS, range=SCORE_RANGE)[0].tolist()
+
+
+def _moments(values):
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return {'count': 0, 'sum': 0.0, 'sumsq': 0.0, 'min': None, 'max': None}
+    return {'count': int(len(values)), 'sum': float(values.sum()), 'sumsq': float((values ** 2).sum()),
+            'min': float(values.min()), 'max': float(values.max())}
+
+
+def partial_aggregates(health, predictions, alerts):
+    """Mergeable summary of one shard: counts, sums, sums of squares, min/max and histograms."""
+    mrr = health['monthly_recurring_revenue'] if 'monthly_recurring_revenue' in health else pd.Series(0.0, index=health.index)
+    categories = {}
+    for category, group in health.groupby('health_category', observed=True):
+        categories[str(category)] = {'customers': int(len(group)), 'mrr': float(mrr.loc[group.index].sum())}
+    churn = predictions['churn_probability'].to_numpy(dtype=np.float64)
+    risk_levels = {}
+    for level, group in predictions.groupby(predictions['risk_level'].astype(str)):
+        risk_levels[level] = {'customers': int(len(group)), 'contract_value': float(group['contract_value'].sum())}
+    by_type = alerts['type'].value_counts().to_dict() if len(alerts) else {}
+    by_priority = alerts['priority'].value_counts().to_dict() if len(alerts) else {}
+    return {
+        'customers': int(len(health)),
+        'mrr': float(mrr.sum()),
+        'health_score': dict(_moments(health['customer_health_score']),
+                             hist=_histogram(health['customer_health_score'].to_numpy(dtype=np.float64))),
+        'comprehensive_score': _moments(health['comprehensive_health_score']),
+        'categories': categories,
+        'churn_probability': dict(_moments(churn), hist=_histogram(churn * 100)),
+        'risk_levels': risk_levels,
+        'alerts': {'by_type': {k: int(v) for k, v in by_type.items()},
+                   'by_priority': {k: int(v) for k, v in by_priority.items()}},
+    }
+
+
+def merge_partials(parts):
+    """Combine partial aggregates: sums add, 'min'/'max' fold, histograms add bin by bin."""
+    merged = {}
+    for part in parts:
+        merged = _merge(merged, part)
+    return merged
+
+
+def _merge(a, b, key=None):
+    if isinstance(b, dict):
+        out = dict(a) if isinstance(a, dict) else {}
+        for k, v in b.items():
+            out[k] = _merge(out.get(k), v, k)
+        return out
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if key == 'min':
+        return min(a, b)
+    if key == 'max':
+        return max(a, b)
+    if isinstance(b, list):
+        return [x + y for x, y in zip(a, b)]
+    return a + b
+
+
+def _mean_std(m):
+    if not m.get('count'):
+        return None, None
+    mean = m['sum'] / m['count']
+    var = max(m['sumsq'] / m['count'] - mean ** 2, 0.0)
+    return mean, var ** 0.5
+
+
+def _quantile(hist, q, scale=1.0):
+    """Quantile from a fixed-bin [0, 100] histogram, interpolated within the bin."""
+    hist = np.asarray(hist, dtype=np.float64)
+    total = hist.sum()
+    if not total:
+        return None
+    cum = np.cumsum(hist)
+    i = int(np.searchsorted(cum, q * total))
+    width = (SCORE_RANGE[1] - SCORE_RANGE[0]) / len(hist)
+    before = cum[i - 1] if i else 0.0
+    frac = (q * total - before) / hist[i] if hist[i] else 0.0
+    return (SCORE_RANGE[0] + (i + frac) * width) * scale
+
+
+def fleet_kpis(merged):
+    """Fleet-level KPIs derived from merged partial aggregates."""
+    health_mean, health_std = _mean_std(merged.get('health_score', {}))
+    comp_mean, _ = _mean_std(merged.get('comprehensive_score', {}))
+    churn_mean, _ = _mean_std(merged.get('churn_probability', {}))
+    categories = merged.get('categories', {})
+    at_risk = categories.get('At Risk', {})
+    risk_levels = merged.get('risk_levels', {})
+    total_mrr = merged.get('mrr', 0.0)
+    return {
+        'total_customers': merged.get('customers', 0),
+        'avg_health_score': health_mean,
+        'health_score_std': health_std,
+        'health_score_p50': _quantile(merged['health_score']['hist'], 0.5) if 'health_score' in merged else None,
+        'health_score_p10': _quantile(merged['health_score']['hist'], 0.1) if 'health_score' in merged else None,
+        'avg_comprehensive_score': comp_mean,
+        'health_categories': {k: v['customers'] for k, v in categories.items()},
+        'at_risk_customers': at_risk.get('customers', 0),
+        'champion_customers': categories.get('Champion', {}).get('customers', 0),
+        'revenue_at_risk': at_risk.get('mrr', 0.0),
+        'revenue_at_risk_pct': at_risk.get('mrr', 0.0) / total_mrr * 100 if total_mrr else 0.0,
+        'scored_customers': merged.get('churn_probability', {}).get('count', 0),
+        'avg_churn_probability': churn_mean,
+        'churn_probability_p90': _quantile(merged['churn_probability']['hist'], 0.9, scale=0.01)
+        if 'churn_probability' in merged else None,
+        'high_churn_risk_customers': risk_levels.get('High', {}).get('customers', 0),
+        'high_churn_risk_contract_value': risk_levels.get('High', {}).get('contract_value', 0.0),
+        'alerts_by_type': merged.get('alerts', {}).get('by_type', {}),
+        'alerts_by_priority': merged.get('alerts', {}).get('by_priority', {}),
+    }
+
+
+def _local_worker(run_dir, worker):
+    return ShardedRun(run_dir).work(worker)
+
+
+def run_local(run, workers):
+    """Run every pending shard with ``workers`` local processes; returns wall seconds."""
+    started = time.perf_counter()
+    timings = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_local_worker, run.run_dir, f"local-{i}") for i in range(workers)]
+        for future in as_completed(futures):
+            timings.update(future.result())
+    return time.perf_counter() - started, timings
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    prepare = commands.add_parser('prepare', help='partition the inputs into a new run directory')
+    prepare.add_argument('--shards', type=int, default=8)
+    prepare.add_argument('--run-dir', default=None)
+    work = commands.add_parser('work', help='claim and run shards of a prepared run (any host)')
+    work.add_argument('run_dir')
+    work.add_argument('--worker', default=None)
+    work.add_argument('--lease', type=float, default=DEFAULT_LEASE_SECONDS)
+    for name in ('merge', 'status'):
+        commands.add_parser(name).add_argument('run_dir')
+    run = commands.add_parser('run', help='prepare, run locally with N processes and merge')
+    run.add_argument('--shards', type=int, default=8)
+    run.add_argument('--workers', type=int, default=os.cpu_count())
+    run.add_argument('--run-dir', default=None)
+    bench = commands.add_parser('bench', help='time the shard phase of one run at several worker counts')
+    bench.add_argument('--shards', type=int, default=8)
+    bench.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    bench.add_argument('--run-dir', default=None)
+    args = parser.parse_args()
+
+    default_dir = os.path.join('../data/shards', datetime.now().strftime('%Y%m%d-%H%M%S'))
+    if args.command in ('prepare', 'run', 'bench'):
+        sharded = ShardedRun(args.run_dir or default_dir)
+        if args.command != 'bench' or not os.path.exists(sharded.plan_path):
+            started = time.perf_counter()
+            plan = sharded.prepare(args.shards)
+            print(f"Partitioned {sum(plan['input_rows'].values()):,} rows into {plan['n_shards']} shards "
+                  f"in {time.perf_counter() - started:.1f}s: {sharded.run_dir}")
+    else:
+        sharded = ShardedRun(args.run_dir)
+
+    if args.command == 'work':
+        timings = sharded.work(args.worker, args.lease)
+        print(f"Ran {len(timings)} shard(s): {', '.join(f'{s} ({t:.1f}s)' for s, t in sorted(timings.items()))}")
+    elif args.command == 'status':
+        print(sharded.status())
+    elif args.command == 'run':
+        wall, _ = run_local(sharded, args.workers)
+        kpis = sharded.merge()
+        print(f"Ran {kpis['shards']['count']} shards with {args.workers} worker(s) in {wall:.1f}s")
+        print(json.dumps({k: v for k, v in kpis.items() if k != 'shards'}, indent=2, default=str))
+    elif args.command == 'merge':
+        print(json.dumps(sharded.merge(), indent=2, default=str))
+    elif args.command == 'bench':
+        customers = sharded.plan['input_rows']['raw_customers']
+        baseline = None
+        print(f"{'workers':>7} {'wall s':>8} {'customers/s':>12} {'speedup':>8} {'efficiency':>10}")
+        for workers in args.workers:
+            sharded.reset()
+            wall, _ = run_local(sharded, workers)
+            # Speedup relative to the first worker count, extrapolated to one worker
+            baseline = baseline or wall * workers
+            speedup = baseline / wall
+            print(f"{workers:>7} {wall:>8.1f} {customers / wall:>12,.0f} {speedup:>8.2f} {speedup / workers:>10.0%}")
+        kpis = sharded.merge()
+        print(f"Shard balance {kpis['shards']['balance']:.2f} (busy {kpis['shards']['busy_seconds']:.1f}s, "
+              f"slowest shard {kpis['shards']['max_shard_seconds']:.1f}s) on {os.cpu_count()} CPU(s)")
+
+
+if __name__ == "__main__":
+    main()
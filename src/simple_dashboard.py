@@ -10,14 +10,14 @@ def load_csv(filename):
             data.append(row)
     return data
 
-def calculate_simple_metrics():
+def calculate_simple_metrics(raw_dir='../data/raw'):
     """Calculate basic customer health metrics with GitHub dark theme styling"""
     
     # Load data
-    customers = load_csv('../data/raw/customers.csv')
-    tickets = load_csv('../data/raw/support_tickets.csv')
-    incidents = load_csv('../data/raw/security_incidents.csv')
-    feedback = load_csv('../data/raw/customer_feedback.csv')
+    customers = load_csv(f'{raw_dir}/customers.csv')
+    tickets = load_csv(f'{raw_dir}/support_tickets.csv')
+    incidents = load_csv(f'{raw_dir}/security_incidents.csv')
+    feedback = load_csv(f'{raw_dir}/customer_feedback.csv')
     
     # GitHub dark theme colors
     GREEN = '\033[38;2;35;134;54m'  # GitHub green
@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+"""Concurrent, conditional and resumable download of source files into a local mirror.
+
+Every source is fetched with If-None-Match / If-Modified-Since from the last
+successful download, so an unchanged file costs one 304 response. Bodies are
+stored content-addressed (``objects/ab/<sha256>``); ``refs.json`` maps each
+URL to its current object and validators. An interrupted download is kept
+under ``partial/`` and resumed with a Range request (guarded by If-Range, so
+a file that changed meanwhile is fetched again from the start).
+
+``LocalSourceServer`` serves a directory with the same ETag, conditional and
+Range semantics, so the whole path can be exercised offline
+(``python source_fetcher.py selftest``).
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import threading
+import http.client
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate, parsedate_to_datetime
+from instrumentation import span, count
+
+CHUNK_SIZE = 1 << 20
+
+
+class FetchError(Exception):
+    pass
+
+
+class FetchResult:
+    """Outcome of one source: ``status`` is 'not_modified', 'unchanged', 'downloaded' or 'resumed'."""
+
+    def __init__(self, url, status, path, sha256, size, bytes_transferred, seconds):
+        self.url = url
+        self.status = status
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+        self.bytes_transferred = bytes_transferred
+        self.seconds = seconds
+
+    @property
+    def changed(self):
+        """True when the mirrored content differs from the previous fetch."""
+        return self.status in ('downloaded', 'resumed')
+
+
+class Mirror:
+    """Content-addressed local copies of remote files, plus per-URL validators."""
+
+    def __init__(self, root='../data/mirror'):
+        self.root = root
+        self.refs_path = os.path.join(root, 'refs.json')
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, 'partial'), exist_ok=True)
+
+    def refs(self):
+        try:
+            with open(self.refs_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def ref(self, url):
+        ref = self.refs().get(url)
+        # A ref whose object was removed is treated as never fetched
+        return ref if ref and os.path.exists(self.object_path(ref['sha256'])) else None
+
+    def set_ref(self, url, ref):
+        with self._lock:
+            refs = self.refs()
+            refs[url] = ref
+            with open(self.refs_path + '.tmp', 'w') as f:
+                json.dump(refs, f, indent=2)
+            os.replace(self.refs_path + '.tmp', self.refs_path)
+
+    def object_path(self, sha256):
+        return os.path.join(self.root, 'objects', sha256[:2], sha256)
+
+    def partial_path(self, url):
+        return os.path.join(self.root, 'partial', hashlib.sha256(url.encode()).hexdigest()[:32])
+
+    def store(self, tmp_path, sha256):
+        """Move a finished download into the object store; identical content is stored once."""
+        path = self.object_path(sha256)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        return path
+
+    def path(self, url):
+        """Local path of the current copy of ``url``, or None."""
+        ref = self.ref(url)
+        return self.object_path(ref['sha256']) if ref else None
+
+    def prune(self):
+        """Delete objects no ref points at; returns the bytes freed."""
+        live = {ref['sha256'] for ref in self.refs().values()}
+        freed = 0
+        for directory, _, files in os.walk(os.path.join(self.root, 'objects')):
+            for name in files:
+                if name not in live:
+                    freed += os.path.getsize(os.path.join(directory, name))
+                    os.remove(os.path.join(directory, name))
+        return freed
+
+
+class SourceFetcher:
+    def __init__(self, mirror=None, workers=8, timeout=30, retries=3, chunk_size=CHUNK_SIZE):
+        self.mirror = mirror or Mirror()
+        self.workers = workers
+        self.timeout = timeout
+        self.retries = retries
+        self.chunk_size = chunk_size
+
+    def fetch_all(self, urls):
+        """Fetch ``urls`` concurrently; returns (results by url, summary).
+
+        A source that still fails after retries is left out of the results and
+        reported in ``summary['errors']``; its previous copy stays current.
+        """
+        started = time.perf_counter()
+        results, errors = {}, {}
+        with span('fetch.all', sources=len(urls)):
+            with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(urls)))) as pool:
+                futures = {url: pool.submit(self.fetch, url) for url in urls}
+                for url, future in futures.items():
+                    try:
+                        results[url] = future.result()
+                    except FetchError as e:
+                        errors[url] = str(e)
+        summary = {
+            'sources': len(urls),
+            'changed': sum(r.changed for r in results.values()),
+            'bytes_transferred': sum(r.bytes_transferred for r in results.values()),
+            'seconds': time.perf_counter() - started,
+            'errors': errors,
+        }
+        return results, summary
+
+    def fetch(self, url):
+        """Bring the mirror's copy of ``url`` up to date, retrying (and resuming) on failure."""
+        started = time.perf_counter()
+        transferred = 0
+        for attempt in range(self.retries):
+            try:
+                status, sha256, size, received = self._fetch_once(url)
+                transferred += received
+                break
+            except (OSError, http.client.HTTPException, FetchError) as e:
+                transferred += getattr(e, 'received', 0)
+                if attempt == self.retries - 1:
+                    raise FetchError(f"{url}: {e}") from e
+                time.sleep(0.2 * 2 ** attempt)
+        count(bytes_transferred=transferred)
+        return FetchResult(url, status, self.mirror.object_path(sha256), sha256, size,
+                           transferred, time.perf_counter() - started)
+
+    def _fetch_once(self, url):
+        ref = self.mirror.ref(url)
+        partial = self.mirror.partial_path(url)
+        meta_path = partial + '.json'
+        meta = _read_json(meta_path) if os.path.exists(partial) else None
+
+        request = urllib.request.Request(url)
+        if meta and meta.get('validator'):
+            offset = os.path.getsize(partial)
+            request.add_header('Range', f"bytes={offset}-")
+            # Resume only if the file is still the one we started on
+            request.add_header('If-Range', meta['validator'])
+        elif ref:
+            if ref.get('etag'):
+                request.add_header('If-None-Match', ref['etag'])
+            if ref.get('last_modified'):
+                request.add_header('If-Modified-Since', ref['last_modified'])
+
+        try:
+            response = urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and ref:
+                return 'not_modified', ref['sha256'], ref['size'], 0
+            if e.code == 416:
+                # Our partial is not a prefix of the current file
+                _discard(partial, meta_path)
+                raise FetchError("range not satisfiable, restarting") from e
+            raise
+
+        with response:
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            resumed = response.status == 206
+            digest = hashlib.sha256()
+            if resumed:
+                with open(partial, 'rb') as f:
+                    for block in iter(lambda: f.read(self.chunk_size), b''):
+                        digest.update(block)
+                mode = 'ab'
+            else:
+                mode = 'wb'
+            expected = response.headers.get('Content-Length')
+            # Recorded first, so an interrupted body can be resumed on the next attempt
+            validator = etag if etag and not etag.startswith('W/') else last_modified
+            with open(meta_path, 'w') as f:
+                json.dump({'url': url, 'validator': validator}, f)
+            received = 0
+            with open(partial, mode) as out:
+                # Everything written stays in the partial file for the next attempt to resume from
+                try:
+                    for block in iter(lambda: response.read(self.chunk_size), b''):
+                        out.write(block)
+                        digest.update(block)
+                        received += len(block)
+                except http.client.IncompleteRead as e:
+                    out.write(e.partial)
+                    error = FetchError(f"connection closed after {received + len(e.partial)} bytes")
+                    error.received = received + len(e.partial)
+                    raise error from e
+                except OSError as e:
+                    e.received = received
+                    raise
+            if expected is not None and received < int(expected):
+                error = FetchError(f"connection closed after {received} of {expected} bytes")
+                error.received = received
+                raise error
+
+        sha256 = digest.hexdigest()
+        size = os.path.getsize(partial)
+        os.remove(meta_path)
+        self.mirror.store(partial, sha256)
+        status = 'unchanged' if ref and ref['sha256'] == sha256 else ('resumed' if resumed else 'downloaded')
+        self.mirror.set_ref(url, {'sha256': sha256, 'size': size, 'etag': etag, 'last_modified': last_modified,
+                                  'fetched_at': formatdate(usegmt=True)})
+        return status, sha256, size, received
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _discard(*paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class LocalSourceServer:
+    """HTTP server over a directory with ETag, conditional GET and Range support.
+
+    ``fail_after`` cuts the first response for each file after that many body
+    bytes, to exercise resume. Use as a context manager; ``base_url`` ends in '/'.
+    """
+
+    def __init__(self, directory, fail_after=None):
+        from http.server import ThreadingHTTPServer
+
+        self.directory = os.path.abspath(directory)
+        self.fail_after = fail_after
+        self.failed = set()
+        self.requests = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/"
+        self._thread = None
+
+    def _handler(self):
+        from http.server import BaseHTTPRequestHandler
+
+        fixture = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                path = os.path.join(fixture.directory, os.path.basename(self.path.split('?')[0]))
+                fixture.requests.append((self.path, self.headers.get('Range'), self.headers.get('If-None-Match')))
+                if not os.path.isfile(path):
+                    self.send_error(404)
+                    return
+                stat = os.stat(path)
+                etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+                last_modified = formatdate(stat.st_mtime, usegmt=True)
+                if self.headers.get('If-None-Match') == etag or (
+                        self.headers.get('If-None-Match') is None and self.headers.get('If-Modified-Since')
+                        and parsedate_to_datetime(self.headers['If-Modified-Since']).timestamp() >= int(stat.st_mtime)):
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+
+                start, end = 0, stat.st_size - 1
+                ranged = self.headers.get('Range', '').startswith('bytes=') and \
+                    self.headers.get('If-Range') in (None, etag, last_modified)
+                if ranged:
+                    first, _, last = self.headers['Range'][6:].partition('-')
+                    start = int(first)
+                    end = int(last) if last else end
+                    if start >= stat.st_size:
+                        self.send_response(416)
+                        self.send_header('Content-Range', f"bytes */{stat.st_size}")
+                        self.end_headers()
+                        return
+                self.send_response(206 if ranged else 200)
+                self.send_header('ETag', etag)
+                self.send_header('Last-Modified', last_modified)
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('Content-Length', str(end - start + 1))
+                if ranged:
+                    self.send_header('Content-Range', f"bytes {start}-{end}/{stat.st_size}")
+                self.end_headers()
+                with open(path, 'rb') as f:
+                    f.seek(start)
+                    body = f.read(end - start + 1)
+                if fixture.fail_after is not None and path not in fixture.failed:
+                    fixture.failed.add(path)
+                    self.wfile.write(body[:fixture.fail_after])
+                    self.close_connection = True
+                    return
+                self.wfile.write(body)
+
+        return Handler
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def print_results(results, summary):
+    for url, r in results.items():
+        print(f"  {os.path.basename(url):<28} {r.status:<13} {r.size:>12,} B  "
+              f"{r.bytes_transferred:>12,} B transferred  {r.seconds * 1000:>7.0f} ms")
+    print(f"Refreshed {summary['sources']} sources in {summary['seconds']:.2f}s: {summary['changed']} changed, "
+          f"{summary['bytes_transferred']:,} bytes transferred")
+    for url, error in summary['errors'].items():
+        print(f"  FAILED {url}: {error}")
+
+
+class SelfTestError(Exception):
+    pass
+
+
+def _expect(condition, message):
+    if not condition:
+        raise SelfTestError(message)
+
+
+def _change_row(path, key_columns):
+    """Give the last row of a CSV the first row's non-key values, keeping its key."""
+    import csv
+
+    with open(path, newline='') as f:
+        rows = list(csv.reader(f))
+    header, first, last = rows[0], rows[1], rows[-1]
+    rows[-1] = [last[i] if column in key_columns else first[i] for i, column in enumerate(header)]
+    with open(path, 'w', newline='') as f:
+        csv.writer(f, lineterminator='\n').writerows(rows)
+    return rows[-1] != last
+
+
+def selftest(source_dir='../data/raw'):
+    """Serve ``source_dir`` locally and run cold, warm, changed and interrupted refreshes against it.
+
+    After every refresh the mirrored files are loaded through ``ChangeCapture``
+    into a scratch DuckDB, and the insert/update counts it reports are checked
+    against what changed on the server. Raises SelfTestError on the first
+    mismatch.
+    """
+    import tempfile
+    import duckdb
+    from raw_cdc import ChangeCapture
+    from customer_dim import normalize_sql
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = sorted(f for f in os.listdir(source_dir) if f.endswith('.csv'))
+        served = os.path.join(tmp, 'served')
+        shutil.copytree(source_dir, served)
+        mirror = Mirror(os.path.join(tmp, 'mirror'))
+        conn = duckdb.connect(os.path.join(tmp, 'cdc.duckdb'))
+        cdc = ChangeCapture(conn, root=os.path.join(tmp, 'cdc'), quarantine_dir=os.path.join(tmp, 'quarantine'))
+
+        def load(expected):
+            """Capture every mirrored file; ``expected`` maps file -> (inserts, updates), others must be unchanged."""
+            for f in files:
+                s = cdc.capture(f[:-4], mirror.path(server.base_url + f))
+                inserts, updates = expected.get(f, (0, 0))
+                _expect((s['inserts'], s['updates'], s['deletes']) == (inserts, updates, 0),
+                        f"CDC load of {f}: +{s['inserts']} ~{s['updates']} -{s['deletes']}, "
+                        f"expected +{inserts} ~{updates} -0")
+            print(f"  CDC load: {', '.join(f'{f[:-4]} +{i} ~{u}' for f, (i, u) in expected.items()) or 'no changes'}")
+
+        with LocalSourceServer(served, fail_after=4096) as server:
+            fetcher = SourceFetcher(mirror)
+            urls = [server.base_url + f for f in files]
+            print("Cold refresh (every first response is cut after 4 KB, then resumed):")
+            results, summary = fetcher.fetch_all(urls)
+            print_results(results, summary)
+            for f in files:
+                with open(os.path.join(served, f), 'rb') as a, open(mirror.path(server.base_url + f), 'rb') as b:
+                    _expect(a.read() == b.read(), f"mirror copy of {f} differs")
+            resumed_from = [r for _, r, _ in server.requests if r and r != 'bytes=0-']
+            _expect(resumed_from, "no download was resumed mid-file")
+            print(f"  resumed with {', '.join(sorted(set(resumed_from)))}")
+            # Every row whose key isn't repeated within its file is an insert
+            unique_rows = {}
+            for f in files:
+                source = f"read_csv('{os.path.join(served, f)}', all_varchar = true)"
+                columns = [row[0] for row in conn.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()]
+                key = ', '.join(normalize_sql(f'"{c}"') if c == 'customer_id' else f'"{c}"'
+                                for c in cdc.key_columns(f[:-4], columns))
+                unique_rows[f] = conn.execute(f"SELECT COUNT(DISTINCT ({key})) FROM {source}").fetchone()[0]
+            load({f: (n, 0) for f, n in unique_rows.items()})
+
+            print("Warm refresh (nothing changed):")
+            results, summary = fetcher.fetch_all(urls)
+            print_results(results, summary)
+            _expect(summary['changed'] == 0 and summary['bytes_transferred'] == 0,
+                    f"warm refresh changed {summary['changed']} files, {summary['bytes_transferred']} bytes")
+            load({})
+
+            touched = os.path.join(served, files[0])
+            os.utime(touched, ns=(time.time_ns() + 10**9,) * 2)
+            print(f"Touched {files[0]} without changing it:")
+            results, summary = fetcher.fetch_all(urls)
+            print_results(results, summary)
+            _expect(results[urls[0]].status == 'unchanged' and summary['changed'] == 0,
+                    f"touched file came back {results[urls[0]].status}, {summary['changed']} changed")
+            load({})
+
+            with open(os.path.join(served, files[-1]), 'rb') as f:
+                original = f.read()
+            last_row = original.rstrip(b'\n').rsplit(b'\n', 1)[-1]
+            with open(os.path.join(served, files[-1]), 'ab') as f:
+                f.write(last_row + b'\n')
+            os.utime(os.path.join(served, files[-1]), ns=(time.time_ns() + 2 * 10**9,) * 2)
+            print(f"Appended a row to {files[-1]}:")
+            results, summary = fetcher.fetch_all(urls)
+            print_results(results, summary)
+            _expect(summary['changed'] == 1 and results[urls[-1]].changed,
+                    f"{summary['changed']} files changed after appending to {files[-1]}")
+            # A repeated key is quarantined, not applied
+            load({})
+
+            with open(os.path.join(served, files[-1]), 'wb') as f:
+                f.write(original)
+            header = original.split(b'\n', 1)[0].decode().split(',')
+            _expect(_change_row(os.path.join(served, files[-1]), cdc.key_columns(files[-1][:-4], header)),
+                    f"last row of {files[-1]} already matches its first")
+            os.utime(os.path.join(served, files[-1]), ns=(time.time_ns() + 3 * 10**9,) * 2)
+            print(f"Changed the last row of {files[-1]}:")
+            results, summary = fetcher.fetch_all(urls)
+            print_results(results, summary)
+            _expect(summary['changed'] == 1 and results[urls[-1]].changed,
+                    f"{summary['changed']} files changed after editing {files[-1]}")
+            load({files[-1]: (0, 1)})
+        conn.close()
+        print("Self-test passed")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    fetch = commands.add_parser('fetch', help='refresh the mirror copies of the given URLs')
+    fetch.add_argument('urls', nargs='+')
+    fetch.add_argument('--mirror', default='../data/mirror')
+    fetch.add_argument('--workers', type=int, default=8)
+    commands.add_parser('prune', help='delete objects no URL points at').add_argument('--mirror', default='../data/mirror')
+    test = commands.add_parser('selftest', help='exercise the fetcher offline against a local server')
+    test.add_argument('--source-dir', default='../data/raw')
+    args = parser.parse_args()
+
+    if args.command == 'fetch':
+        results, summary = SourceFetcher(Mirror(args.mirror), workers=args.workers).fetch_all(args.urls)
+        print_results(results, summary)
+    elif args.command == 'prune':
+        print(f"Freed {Mirror(args.mirror).prune():,} bytes")
+    else:
+        try:
+            selftest(args.source_dir)
+        except SelfTestError as e:
+            print(f"Self-test failed: {e}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
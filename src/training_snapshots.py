@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""Point-in-time correct churn training snapshots stored as partitioned Parquet."""
+
+import os
+import glob
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+import duckdb
+import pandas as pd
+from db_snapshots import connect_reader
+from revenue_ledger import EVENT_EFFECTS
+
+# Each event source is aggregated on its own over rows strictly before the
+# cutoff, so no count is multiplied by another table's rows. The live feature
+# query (churn_predictor.FEATURE_QUERY) is this same query as of CURRENT_DATE.
+EVENT_SOURCES = {
+    'support_tickets': ('created_date', """
+        SELECT customer_id,
+               COUNT(ticket_id) AS ticket_count,
+               AVG(resolution_time_hours) AS avg_resolution_time,
+               AVG(satisfaction_score) AS avg_satisfaction
+        FROM support_tickets
+        WHERE created_date < $cutoff
+        GROUP BY customer_id
+    """),
+    'security_incidents': ('incident_timestamp', """
+        SELECT customer_id,
+               COUNT(incident_id) AS incident_count,
+               AVG(severity_score) AS avg_severity
+        FROM security_incidents
+        WHERE incident_timestamp < $cutoff
+        GROUP BY customer_id
+    """),
+    'product_usage': ('date', """
+        SELECT customer_id,
+               AVG(daily_active_users) AS avg_daily_users,
+               AVG(feature_adoption_rate) AS avg_adoption_rate,
+               AVG(license_utilization) AS avg_license_util
+        FROM product_usage
+        WHERE date < $cutoff
+        GROUP BY customer_id
+    """),
+    'customer_feedback': ('feedback_date', """
+        SELECT customer_id,
+               AVG(nps_score) AS avg_nps,
+               AVG(satisfaction_rating) AS avg_rating
+        FROM customer_feedback
+        WHERE feedback_date < $cutoff
+        GROUP BY customer_id
+    """),
+}
+
+SOURCE_COLUMNS = {
+    'support_tickets': ['ticket_count', 'avg_resolution_time', 'avg_satisfaction'],
+    'security_incidents': ['incident_count', 'avg_severity'],
+    'product_usage': ['avg_daily_users', 'avg_adoption_rate', 'avg_license_util'],
+    'customer_feedback': ['avg_nps', 'avg_rating'],
+}
+
+# Contract events that settle the label within the horizon
+RENEWAL_EVENTS = ('Contract Renewal', 'Contract Extension')
+CANCEL_EVENTS = ('Churn', 'Cancellation')
+# Event types that don't change contract value (everything else does, as in the revenue ledger)
+VALUE_NEUTRAL_EVENTS = tuple(t for t, effect in EVENT_EFFECTS.items() if effect != 'delta')
+
+CONTRACT_EVENTS_QUERY = """
+    SELECT customer_id,
+           SUM(CASE WHEN CAST(event_date AS DATE) >= $cutoff AND event_type NOT IN {neutral}
+                    THEN revenue_impact ELSE 0 END) AS later_value_change,
+           BOOL_OR(CAST(event_date AS DATE) >= $cutoff AND CAST(event_date AS DATE) < $cutoff + INTERVAL '{horizon} days'
+                   AND event_type IN {renewals}) AS renewed,
+           BOOL_OR(CAST(event_date AS DATE) >= $cutoff AND CAST(event_date AS DATE) < $cutoff + INTERVAL '{horizon} days'
+                   AND event_type IN {cancels}) AS cancelled
+    FROM contract_events
+    GROUP BY customer_id
+"""
+
+
+def _sql_list(values):
+    return '(' + ', '.join("'" + v.replace("'", "''") + "'" for v in values) + ')'
+
+
+def _feature_query(available_tables, active_filter, extra_ctes=(), extra_joins=(), contract_value='active.contract_value',
+                   labels=()):
+    """Per-customer features from ``customers`` (filtered by ``active_filter``) and each event source before $cutoff."""
+    ctes = [f"""active AS (
+        SELECT customer_id, contract_value, contract_start_date, contract_end_date
+        FROM customers
+        WHERE {active_filter}
+    )"""] + list(extra_ctes)
+    joins = list(extra_joins)
+    columns = []
+    for table, (_, query) in EVENT_SOURCES.items():
+        if table in available_tables:
+            ctes.append(f"{table}_asof AS ({query})")
+            joins.append(f"LEFT JOIN {table}_asof USING (customer_id)")
+            columns += [f"COALESCE({table}_asof.{col}, 0) AS {col}" for col in SOURCE_COLUMNS[table]]
+        else:
+            columns += [f"0 AS {col}" for col in SOURCE_COLUMNS[table]]
+
+    return f"""
+    WITH {', '.join(ctes)}
+    SELECT
+        active.customer_id,
+        {contract_value} AS contract_value,
+        active.contract_start_date,
+        active.contract_end_date,
+        {', '.join(columns + list(labels))}
+    FROM active
+    {' '.join(joins)}
+    """
+
+
+def snapshot_query(available_tables, horizon_days=180, renewal_days=90):
+    """As-of feature query for one cutoff (bound as $cutoff).
+
+    Only customers whose contract is active at the cutoff are included. With
+    a ``contract_events`` table, contract value is rolled back past value
+    changes booked on or after the cutoff, and the label is renewal-aware: a
+    cancellation within ``horizon_days`` is churn, a renewal or extension
+    within it is not, and otherwise it is whether the contract ends within
+    the horizon. Without one, contract value and end date come from today's
+    ``customers`` row.
+    """
+    renewal_soon = (f"CASE WHEN active.contract_end_date <= $cutoff + INTERVAL '{int(renewal_days)} days' "
+                    f"THEN 1 ELSE 0 END AS renewal_soon")
+    ends = f"active.contract_end_date <= $cutoff + INTERVAL '{int(horizon_days)} days'"
+    if 'contract_events' not in available_tables:
+        return _feature_query(available_tables, "contract_start_date <= $cutoff AND contract_end_date > $cutoff",
+                              labels=[renewal_soon, f"CASE WHEN {ends} THEN 1 ELSE 0 END AS churned"])
+
+    events = CONTRACT_EVENTS_QUERY.format(neutral=_sql_list(VALUE_NEUTRAL_EVENTS), renewals=_sql_list(RENEWAL_EVENTS),
+                                          cancels=_sql_list(CANCEL_EVENTS), horizon=int(horizon_days))
+    churned = f"""CASE WHEN contract_events_asof.cancelled THEN 1
+                       WHEN contract_events_asof.renewed THEN 0
+                       WHEN {ends} THEN 1 ELSE 0 END AS churned"""
+    return _feature_query(
+        available_tables, "contract_start_date <= $cutoff AND contract_end_date > $cutoff",
+        extra_ctes=[f"contract_events_asof AS ({events})"],
+        extra_joins=["LEFT JOIN contract_events_asof USING (customer_id)"],
+        contract_value="active.contract_value - COALESCE(contract_events_asof.later_value_change, 0)",
+        labels=[renewal_soon, churned])
+
+
+def serving_query(renewal_days=90):
+    """Live feature query: the snapshot features as of CURRENT_DATE, over every customer.
+
+    ``churned`` here is whether the contract has already ended, which is what
+    ChurnPredictor trains on without snapshots and filters out when scoring.
+    """
+    query = _feature_query(set(EVENT_SOURCES), 'TRUE', labels=[
+        f"CASE WHEN active.contract_end_date <= $cutoff + INTERVAL '{int(renewal_days)} days' "
+        f"THEN 1 ELSE 0 END AS renewal_soon",
+        "CASE WHEN active.contract_end_date <= $cutoff THEN 1 ELSE 0 END AS churned"])
+    # A literal rather than a parameter, so callers can still bind their own
+    return query.replace('$cutoff', 'CURRENT_DATE')
+
+
+def _build_snapshot(db_path, output_dir, cutoff, horizon_days, renewal_days):
+    """Materialize one cutoff's features into its own Parquet partition."""
+    conn = connect_reader(db_path)
+    tables = {row[0] for row in conn.execute("SELECT table_name FROM duckdb_tables()").fetchall()}
+    query = snapshot_query(tables, horizon_days, renewal_days)
+
+    partition = os.path.join(output_dir, f"cutoff={cutoff}")
+    tmp_partition = partition + '.tmp'
+    shutil.rmtree(tmp_partition, ignore_errors=True)
+    os.makedirs(tmp_partition)
+    # COPY cannot take prepared parameters, so the cutoff is materialized first
+    conn.execute(f"CREATE TEMP TABLE snapshot AS {query}", {'cutoff': pd.Timestamp(cutoff).date()})
+    rows = conn.execute("SELECT COUNT(*) FROM snapshot").fetchone()[0]
+    conn.execute(f"COPY snapshot TO '{os.path.join(tmp_partition, 'part-0.parquet')}' (FORMAT PARQUET)")
+    conn.close()
+
+    shutil.rmtree(partition, ignore_errors=True)
+    os.replace(tmp_partition, partition)
+    return cutoff, rows
+
+
+class SnapshotBuilder:
+    def __init__(self, db_path='../data/cybersec_health_dbt.duckdb', output_dir='../data/snapshots',
+                 horizon_days=180, renewal_days=90, max_workers=None):
+        self.db_path = db_path
+        self.output_dir = output_dir
+        self.horizon_days = horizon_days
+        self.renewal_days = renewal_days
+        self.max_workers = max_workers
+
+    @staticmethod
+    def cutoffs(start, end, freq='MS'):
+        """Cutoff dates between ``start`` and ``end`` (month starts by default)."""
+        return [d.strftime('%Y-%m-%d') for d in pd.date_range(start, end, freq=freq)]
+
+    def existing(self):
+        """Cutoffs that already have a complete snapshot on disk."""
+        paths = glob.glob(os.path.join(self.output_dir, 'cutoff=*', 'part-0.parquet'))
+        return sorted(os.path.basename(os.path.dirname(p)).split('=', 1)[1] for p in paths)
+
+    def build(self, cutoffs, overwrite=False):
+        """Build missing snapshots in parallel; returns {cutoff: row_count}."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        done = set(self.existing())
+        todo = [c for c in cutoffs if overwrite or c not in done]
+        if not todo:
+            return {}
+
+        with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [pool.submit(_build_snapshot, self.db_path, self.output_dir, cutoff,
+                                   self.horizon_days, self.renewal_days) for cutoff in todo]
+            return dict(future.result() for future in futures)
+
+    def load(self, cutoffs=None):
+        """Read precomputed snapshots (all, or just the given cutoffs) into one frame.
+
+        Raises FileNotFoundError naming any requested cutoff that has no
+        snapshot, rather than handing training an empty or partial frame.
+        """
+        available = self.existing()
+        wanted = available if cutoffs is None else list(cutoffs)
+        missing = sorted(set(wanted) - set(available))
+        if missing or not wanted:
+            raise FileNotFoundError(
+                f"No training snapshot in {self.output_dir} for cutoff(s) {', '.join(missing) or '(any)'}; "
+                f"build them first (python training_snapshots.py START END)")
+
+        files = [os.path.join(self.output_dir, f"cutoff={c}", 'part-0.parquet') for c in wanted]
+        conn = duckdb.connect()
+        df = conn.execute(
+            "SELECT * FROM read_parquet($files, hive_partitioning = true) ORDER BY cutoff, customer_id",
+            {'files': files}
+        ).df()
+        conn.close()
+        df['cutoff'] = pd.to_datetime(df['cutoff'])
+        return df
+
+    def fingerprint(self, cutoffs):
+        """Size/mtime fingerprint of the snapshot files for the given cutoffs."""
+        parts = []
+        for cutoff in cutoffs:
+            path = os.path.join(self.output_dir, f"cutoff={cutoff}", 'part-0.parquet')
+            stat = os.stat(path)
+            parts.append(f"{cutoff}:{stat.st_size}:{stat.st_mtime_ns}")
+        return '|'.join(parts)
+
+
+def main():
+    import sys
+
+    builder = SnapshotBuilder()
+    end = sys.argv[2] if len(sys.argv) > 2 else pd.Timestamp.today().strftime('%Y-%m-%d')
+    start = sys.argv[1] if len(sys.argv) > 1 else (pd.Timestamp(end) - pd.DateOffset(months=12)).strftime('%Y-%m-%d')
+
+    built = builder.build(builder.cutoffs(start, end))
+    for cutoff, rows in sorted(built.items()):
+        print(f"Built snapshot {cutoff}: {rows} customers")
+    print(f"{len(builder.existing())} snapshots available in {builder.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,63 @@
+import os
 import pandas as pd
 import numpy as np
+from customer_dim import CustomerDimension
+from instrumentation import traced, count
 
-def calculate_customer_health_score():
-    """Calculate comprehensive customer health score"""
+HEALTH_INPUTS = {
+    'customers': 'customers.csv',
+    'tickets': 'support_tickets.csv',
+    'incidents': 'security_incidents.csv',
+    'usage': 'product_usage.csv',
+    'feedback': 'customer_feedback.csv',
+}
+
+def load_health_inputs(data_dir='../data/raw'):
+    """Raw frames the health scores are computed from, keyed as in HEALTH_INPUTS"""
+    return {name: pd.read_csv(os.path.join(data_dir, file)) for name, file in HEALTH_INPUTS.items()}
+
+@traced('transform.health_score')
+def calculate_customer_health_score(inputs=None, dim=None):
+    """Calculate comprehensive customer health score
+    
+    ``inputs`` defaults to the current raw CSVs; the backfill passes as-of
+    slices of them instead. The frames are not modified.
+    """
     
     # Load all data
-    customers = pd.read_csv('../data/raw/customers.csv')
-    tickets = pd.read_csv('../data/raw/support_tickets.csv')
-    incidents = pd.read_csv('../data/raw/security_incidents.csv')
-    usage = pd.read_csv('../data/raw/product_usage.csv')
-    feedback = pd.read_csv('../data/raw/customer_feedback.csv')
+    inputs = inputs or load_health_inputs()
+    customers = inputs['customers'].copy()
+    tickets = inputs['tickets']
+    incidents = inputs['incidents']
+    usage = inputs['usage'].copy()
+    feedback = inputs['feedback'].copy()
+    
+    # Join and aggregate on integer surrogate keys from the customer dimension
+    dim = dim if dim is not None else CustomerDimension()
+    customers['customer_key'] = dim.register(customers['customer_id'])
+    usage['customer_key'] = dim.keys(usage['customer_id'])
+    feedback['customer_key'] = dim.keys(feedback['customer_id'])
     
     # Aggregate metrics by customer
-    ticket_metrics = tickets.groupby('customer_id').agg({
-        'ticket_id': 'count',
-        'resolution_time_hours': 'mean',
-        'satisfaction_score': 'mean',
-        'escalated': 'sum'
-    }).rename(columns={'ticket_id': 'total_tickets'})
+    ticket_metrics = dim.aggregate_frame(tickets, {
+        'total_tickets': ('ticket_id', 'count'),
+        'resolution_time_hours': ('resolution_time_hours', 'mean'),
+        'satisfaction_score': ('satisfaction_score', 'mean'),
+        'escalated': ('escalated', 'sum')
+    })
     
-    incident_metrics = incidents.groupby('customer_id').agg({
-        'incident_id': 'count',
-        'mean_time_to_detect_minutes': 'mean',
-        'mean_time_to_respond_minutes': 'mean',
-        'false_positive': 'sum'
-    }).rename(columns={'incident_id': 'total_incidents'})
+    incident_metrics = dim.aggregate_frame(incidents, {
+        'total_incidents': ('incident_id', 'count'),
+        'mean_time_to_detect_minutes': ('mean_time_to_detect_minutes', 'mean'),
+        'mean_time_to_respond_minutes': ('mean_time_to_respond_minutes', 'mean'),
+        'false_positive': ('false_positive', 'sum')
+    })
     
     # Merge all metrics
-    health_df = customers.merge(ticket_metrics, on='customer_id', how='left')
-    health_df = health_df.merge(incident_metrics, on='customer_id', how='left')
-    health_df = health_df.merge(usage[['customer_id', 'feature_adoption_score', 'license_utilization_pct']], on='customer_id', how='left')
-    health_df = health_df.merge(feedback[['customer_id', 'nps_score', 'likelihood_to_renew']], on='customer_id', how='left')
+    health_df = customers.merge(ticket_metrics, on='customer_key', how='left')
+    health_df = health_df.merge(incident_metrics, on='customer_key', how='left')
+    health_df = health_df.merge(usage[['customer_key', 'feature_adoption_score', 'license_utilization_pct']], on='customer_key', how='left')
+    health_df = health_df.merge(feedback[['customer_key', 'nps_score', 'likelihood_to_renew']], on='customer_key', how='left')
     
     # Fill NAs
     health_df = health_df.fillna(0)
@@ -56,6 +83,7 @@ def calculate_customer_health_score():
                                          bins=[0, 40, 70, 100], 
                                          labels=['At Risk', 'Healthy', 'Champion'])
     
+    count(rows=len(health_df))
     return health_df
 
 if __name__ == "__main__":
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""Per-customer 7/30/90-day ticket, satisfaction, incident and usage windows, maintained one day at a time.
+
+Daily counts and sums are kept in ring buffers of shape (days, customers),
+one row per day of the longest window, next to running totals for each
+window. Advancing a day adds the new row to every total, subtracts the row
+that falls out of each window, and overwrites the oldest ring row, so a
+daily refresh reads only the new days' rows from the database, plus the last
+``RESTATE_DAYS`` days already folded in, which are re-read and swapped in to
+catch rows that arrived late. Columns are
+customer-dimension keys, so every metric is a contiguous array over all
+customers.
+"""
+
+import os
+import json
+import time
+from datetime import date, datetime, timedelta
+import numpy as np
+import pandas as pd
+from instrumentation import traced, count
+
+WINDOWS = (7, 30, 90)
+RESTATE_DAYS = 3
+
+# table -> (day column, {bucket: aggregate}); one query per table per refresh
+SOURCES = {
+    'support_tickets': ('created_date', {
+        'tickets': 'COUNT(*)',
+        'satisfaction_sum': 'SUM(satisfaction_score)',
+        'satisfaction_n': 'COUNT(satisfaction_score)',
+    }),
+    'security_incidents': ('incident_date', {
+        'incidents': 'COUNT(*)',
+    }),
+    'product_usage': ('date', {
+        'usage_sum': 'SUM(daily_active_users)',
+        'usage_n': 'COUNT(daily_active_users)',
+    }),
+}
+
+DAILY_QUERY = """
+    SELECT customer_id, CAST({day} AS DATE) AS day, {aggregates}
+    FROM {table}
+    WHERE CAST({day} AS DATE) BETWEEN ? AND ?
+    GROUP BY ALL
+"""
+
+
+def _ratio(numerator, denominator):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(denominator > 0, numerator / np.maximum(denominator, 1), np.nan)
+
+
+class WindowStore:
+    """Ring buffers plus running window totals for every bucket in ``SOURCES``."""
+
+    def __init__(self, db_path='../data/cybersec_health_dbt.duckdb', state_dir='../data/windows',
+                 dim_path='../data/dimensions/customer_dim.csv', windows=WINDOWS):
+        from customer_dim import CustomerDimension
+
+        self.db_path = db_path
+        self.state_dir = state_dir
+        self.dim = CustomerDimension(dim_path)
+        self.windows = tuple(sorted(windows))
+        self.horizon = self.windows[-1]
+        self.buckets = [bucket for _, aggregates in SOURCES.values() for bucket in aggregates]
+        self.through = None
+        self._reset(len(self.dim))
+
+    def _reset(self, n_customers):
+        # float64 so sums slid in and out for months don't drift
+        self.ring = {b: np.zeros((self.horizon, n_customers)) for b in self.buckets}
+        self.totals = {(b, w): np.zeros(n_customers) for b in self.buckets for w in self.windows}
+
+    def _resize(self, n_customers):
+        extra = n_customers - self.ring[self.buckets[0]].shape[1]
+        if extra > 0:
+            self.ring = {b: np.hstack([r, np.zeros((self.horizon, extra))]) for b, r in self.ring.items()}
+            self.totals = {k: np.concatenate([t, np.zeros(extra)]) for k, t in self.totals.items()}
+
+    # --- state ---
+
+    def load(self):
+        meta_path = os.path.join(self.state_dir, 'meta.json')
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path) as f:
+            meta = json.load(f)
+        # A different window set or bucket list means the totals don't line up; start over
+        if meta['windows'] != list(self.windows) or meta['buckets'] != self.buckets:
+            return False
+        with np.load(os.path.join(self.state_dir, 'windows.npz')) as arrays:
+            self.ring = {b: np.array(arrays[f"ring_{b}"]) for b in self.buckets}
+            self.totals = {(b, w): np.array(arrays[f"total_{b}_{w}"]) for b in self.buckets for w in self.windows}
+        self.through = date.fromisoformat(meta['through'])
+        self._resize(len(self.dim))
+        return True
+
+    def save(self):
+        os.makedirs(self.state_dir, exist_ok=True)
+        path = os.path.join(self.state_dir, 'windows.npz')
+        arrays = {f"ring_{b}": r for b, r in self.ring.items()}
+        arrays.update({f"total_{b}_{w}": t for (b, w), t in self.totals.items()})
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(path + '.tmp', path)
+        meta_path = os.path.join(self.state_dir, 'meta.json')
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump({'through': self.through.isoformat(), 'windows': list(self.windows), 'buckets': self.buckets,
+                       'customers': len(self.dim), 'updated': datetime.now().isoformat(timespec='seconds')},
+                      f, indent=2)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    # --- maintenance ---
+
+    def _daily_rows(self, first, through):
+        """{bucket: (days, customers) array} for ``first``..``through`` inclusive, one query per table."""
+        import pyarrow.compute as pc
+        from db_connections import get_manager
+
+        n_days = (through - first).days + 1
+        rows = {}
+        for table, (day, aggregates) in SOURCES.items():
+            query = DAILY_QUERY.format(table=table, day=day, aggregates=', '.join(
+                f"{expression} AS {bucket}" for bucket, expression in aggregates.items()))
+            result = get_manager().fetch_arrow(self.db_path, query, [first, through], label=f"windows_{table}")
+            if not result.num_rows:
+                continue
+            ids = pc.dictionary_encode(result['customer_id']).combine_chunks()
+            # Key each distinct id once and broadcast through the dictionary indices
+            keys = self.dim.register(ids.dictionary.to_pandas())[ids.indices.to_numpy(zero_copy_only=False)]
+            days = (result['day'].to_numpy().astype('datetime64[D]') - np.datetime64(first, 'D')).astype(np.int64)
+            for bucket in aggregates:
+                rows[bucket] = (days, keys, result[bucket].to_numpy(zero_copy_only=False).astype(np.float64))
+
+        # Sized after every table is read, since each may register new customers
+        blocks = {bucket: np.zeros((n_days, len(self.dim))) for bucket in self.buckets}
+        for bucket, (days, keys, values) in rows.items():
+            np.add.at(blocks[bucket], (days, keys), np.nan_to_num(values))
+        return blocks
+
+    def slide(self, day, rows):
+        """Advance every window to end on ``day``, given that day's {bucket: (customers,) array}."""
+        ordinal = day.toordinal()
+        slot = ordinal % self.horizon
+        for bucket in self.buckets:
+            ring, new = self.ring[bucket], rows[bucket]
+            for w in self.windows:
+                # Row for day - w leaves the window; for the longest window that's the slot being reused
+                total = self.totals[(bucket, w)]
+                total += new
+                total -= ring[(ordinal - w) % self.horizon]
+            ring[slot] = new
+        self.through = day
+
+    def restate(self, day, rows):
+        """Replace the row of ``day``, already folded in, with recomputed counts."""
+        age = (self.through - day).days
+        slot = day.toordinal() % self.horizon
+        for bucket in self.buckets:
+            ring, new = self.ring[bucket], rows[bucket]
+            delta = new - ring[slot]
+            for w in self.windows:
+                if age < w:
+                    self.totals[(bucket, w)] += delta
+            ring[slot] = new
+
+    @traced('windows.refresh')
+    def refresh(self, through=None, rebuild=False, restate=RESTATE_DAYS):
+        """Bring every window up to day ``through`` (default yesterday).
+
+        Reads the days not yet folded in plus the last ``restate`` days that
+        were, whose rows are recomputed and swapped in, so rows arriving a
+        few days late are counted. Anything later than that is picked up by
+        ``rebuild=True``, which reloads the longest window from scratch.
+        """
+        through = through or date.today() - timedelta(days=1)
+        if rebuild or not self.load() or through - self.through >= timedelta(days=self.horizon):
+            self._reset(len(self.dim))
+            self.through = through - timedelta(days=self.horizon)
+            restate = 0
+        if through < self.through:
+            return self
+
+        first = self.through + timedelta(days=1 - min(restate, self.horizon))
+        blocks = self._daily_rows(first, through)
+        self._resize(len(self.dim))
+        for i in range((through - first).days + 1):
+            day = first + timedelta(days=i)
+            rows = {bucket: block[i] for bucket, block in blocks.items()}
+            if day <= self.through:
+                self.restate(day, rows)
+            else:
+                self.slide(day, rows)
+        self.save()
+        count(days=(through - first).days + 1, customers=len(self.dim))
+        return self
+
+    # --- features ---
+
+    def window(self, bucket, days):
+        """Total of ``bucket`` over the last ``days`` days, indexed by customer key."""
+        return self.totals[(bucket, days)]
+
+    def metrics(self):
+        """{name: (customers,) array} for every window, plus the 30-vs-prior-60-day usage comparison."""
+        result = {}
+        for w in self.windows:
+            result[f"tickets_{w}d"] = self.window('tickets', w)
+            result[f"satisfaction_{w}d"] = _ratio(self.window('satisfaction_sum', w), self.window('satisfaction_n', w))
+            result[f"incidents_{w}d"] = self.window('incidents', w)
+            result[f"usage_{w}d"] = _ratio(self.window('usage_sum', w), self.window('usage_n', w))
+        result['previous_usage'] = _ratio(self.window('usage_sum', 90) - self.window('usage_sum', 30),
+                                          self.window('usage_n', 90) - self.window('usage_n', 30))
+        result['usage_trend'] = _ratio(result['usage_30d'] - result['previous_usage'], result['previous_usage'])
+        return result
+
+    def features(self, customer_ids):
+        """Frame of the given customers with the risk-factor columns ``RISK_QUERY`` produces.
+
+        Customers with no activity get zero counts and NaN averages, like the SQL.
+        """
+        keys = self.dim.keys(customer_ids)
+        known = keys >= 0
+        metrics = self.metrics()
+
+        def take(name, fill):
+            values = np.full(len(keys), fill, dtype=np.float64)
+            values[known] = metrics[name][keys[known]]
+            return values
+
+        frame = pd.DataFrame({'customer_id': np.asarray(customer_ids)})
+        for w in self.windows:
+            frame[f"tickets_{w}d"] = take(f"tickets_{w}d", 0).astype(np.int64)
+            frame[f"satisfaction_{w}d"] = take(f"satisfaction_{w}d", np.nan)
+            frame[f"incidents_{w}d"] = take(f"incidents_{w}d", 0).astype(np.int64)
+            frame[f"usage_{w}d"] = take(f"usage_{w}d", np.nan)
+        frame['recent_tickets'] = frame['tickets_30d']
+        frame['recent_satisfaction'] = frame['satisfaction_30d']
+        frame['recent_incidents'] = frame['incidents_30d']
+        frame['recent_usage'] = frame['usage_30d']
+        frame['previous_usage'] = take('previous_usage', np.nan)
+        return frame
+
+
+def benchmark(n_customers=100_000, n_days=90, seed=0):
+    """Seconds to slide one day vs rebuilding all windows, on synthetic per-customer daily rows."""
+    rng = np.random.default_rng(seed)
+    store = WindowStore(state_dir=None, dim_path=None)
+    store._reset(n_customers)
+    rows = [{b: rng.poisson(0.3, n_customers).astype(np.float64) for b in store.buckets} for _ in range(n_days + 1)]
+    start = date(2026, 1, 1)
+
+    started = time.perf_counter()
+    for i in range(n_days):
+        store.slide(start + timedelta(days=i), rows[i])
+    rebuild_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    store.slide(start + timedelta(days=n_days), rows[n_days])
+    slide_seconds = time.perf_counter() - started
+
+    # The running totals must equal a direct sum over the window
+    expected = sum(rows[i]['tickets'] for i in range(n_days + 1 - 30, n_days + 1))
+    assert np.array_equal(store.window('tickets', 30), expected)
+    return {'customers': n_customers, 'rebuild_seconds': rebuild_seconds, 'slide_seconds': slide_seconds}
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--through', type=date.fromisoformat, help='last day in the windows (default yesterday)')
+    parser.add_argument('--rebuild', action='store_true', help='reload the longest window from the database')
+    parser.add_argument('--benchmark', type=int, nargs='?', const=100_000, metavar='CUSTOMERS')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        r = benchmark(args.benchmark)
+        print(f"{r['customers']:,} customers, windows {'/'.join(map(str, WINDOWS))} days")
+        print(f"  rebuild {r['rebuild_seconds']:.2f}s, daily slide {r['slide_seconds'] * 1000:.1f} ms")
+        return
+
+    store = WindowStore().refresh(args.through, rebuild=args.rebuild)
+    metrics = store.metrics()
+    print(f"Windows through {store.through} for {len(store.dim)} customers")
+    for w in store.windows:
+        print(f"  {w:>3}d: {metrics[f'tickets_{w}d'].sum():,.0f} tickets, "
+              f"{metrics[f'incidents_{w}d'].sum():,.0f} incidents, "
+              f"{np.isfinite(metrics[f'usage_{w}d']).sum():,} customers with usage")
+
+
+if __name__ == "__main__":
+    main()
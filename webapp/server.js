@@ -9,17 +9,28 @@ const PORT = 3000;
 app.use(express.static('public'));
 app.use(express.json());
 
+// Parsed CSVs keyed by file name; reused until the file's size or mtime changes
+const csvCache = new Map();
+
 // Load CSV data
 function loadCSV(filename) {
-    return new Promise((resolve, reject) => {
+    const filePath = path.join(__dirname, '..', 'data', 'raw', filename);
+    
+    if (!fs.existsSync(filePath)) {
+        console.error(`File not found: ${filePath}`);
+        csvCache.delete(filename);
+        return Promise.resolve([]); // Return empty array instead of error
+    }
+    
+    const stat = fs.statSync(filePath);
+    const version = `${stat.size}:${stat.mtimeMs}`;
+    const cached = csvCache.get(filename);
+    if (cached && cached.version === version) {
+        return cached.rows;
+    }
+    
+    const rows = new Promise((resolve, reject) => {
         const results = [];
-        const filePath = path.join(__dirname, '..', 'data', 'raw', filename);
-        
-        if (!fs.existsSync(filePath)) {
-            console.error(`File not found: ${filePath}`);
-            resolve([]); // Return empty array instead of error
-            return;
-        }
         
         fs.createReadStream(filePath)
             .pipe(csv())
@@ -27,9 +38,12 @@ function loadCSV(filename) {
             .on('end', () => resolve(results))
             .on('error', (err) => {
                 console.error(`Error reading ${filename}:`, err);
+                csvCache.delete(filename);
                 resolve([]); // Return empty array on error
             });
     });
+    csvCache.set(filename, { version, rows });
+    return rows;
 }
 
 // API Routes